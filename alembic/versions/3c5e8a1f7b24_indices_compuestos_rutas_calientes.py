@@ -0,0 +1,56 @@
+"""indices compuestos para consultas de egresos y auditoria
+
+Revision ID: 3c5e8a1f7b24
+Revises: 9ad1f4c2b7e8
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "3c5e8a1f7b24"
+down_revision: Union[str, Sequence[str], None] = "9ad1f4c2b7e8"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (nombre, tabla, columnas)
+# - expense(user_id, expense_date, id) cubre el filtro por usuario (no hace falta un indice
+#   solo sobre user_id), el rango de fechas y el orden/cursor de GET /expenses/.
+# - user.token_pass y user.token_verification ya estan indexados por sus UNIQUE constraints.
+INDEXES = (
+    ("ix_expense_user_id_expense_date_id", "expense", ["user_id", "expense_date", "id"]),
+    ("ix_expense_category_id", "expense", ["category_id"]),
+    ("ix_access_log_user_id_event_type_created_at", "access_log", ["user_id", "event_type", "created_at"]),
+    ("ix_admin_audit_log_action_created_at", "admin_audit_log", ["action", "created_at"]),
+    ("ix_admin_audit_log_created_at", "admin_audit_log", ["created_at"]),
+)
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY no puede correr dentro de una transaccion.
+    with op.get_context().autocommit_block():
+        for index_name, table_name, columns in INDEXES:
+            op.create_index(
+                index_name,
+                table_name,
+                columns,
+                unique=False,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for index_name, table_name, _columns in reversed(INDEXES):
+            op.drop_index(
+                index_name,
+                table_name=table_name,
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
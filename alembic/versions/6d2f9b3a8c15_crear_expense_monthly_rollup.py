@@ -0,0 +1,54 @@
+"""crear expense_monthly_rollup para estadisticas de egresos
+
+Revision ID: 6d2f9b3a8c15
+Revises: 3c5e8a1f7b24
+Create Date: 2026-10-17 00:10:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "6d2f9b3a8c15"
+down_revision: Union[str, Sequence[str], None] = "3c5e8a1f7b24"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "expense_monthly_rollup",
+        sa.Column("user_id", sa.UUID(as_uuid=True), nullable=False),
+        sa.Column("year", sa.Integer(), nullable=False),
+        sa.Column("month", sa.Integer(), nullable=False),
+        sa.Column("category_id", sa.UUID(as_uuid=True), nullable=False),
+        sa.Column("total", sa.Numeric(18, 2), nullable=False, server_default=sa.text("0")),
+        sa.Column("count", sa.Integer(), nullable=False, server_default=sa.text("0")),
+        sa.ForeignKeyConstraint(["user_id"], ["user.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["category_id"], ["category.id"]),
+        sa.PrimaryKeyConstraint("user_id", "year", "month", "category_id"),
+    )
+
+    # Carga inicial desde las filas crudas de expense.
+    op.execute(
+        """
+        INSERT INTO expense_monthly_rollup (user_id, year, month, category_id, total, count)
+        SELECT
+            user_id,
+            EXTRACT(YEAR FROM expense_date)::int,
+            EXTRACT(MONTH FROM expense_date)::int,
+            category_id,
+            SUM(amount),
+            COUNT(*)
+        FROM expense
+        GROUP BY user_id, EXTRACT(YEAR FROM expense_date)::int, EXTRACT(MONTH FROM expense_date)::int, category_id
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("expense_monthly_rollup")
@@ -0,0 +1,37 @@
+"""crear chat_conversation para historial del chatbot
+
+Revision ID: 7e3b5d9c1a42
+Revises: 6d2f9b3a8c15
+Create Date: 2026-10-17 00:20:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "7e3b5d9c1a42"
+down_revision: Union[str, Sequence[str], None] = "6d2f9b3a8c15"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "chat_conversation",
+        sa.Column("user_id", sa.UUID(as_uuid=True), nullable=False),
+        sa.Column("history", sa.JSON(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False, server_default=sa.func.current_timestamp()),
+        sa.ForeignKeyConstraint(["user_id"], ["user.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("user_id"),
+    )
+    # La purga por TTL recorre por updated_at.
+    op.create_index("ix_chat_conversation_updated_at", "chat_conversation", ["updated_at"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_chat_conversation_updated_at", table_name="chat_conversation")
+    op.drop_table("chat_conversation")
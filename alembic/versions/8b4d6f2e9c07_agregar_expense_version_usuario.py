@@ -0,0 +1,30 @@
+"""agregar expense_version a user
+
+Revision ID: 8b4d6f2e9c07
+Revises: 7e3b5d9c1a42
+Create Date: 2026-10-17 00:30:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "8b4d6f2e9c07"
+down_revision: Union[str, Sequence[str], None] = "7e3b5d9c1a42"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "user",
+        sa.Column("expense_version", sa.Integer(), nullable=False, server_default=sa.text("0")),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("user", "expense_version")
@@ -0,0 +1,106 @@
+"""particionar access_log y admin_audit_log por mes (created_at)
+
+Revision ID: 9c1e5a7d3f20
+Revises: 8b4d6f2e9c07
+Create Date: 2026-10-17 00:40:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "9c1e5a7d3f20"
+down_revision: Union[str, Sequence[str], None] = "8b4d6f2e9c07"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Meses futuros que se dejan creados; luego los mantiene `python -m app.log_partitions`.
+MONTHS_AHEAD = 3
+
+# tabla -> (foreign keys (nombre, columnas, ondelete), indices (nombre, columnas))
+# La PK pasa a (id, created_at): en una tabla particionada la PK debe incluir la llave.
+TABLES = {
+    "access_log": (
+        (("access_log_user_id_fkey", ["user_id"], "SET NULL"),),
+        (("ix_access_log_user_id_event_type_created_at", ["user_id", "event_type", "created_at"]),),
+    ),
+    "admin_audit_log": (
+        (
+            ("admin_audit_log_actor_user_id_fkey", ["actor_user_id"], None),
+            ("admin_audit_log_target_user_id_fkey", ["target_user_id"], "SET NULL"),
+        ),
+        (
+            ("ix_admin_audit_log_action_created_at", ["action", "created_at"]),
+            ("ix_admin_audit_log_created_at", ["created_at"]),
+        ),
+    ),
+}
+
+# Nuevo: access_log(user_id, created_at) cubre el historial por usuario de /admin/auditoria/usuario.
+NEW_INDEXES = {
+    "access_log": (("ix_access_log_user_id_created_at", ["user_id", "created_at"]),),
+}
+
+
+def _create_constraints(table_name: str, primary_key: list[str], indexes):
+    foreign_keys = TABLES[table_name][0]
+    op.create_primary_key(f"{table_name}_pkey", table_name, primary_key)
+    for fk_name, columns, ondelete in foreign_keys:
+        op.create_foreign_key(fk_name, table_name, "user", columns, ["id"], ondelete=ondelete)
+    for index_name, columns in indexes:
+        op.create_index(index_name, table_name, columns, unique=False)
+
+
+def upgrade() -> None:
+    for table_name in TABLES:
+        op.execute(
+            f"CREATE TABLE {table_name}_part (LIKE {table_name} INCLUDING DEFAULTS) "
+            "PARTITION BY RANGE (created_at)"
+        )
+        # Un mes por particion desde el registro mas antiguo hasta MONTHS_AHEAD meses adelante.
+        op.execute(
+            f"""
+            DO $$
+            DECLARE
+                month_start date;
+                last_month date;
+            BEGIN
+                SELECT date_trunc('month', COALESCE(MIN(created_at), CURRENT_TIMESTAMP))::date
+                  INTO month_start
+                  FROM {table_name};
+                last_month := (date_trunc('month', CURRENT_TIMESTAMP) + interval '{MONTHS_AHEAD} months')::date;
+                WHILE month_start <= last_month LOOP
+                    EXECUTE format(
+                        'CREATE TABLE %I PARTITION OF {table_name}_part FOR VALUES FROM (%L) TO (%L)',
+                        '{table_name}_p' || to_char(month_start, 'YYYYMM'),
+                        month_start,
+                        (month_start + interval '1 month')::date
+                    );
+                    month_start := (month_start + interval '1 month')::date;
+                END LOOP;
+            END $$;
+            """
+        )
+        # La particion DEFAULT evita que un insert falle si el mantenimiento no corrio a tiempo.
+        op.execute(f"CREATE TABLE {table_name}_pdefault PARTITION OF {table_name}_part DEFAULT")
+        op.execute(f"INSERT INTO {table_name}_part SELECT * FROM {table_name}")
+        op.execute(f"DROP TABLE {table_name}")
+        op.execute(f"ALTER TABLE {table_name}_part RENAME TO {table_name}")
+        _create_constraints(
+            table_name,
+            ["id", "created_at"],
+            TABLES[table_name][1] + NEW_INDEXES.get(table_name, ()),
+        )
+
+
+def downgrade() -> None:
+    for table_name in reversed(list(TABLES)):
+        op.execute(f"CREATE TABLE {table_name}_flat (LIKE {table_name} INCLUDING DEFAULTS)")
+        op.execute(f"INSERT INTO {table_name}_flat SELECT * FROM {table_name}")
+        op.execute(f"DROP TABLE {table_name}")
+        op.execute(f"ALTER TABLE {table_name}_flat RENAME TO {table_name}")
+        _create_constraints(table_name, ["id"], TABLES[table_name][1])
@@ -0,0 +1,30 @@
+"""agregar token_epoch a user
+
+Revision ID: ad3f7c1e5b96
+Revises: 9c1e5a7d3f20
+Create Date: 2026-10-17 00:50:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "ad3f7c1e5b96"
+down_revision: Union[str, Sequence[str], None] = "9c1e5a7d3f20"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "user",
+        sa.Column("token_epoch", sa.Integer(), nullable=False, server_default=sa.text("0")),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("user", "token_epoch")
@@ -0,0 +1,71 @@
+"""indice unico sobre lower(category.name)
+
+Revision ID: be5a9d2c4f18
+Revises: ad3f7c1e5b96
+Create Date: 2026-10-17 01:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "be5a9d2c4f18"
+down_revision: Union[str, Sequence[str], None] = "ad3f7c1e5b96"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Antes de crear el indice se fusionan las categorias que solo difieren en mayusculas:
+    # se conserva la mas antigua y se reapuntan expense y expense_monthly_rollup.
+    op.execute(
+        """
+        CREATE TEMP TABLE category_merge ON COMMIT DROP AS
+        SELECT category.id AS old_id, keep.keep_id
+        FROM category
+        JOIN (
+            SELECT lower(name) AS lower_name, (array_agg(id ORDER BY created_at, id))[1] AS keep_id
+            FROM category
+            GROUP BY lower(name)
+            HAVING COUNT(*) > 1
+        ) AS keep ON lower(category.name) = keep.lower_name
+        WHERE category.id <> keep.keep_id
+        """
+    )
+    op.execute(
+        """
+        UPDATE expense
+        SET category_id = category_merge.keep_id
+        FROM category_merge
+        WHERE expense.category_id = category_merge.old_id
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO expense_monthly_rollup (user_id, year, month, category_id, total, count)
+        SELECT rollup.user_id, rollup.year, rollup.month, category_merge.keep_id, SUM(rollup.total), SUM(rollup.count)
+        FROM expense_monthly_rollup AS rollup
+        JOIN category_merge ON rollup.category_id = category_merge.old_id
+        GROUP BY rollup.user_id, rollup.year, rollup.month, category_merge.keep_id
+        ON CONFLICT (user_id, year, month, category_id) DO UPDATE
+        SET total = expense_monthly_rollup.total + EXCLUDED.total,
+            count = expense_monthly_rollup.count + EXCLUDED.count
+        """
+    )
+    op.execute(
+        """
+        DELETE FROM expense_monthly_rollup
+        USING category_merge
+        WHERE expense_monthly_rollup.category_id = category_merge.old_id
+        """
+    )
+    op.execute("DELETE FROM category USING category_merge WHERE category.id = category_merge.old_id")
+    op.execute("CREATE UNIQUE INDEX uq_category_lower_name ON category (lower(name))")
+
+
+def downgrade() -> None:
+    # Las categorias fusionadas no se restauran.
+    op.drop_index("uq_category_lower_name", table_name="category")
@@ -0,0 +1,50 @@
+"""agregar user.last_login_at
+
+Revision ID: d05c9f3b7a64
+Revises: be5a9d2c4f18
+Create Date: 2026-10-17 02:10:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "d05c9f3b7a64"
+down_revision: Union[str, Sequence[str], None] = "be5a9d2c4f18"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("user", sa.Column("last_login_at", sa.DateTime(), nullable=True))
+    # Backfill con el ultimo LOGIN_SUCCESS que aun conserva access_log.
+    op.execute(
+        """
+        UPDATE "user"
+        SET last_login_at = latest.created_at
+        FROM (
+            SELECT user_id, MAX(created_at) AS created_at
+            FROM access_log
+            WHERE event_type = 'LOGIN_SUCCESS' AND user_id IS NOT NULL
+            GROUP BY user_id
+        ) AS latest
+        WHERE latest.user_id = "user".id
+        """
+    )
+    # Reemplaza la subconsulta sobre access_log para sort=last_access; con la misma direccion
+    # que el listado (DESC NULLS LAST, id DESC) el orden sale del indice.
+    op.create_index(
+        "ix_user_last_login_at_id",
+        "user",
+        [sa.text("last_login_at DESC NULLS LAST"), sa.text("id DESC")],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_user_last_login_at_id", table_name="user")
+    op.drop_column("user", "last_login_at")
@@ -0,0 +1,39 @@
+"""crear revoked_token (logout por jti)
+
+Revision ID: e27a1d8c4f90
+Revises: d05c9f3b7a64
+Create Date: 2026-10-17 02:20:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "e27a1d8c4f90"
+down_revision: Union[str, Sequence[str], None] = "d05c9f3b7a64"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "revoked_token",
+        sa.Column("jti", sa.String(length=64), nullable=False),
+        sa.Column("user_id", sa.UUID(as_uuid=True), nullable=False),
+        sa.Column("expires_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["user.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("jti"),
+    )
+    op.create_index("ix_revoked_token_user_id", "revoked_token", ["user_id"], unique=False)
+    # La purga de tokens vencidos recorre por expires_at.
+    op.create_index("ix_revoked_token_expires_at", "revoked_token", ["expires_at"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_revoked_token_expires_at", table_name="revoked_token")
+    op.drop_index("ix_revoked_token_user_id", table_name="revoked_token")
+    op.drop_table("revoked_token")
@@ -0,0 +1,203 @@
+import asyncio
+import logging
+import os
+import threading
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Any
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import String, event, insert
+from sqlalchemy.orm import Session
+
+from .database import session
+from .models import AccessLog
+
+# BLOQUE AUDITORIA: escritura diferida de access_log. Los eventos se encolan en memoria (cola
+# acotada) y una tarea de fondo los inserta en lotes (INSERT multi-fila) al llegar a
+# ACCESS_LOG_BATCH_SIZE o cada ACCESS_LOG_FLUSH_INTERVAL_MS. Los eventos durables, la cola llena
+# o el escritor detenido vuelven al camino sincrono: la fila se agrega a la transaccion del request.
+# Los eventos diferidos se encolan recien en el commit de la sesion del request (y se descartan en
+# rollback), asi la bitacora no registra operaciones que nunca se confirmaron.
+ACCESS_LOG_WRITE_BEHIND = (os.getenv("ACCESS_LOG_WRITE_BEHIND", "true").strip().lower() not in {"0", "false", "no", "off"})
+ACCESS_LOG_QUEUE_MAX_SIZE = int(os.getenv("ACCESS_LOG_QUEUE_MAX_SIZE", "10000"))
+ACCESS_LOG_BATCH_SIZE = int(os.getenv("ACCESS_LOG_BATCH_SIZE", "200"))
+ACCESS_LOG_FLUSH_INTERVAL_MS = int(os.getenv("ACCESS_LOG_FLUSH_INTERVAL_MS", "500"))
+
+logger = logging.getLogger(__name__)
+
+_PENDING_KEY = "access_log_pending"
+# Largo maximo de las columnas String: un X-Forwarded-For o User-Agent enorme no debe romper el insert.
+_STRING_LIMITS = {
+    column.key: column.type.length
+    for column in AccessLog.__table__.columns
+    if isinstance(column.type, String) and column.type.length
+}
+
+
+def _clip_values(values: dict[str, Any]) -> dict[str, Any]:
+    for key, limit in _STRING_LIMITS.items():
+        value = values.get(key)
+        if isinstance(value, str) and len(value) > limit:
+            values[key] = value[:limit]
+    return values
+
+
+class AccessLogWriter:
+    def __init__(self, *, enabled: bool, max_size: int, batch_size: int, flush_interval_ms: int):
+        self.enabled = enabled
+        self.max_size = max_size
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(flush_interval_ms, 10) / 1000
+        self._pending: deque[dict[str, Any]] = deque()
+        self._lock = threading.Lock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._stats = {"queued": 0, "written": 0, "batches": 0, "inline": 0, "failed": 0, "dropped": 0}
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self):
+        if self._task is not None or not self.enabled:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="access-log-writer")
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is None:
+            return
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        # Flush final: lo que quede en la cola se escribe antes de cerrar el proceso. Cada vuelta
+        # saca un lote de la cola (las filas que fallan se descartan), asi que siempre termina.
+        while self._pending:
+            await run_in_threadpool(self._flush_once)
+        self._loop = None
+        self._wakeup = None
+
+    def record(self, db: Session, *, durable: bool = False, **values):
+        values.setdefault("id", uuid.uuid4())
+        values.setdefault("created_at", datetime.utcnow())
+        _clip_values(values)
+        if not durable and self.running:
+            db.info.setdefault(_PENDING_KEY, []).append(values)
+            return
+        with self._lock:
+            self._stats["inline"] += 1
+        db.add(AccessLog(**values))
+
+    def _after_commit(self, db: Session):
+        pending = db.info.pop(_PENDING_KEY, None)
+        if not pending:
+            return
+        # Cola llena o escritor detenido entre el record y el commit: se escriben en el momento
+        # con una sesion propia (la del request ya no admite SQL dentro de after_commit).
+        overflow = [values for values in pending if not self._submit(values)]
+        if overflow:
+            with self._lock:
+                self._stats["inline"] += len(overflow)
+            self._write_batch(overflow)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "running": self.running,
+                "pending": len(self._pending),
+                "max_size": self.max_size,
+                **self._stats,
+            }
+
+    def _submit(self, values: dict[str, Any]) -> bool:
+        loop = self._loop
+        if self._task is None or loop is None or loop.is_closed():
+            return False
+        with self._lock:
+            if len(self._pending) >= self.max_size:
+                return False
+            self._pending.append(values)
+            self._stats["queued"] += 1
+            full_batch = len(self._pending) >= self.batch_size
+        if full_batch:
+            loop.call_soon_threadsafe(self._wakeup.set)
+        return True
+
+    def _take_batch(self) -> list[dict[str, Any]]:
+        with self._lock:
+            count = min(self.batch_size, len(self._pending))
+            return [self._pending.popleft() for _ in range(count)]
+
+    def _flush_once(self):
+        batch = self._take_batch()
+        if batch:
+            self._write_batch(batch)
+
+    def _write_batch(self, batch: list[dict[str, Any]]):
+        db = session()
+        try:
+            try:
+                db.execute(insert(AccessLog), batch)
+                db.commit()
+                written = len(batch)
+            except Exception:
+                db.rollback()
+                logger.exception("Fallo el lote de access_log (%s filas); se reintenta fila por fila", len(batch))
+                with self._lock:
+                    self._stats["failed"] += 1
+                # Una fila invalida no debe bloquear al resto: se aisla y se descarta.
+                written = 0
+                for values in batch:
+                    try:
+                        db.execute(insert(AccessLog), [values])
+                        db.commit()
+                        written += 1
+                    except Exception:
+                        db.rollback()
+                        logger.exception("Se descarta un evento de access_log invalido: %s", values.get("id"))
+                        with self._lock:
+                            self._stats["dropped"] += 1
+        finally:
+            db.close()
+
+        with self._lock:
+            self._stats["written"] += written
+            self._stats["batches"] += 1
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            while self._pending:
+                await run_in_threadpool(self._flush_once)
+                if len(self._pending) < self.batch_size:
+                    break
+
+
+access_log_writer = AccessLogWriter(
+    enabled=ACCESS_LOG_WRITE_BEHIND,
+    max_size=ACCESS_LOG_QUEUE_MAX_SIZE,
+    batch_size=ACCESS_LOG_BATCH_SIZE,
+    flush_interval_ms=ACCESS_LOG_FLUSH_INTERVAL_MS,
+)
+
+
+@event.listens_for(Session, "after_commit")
+def _queue_committed_access_logs(db: Session):
+    access_log_writer._after_commit(db)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _discard_uncommitted_access_logs(db: Session, transaction):
+    # Tras un commit la lista ya se vacio en after_commit; aqui solo quedan eventos de un rollback.
+    if transaction.parent is None:
+        db.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,362 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any
+from uuid import UUID, uuid4
+
+from fastapi import Depends, HTTPException, status
+from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import delete, inspect as sa_inspect, select, update
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from .database import get_db, session
+from .models import RevokedToken, User
+from .periodic_task import PeriodicTask
+from .security import create_access_token, decode_access_token
+
+# BLOQUE AUTH: resolucion compartida del usuario autenticado.
+# Antes cada router decodificaba el JWT y consultaba la tabla user en cada request.
+PRINCIPAL_CACHE_TTL_SECONDS = int(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+PRINCIPAL_CACHE_MAX_ENTRIES = int(os.getenv("PRINCIPAL_CACHE_MAX_ENTRIES", "4096"))
+TOKEN_EPOCH_CACHE_TTL_SECONDS = int(os.getenv("TOKEN_EPOCH_CACHE_TTL_SECONDS", "60"))
+TOKEN_EPOCH_CACHE_MAX_ENTRIES = int(os.getenv("TOKEN_EPOCH_CACHE_MAX_ENTRIES", "100000"))
+REVOKED_TOKEN_PURGE_INTERVAL_SECONDS = int(os.getenv("REVOKED_TOKEN_PURGE_INTERVAL_SECONDS", "3600"))
+TWO_FACTOR_REQUIRED = (os.getenv("TWO_FACTOR_REQUIRED", "true").strip().lower() not in {"0", "false", "no", "off"})
+
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
+
+_USER_COLUMN_KEYS = tuple(attr.key for attr in sa_inspect(User).column_attrs)
+
+
+class PrincipalCache:
+    # Cache LRU acotado con TTL. Guarda una foto de las columnas del usuario
+    # (no la instancia ORM) para poder reasociarla a la sesion de cada request.
+
+    def __init__(self, *, ttl_seconds: int, max_entries: int):
+        self.ttl_seconds = max(0, ttl_seconds)
+        self.max_entries = max(1, max_entries)
+        self._entries: OrderedDict[str, tuple[float, dict[str, Any]]] = OrderedDict()
+        self._subjects_by_user: dict[UUID, set[str]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, subject: str) -> dict[str, Any] | None:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(subject)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, snapshot = entry
+            if expires_at <= now:
+                self._drop(subject)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(subject)
+            self.hits += 1
+            return snapshot
+
+    def set(self, subject: str, snapshot: dict[str, Any]):
+        if self.ttl_seconds == 0:
+            return
+
+        expires_at = time.monotonic() + self.ttl_seconds
+        with self._lock:
+            if subject in self._entries:
+                self._drop(subject)
+            self._entries[subject] = (expires_at, snapshot)
+            self._subjects_by_user.setdefault(snapshot["id"], set()).add(subject)
+            while len(self._entries) > self.max_entries:
+                oldest_subject = next(iter(self._entries))
+                self._drop(oldest_subject)
+                self.evictions += 1
+
+    def invalidate_user(self, user_id: UUID | None):
+        if user_id is None:
+            return
+        with self._lock:
+            for subject in list(self._subjects_by_user.get(user_id, ())):
+                self._drop(subject)
+            self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._subjects_by_user.clear()
+            self.invalidations += 1
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def _drop(self, subject: str):
+        entry = self._entries.pop(subject, None)
+        if entry is None:
+            return
+        user_id = entry[1]["id"]
+        subjects = self._subjects_by_user.get(user_id)
+        if subjects is not None:
+            subjects.discard(subject)
+            if not subjects:
+                del self._subjects_by_user[user_id]
+
+
+class TokenEpochCache:
+    # user_id -> (vence, epoch, jti revocados por logout). Una entrada minima por usuario: validar
+    # un token es un lookup en este dict. El TTL acota cuanto tarda otro worker en ver una revocacion.
+
+    def __init__(self, *, ttl_seconds: int, max_entries: int):
+        self.ttl_seconds = max(0, ttl_seconds)
+        self.max_entries = max(1, max_entries)
+        self._entries: dict[UUID, tuple[float, int, frozenset[str]]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: UUID) -> tuple[int, frozenset[str]] | None:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] <= now:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def set(self, user_id: UUID, epoch: int, revoked: frozenset[str] = frozenset()):
+        if self.ttl_seconds == 0:
+            return
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self._entries[user_id] = (time.monotonic() + self.ttl_seconds, epoch, revoked)
+            while len(self._entries) > self.max_entries:
+                del self._entries[next(iter(self._entries))]
+
+    def invalidate(self, user_id: UUID | None):
+        if user_id is None:
+            return
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+principal_cache = PrincipalCache(
+    ttl_seconds=PRINCIPAL_CACHE_TTL_SECONDS,
+    max_entries=PRINCIPAL_CACHE_MAX_ENTRIES,
+)
+token_epochs = TokenEpochCache(
+    ttl_seconds=TOKEN_EPOCH_CACHE_TTL_SECONDS,
+    max_entries=TOKEN_EPOCH_CACHE_MAX_ENTRIES,
+)
+
+
+def invalidate_principal(user_id: UUID | None):
+    # Llamar despues del commit que cambia perfil, password, rol o estado del usuario.
+    principal_cache.invalidate_user(user_id)
+    token_epochs.invalidate(user_id)
+
+
+def bump_token_epoch(db: Session, user_id: UUID):
+    # Revoca todos los tokens emitidos al usuario. Va en la transaccion del llamador; despues
+    # del commit hay que llamar invalidate_principal.
+    db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(token_epoch=User.token_epoch + 1)
+    )
+
+
+def revoke_access_token(db: Session, token: str, user: User):
+    # Logout: revoca solo el token presentado (por su jti) hasta que vence. Va en la transaccion
+    # del llamador; despues del commit hay que llamar invalidate_principal. Los tokens sin jti
+    # (emitidos antes) solo se pueden revocar subiendo el epoch.
+    claims = _claims_from_token(token) or {}
+    jti = claims.get("jti")
+    if not jti or "exp" not in claims:
+        bump_token_epoch(db, user.id)
+        return
+    db.merge(
+        RevokedToken(
+            jti=str(jti),
+            user_id=user.id,
+            expires_at=datetime.utcfromtimestamp(claims["exp"]),
+        )
+    )
+
+
+def purge_revoked_tokens(db: Session) -> int:
+    result = db.execute(
+        delete(RevokedToken)
+        .where(RevokedToken.expires_at < datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount
+
+
+def _purge_revoked_tokens_with_new_session() -> int:
+    db = session()
+    try:
+        return purge_revoked_tokens(db)
+    finally:
+        db.close()
+
+
+# Un revoked_token deja de servir cuando su token vence; esta tarea los borra.
+revoked_token_purger = PeriodicTask(
+    name="revoked-token-purge",
+    interval_seconds=REVOKED_TOKEN_PURGE_INTERVAL_SECONDS,
+    job=_purge_revoked_tokens_with_new_session,
+)
+
+
+def create_user_access_token(user: User, **claims: Any) -> str:
+    role_name = user.role.value if user.role else "user"
+    return create_access_token(
+        {
+            "sub": user.email,
+            "uid": str(user.id),
+            "role": role_name,
+            "epoch": user.token_epoch or 0,
+            "jti": uuid4().hex,
+            **claims,
+        }
+    )
+
+
+def _snapshot_user(user: User) -> dict[str, Any]:
+    return {key: getattr(user, key) for key in _USER_COLUMN_KEYS}
+
+
+def _attach_snapshot(snapshot: dict[str, Any], db: Session) -> User:
+    # Reconstruye el usuario como instancia "detached" y la une a la sesion sin ir a la BD.
+    user = User(**snapshot)
+    make_transient_to_detached(user)
+    return db.merge(user, load=False)
+
+
+def _claims_from_token(token: str) -> dict[str, Any] | None:
+    try:
+        payload = decode_access_token(token)
+    except Exception:
+        return None
+
+    token_stage = str(payload.get("stage") or "").upper()
+    if TWO_FACTOR_REQUIRED:
+        if token_stage != "FULL":
+            return None
+    elif token_stage and token_stage != "FULL":
+        return None
+
+    return payload
+
+
+def _claim_user_id(claims: dict[str, Any]) -> UUID | None:
+    try:
+        return UUID(str(claims["uid"]))
+    except (KeyError, ValueError):
+        return None
+
+
+def _token_state(db: Session, user_id: UUID) -> tuple[int, frozenset[str]] | None:
+    state = token_epochs.get(user_id)
+    if state is None:
+        epoch = db.query(User.token_epoch).filter(User.id == user_id).scalar()
+        if epoch is None:
+            return None
+        revoked = frozenset(
+            db.scalars(
+                select(RevokedToken.jti).where(
+                    RevokedToken.user_id == user_id,
+                    RevokedToken.expires_at >= datetime.utcnow(),
+                )
+            )
+        )
+        state = (epoch, revoked)
+        token_epochs.set(user_id, epoch, revoked)
+    return state
+
+
+def _token_revoked(db: Session, user_id: UUID, claims: dict[str, Any]) -> bool:
+    state = _token_state(db, user_id)
+    return state is None or state[0] != claims.get("epoch", 0) or claims.get("jti") in state[1]
+
+
+def resolve_principal(token: str, db: Session) -> User | None:
+    claims = _claims_from_token(token)
+    if claims is None:
+        return None
+
+    subject = (claims.get("sub") or "").strip().lower()
+    user_id = _claim_user_id(claims)
+
+    if user_id is not None:
+        # La revocacion se decide con el mapa de epochs y jti, antes de cargar el usuario.
+        if _token_revoked(db, user_id, claims):
+            return None
+        cache_key = str(user_id)
+    elif subject:
+        # Tokens sin uid (emitidos antes del epoch): validos mientras el usuario siga en epoch 0.
+        cache_key = subject
+    else:
+        return None
+
+    snapshot = principal_cache.get(cache_key)
+    if snapshot is not None:
+        user = _attach_snapshot(snapshot, db)
+    else:
+        query = db.query(User)
+        if user_id is not None:
+            user = query.filter(User.id == user_id).first()
+        else:
+            user = query.filter(User.email == subject).first()
+        if not user:
+            return None
+        principal_cache.set(cache_key, _snapshot_user(user))
+
+    if user_id is None and _token_revoked(db, user.id, claims):
+        return None
+    return user
+
+
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="No autorizado",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+    user = resolve_principal(token, db)
+    if not user or not user.is_active or not user.email_verified:
+        raise credentials_exception
+    return user
@@ -0,0 +1,111 @@
+import os
+import threading
+from typing import Any, Iterable
+from uuid import UUID, uuid4
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from .models import Category
+
+# BLOQUE CATEGORIAS: indice en memoria nombre normalizado (lower) -> (id, nombre) de las
+# categorias globales. Se precarga al iniciar y solo crece: las categorias no se borran ni
+# renombran desde la API, asi que una entrada nunca queda obsoleta. Registrar un egreso en una
+# categoria conocida no consulta la tabla category.
+CATEGORY_INDEX_MAX_ENTRIES = int(os.getenv("CATEGORY_INDEX_MAX_ENTRIES", "50000"))
+
+
+def normalize_category_name(value: str) -> str:
+    return " ".join(value.strip().split())
+
+
+class CategoryIndex:
+    def __init__(self, *, max_entries: int):
+        self.max_entries = max(1, max_entries)
+        self._entries: dict[str, tuple[UUID, str]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def load_all(self, db: Session):
+        rows = db.execute(
+            select(Category.id, Category.name).order_by(Category.created_at).limit(self.max_entries)
+        ).all()
+        with self._lock:
+            self._entries = {row.name.lower(): (row.id, row.name) for row in rows}
+
+    def get(self, name: str) -> tuple[UUID, str] | None:
+        with self._lock:
+            entry = self._entries.get(name.lower())
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return entry
+
+    def remember(self, category_id: UUID, name: str):
+        # Llamar solo con filas ya confirmadas (despues del commit).
+        with self._lock:
+            if len(self._entries) < self.max_entries:
+                self._entries[name.lower()] = (category_id, name)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+category_index = CategoryIndex(max_entries=CATEGORY_INDEX_MAX_ENTRIES)
+
+
+def resolve_categories(db: Session, names: Iterable[str]) -> dict[str, tuple[UUID, str]]:
+    # lower(nombre) -> (id, nombre guardado). Las que no estan en el indice se crean con un solo
+    # INSERT multi-fila ... ON CONFLICT (lower(name)) DO NOTHING RETURNING; solo las que otra
+    # transaccion creo antes se leen con un SELECT. Las nuevas se registran en el indice despues
+    # del commit (category_index.remember).
+    resolved: dict[str, tuple[UUID, str]] = {}
+    missing: dict[str, str] = {}
+    for name in names:
+        key = name.lower()
+        if key in resolved or key in missing:
+            continue
+        cached = category_index.get(name)
+        if cached is None:
+            missing[key] = name
+        else:
+            resolved[key] = cached
+
+    if not missing:
+        return resolved
+
+    inserted = db.execute(
+        pg_insert(Category)
+        .values([{"id": uuid4(), "name": name} for name in missing.values()])
+        .on_conflict_do_nothing(index_elements=[func.lower(Category.name)])
+        .returning(Category.id, Category.name)
+    ).all()
+    for row in inserted:
+        resolved[row.name.lower()] = (row.id, row.name)
+
+    pending = [key for key in missing if key not in resolved]
+    if pending:
+        existing = db.execute(
+            select(Category.id, Category.name).where(func.lower(Category.name).in_(pending))
+        ).all()
+        for row in existing:
+            resolved[row.name.lower()] = (row.id, row.name)
+            category_index.remember(row.id, row.name)
+    return resolved
+
+
+def resolve_category(db: Session, name: str) -> tuple[UUID, str]:
+    return resolve_categories(db, [name])[name.lower()]
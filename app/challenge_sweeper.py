@@ -0,0 +1,159 @@
+import argparse
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Any
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, select, update
+from sqlalchemy.orm import Session
+
+from .database import maintenance_session, session
+from .models import AuthChallenge
+
+# BLOQUE 2FA: mantenimiento de auth_challenge fuera del camino del login. Una tarea de fondo
+# marca como EXPIRED los PENDING vencidos y borra los desafios cerrados antiguos, en lotes
+# acotados (un commit por lote) para no bloquear la tabla.
+CHALLENGE_SWEEP_INTERVAL_SECONDS = int(os.getenv("CHALLENGE_SWEEP_INTERVAL_SECONDS", "300"))
+CHALLENGE_SWEEP_BATCH_SIZE = int(os.getenv("CHALLENGE_SWEEP_BATCH_SIZE", "1000"))
+CHALLENGE_SWEEP_MAX_BATCHES = int(os.getenv("CHALLENGE_SWEEP_MAX_BATCHES", "50"))
+CHALLENGE_RETENTION_DAYS = int(os.getenv("CHALLENGE_RETENTION_DAYS", "7"))
+
+logger = logging.getLogger(__name__)
+
+
+def _expire_batch(db: Session, now: datetime, batch_size: int) -> int:
+    batch_ids = (
+        select(AuthChallenge.id)
+        .where(AuthChallenge.status == "PENDING", AuthChallenge.expires_at < now)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    result = db.execute(
+        update(AuthChallenge)
+        .where(AuthChallenge.id.in_(batch_ids))
+        .values(status="EXPIRED")
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount
+
+
+def _purge_batch(db: Session, cutoff: datetime, batch_size: int) -> int:
+    # Los PENDING se excluyen siempre; expires_at esta indexado y va 5 minutos detras de created_at.
+    batch_ids = (
+        select(AuthChallenge.id)
+        .where(AuthChallenge.status != "PENDING", AuthChallenge.expires_at < cutoff)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    result = db.execute(
+        delete(AuthChallenge)
+        .where(AuthChallenge.id.in_(batch_ids))
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount
+
+
+def sweep_auth_challenges(
+    db: Session,
+    *,
+    batch_size: int = CHALLENGE_SWEEP_BATCH_SIZE,
+    max_batches: int = CHALLENGE_SWEEP_MAX_BATCHES,
+    retention_days: int = CHALLENGE_RETENTION_DAYS,
+) -> dict[str, int]:
+    now = datetime.utcnow()
+    cutoff = now - timedelta(days=retention_days)
+    totals = {"expired": 0, "purged": 0}
+
+    for key, run_batch, reference in (
+        ("expired", _expire_batch, now),
+        ("purged", _purge_batch, cutoff),
+    ):
+        for _ in range(max_batches):
+            affected = run_batch(db, reference, batch_size)
+            totals[key] += affected
+            if affected < batch_size:
+                break
+    return totals
+
+
+def _sweep_with_new_session() -> dict[str, int]:
+    db = session()
+    try:
+        return sweep_auth_challenges(db)
+    finally:
+        db.close()
+
+
+class ChallengeSweeper:
+    def __init__(self, *, interval_seconds: int):
+        self.interval_seconds = interval_seconds
+        self._task: asyncio.Task | None = None
+        self._runs = 0
+        self._last_run_at: datetime | None = None
+        self._totals = {"expired": 0, "purged": 0}
+
+    def start(self):
+        if self._task is None and self.interval_seconds > 0:
+            self._task = asyncio.create_task(self._run(), name="auth-challenge-sweeper")
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is None:
+            return
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "running": self._task is not None,
+            "interval_seconds": self.interval_seconds,
+            "runs": self._runs,
+            "last_run_at": self._last_run_at.isoformat() if self._last_run_at else None,
+            **self._totals,
+        }
+
+    async def _run(self):
+        while True:
+            try:
+                totals = await run_in_threadpool(_sweep_with_new_session)
+                self._runs += 1
+                self._last_run_at = datetime.utcnow()
+                for key, value in totals.items():
+                    self._totals[key] += value
+            except Exception:
+                logger.exception("Fallo el barrido de auth_challenge")
+            await asyncio.sleep(self.interval_seconds)
+
+
+challenge_sweeper = ChallengeSweeper(interval_seconds=CHALLENGE_SWEEP_INTERVAL_SECONDS)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Expira y purga desafios 2FA antiguos")
+    parser.add_argument("--batch-size", type=int, default=CHALLENGE_SWEEP_BATCH_SIZE)
+    parser.add_argument("--max-batches", type=int, default=CHALLENGE_SWEEP_MAX_BATCHES)
+    parser.add_argument("--retention-days", type=int, default=CHALLENGE_RETENTION_DAYS)
+    args = parser.parse_args(argv)
+
+    db = maintenance_session()
+    try:
+        totals = sweep_auth_challenges(
+            db,
+            batch_size=args.batch_size,
+            max_batches=args.max_batches,
+            retention_days=args.retention_days,
+        )
+    finally:
+        db.close()
+    print(
+        f"Desafios expirados: {totals['expired']}, purgados: {totals['purged']}"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
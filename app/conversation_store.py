@@ -0,0 +1,201 @@
+import datetime
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+from uuid import UUID
+
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from .database import session
+from .models import ChatConversation
+from .periodic_task import PeriodicTask
+
+# BLOQUE CHATBOT: historial multi-turno por usuario. El backend "memory" vive en el proceso
+# (LRU + TTL); el backend "database" comparte el historial entre workers via chat_conversation.
+CHAT_STORE_BACKEND = (os.getenv("CHAT_STORE_BACKEND") or "memory").strip().lower()
+CHAT_SESSION_TTL_SECONDS = int(os.getenv("CHAT_SESSION_TTL_SECONDS", "900"))
+CHAT_MAX_CONVERSATIONS = int(os.getenv("CHAT_MAX_CONVERSATIONS", "10000"))
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "2000"))
+# Cada cuanto se purgan las conversaciones vencidas (0 = desactivado).
+CHAT_PURGE_INTERVAL_SECONDS = int(os.getenv("CHAT_PURGE_INTERVAL_SECONDS", "300"))
+
+# Aproximacion barata (sin tokenizer): ~4 caracteres por token.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text or "") // CHARS_PER_TOKEN)
+
+
+def truncate_history(history: list[dict], token_budget: int = CHAT_HISTORY_TOKEN_BUDGET) -> list[dict]:
+    # Conserva los turnos mas recientes que entren en el presupuesto, por pares usuario/modelo
+    # para que el historial nunca empiece con una respuesta del modelo.
+    kept: list[dict] = []
+    used = 0
+    for index in range(len(history) - 2, -1, -2):
+        pair = history[index:index + 2]
+        cost = sum(estimate_tokens(turn["text"]) for turn in pair)
+        if used + cost > token_budget:
+            break
+        kept[:0] = pair
+        used += cost
+    return kept
+
+
+class InMemoryConversationStore:
+    def __init__(self, *, max_entries: int, ttl_seconds: int):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # user_id -> (last_used, conversation). El orden de insercion es el orden de uso,
+        # asi que las entradas vencidas y la menos usada siempre estan al inicio.
+        self._entries: OrderedDict[str, tuple[float, dict[str, Any]]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._evictions = 0
+        self._expirations = 0
+
+    def get(self, user_id: UUID) -> Optional[dict[str, Any]]:
+        key = str(user_id)
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if now - entry[0] > self.ttl_seconds:
+                del self._entries[key]
+                self._expirations += 1
+                return None
+            # Se renueva last_used al moverla al final: asi el frente sigue siendo lo mas viejo.
+            self._entries[key] = (now, entry[1])
+            self._entries.move_to_end(key)
+            return {"history": list(entry[1]["history"])}
+
+    def save(self, user_id: UUID, *, history: list[dict]):
+        key = str(user_id)
+        now = time.monotonic()
+        with self._lock:
+            self._entries[key] = (now, {"history": list(history)})
+            self._entries.move_to_end(key)
+            self._expire(now)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def delete(self, user_id: UUID):
+        with self._lock:
+            self._entries.pop(str(user_id), None)
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            before = len(self._entries)
+            self._expire(time.monotonic())
+            return before - len(self._entries)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+            }
+
+    def _expire(self, now: float):
+        # O(1) amortizado: solo se miran las entradas del frente mientras esten vencidas.
+        while self._entries:
+            key, (last_used, _conversation) = next(iter(self._entries.items()))
+            if now - last_used <= self.ttl_seconds:
+                break
+            del self._entries[key]
+            self._expirations += 1
+
+
+class DatabaseConversationStore:
+    def __init__(self, *, ttl_seconds: int):
+        self.ttl_seconds = ttl_seconds
+
+    def get(self, user_id: UUID) -> Optional[dict[str, Any]]:
+        cutoff = datetime.datetime.now() - datetime.timedelta(seconds=self.ttl_seconds)
+        db = session()
+        try:
+            row = (
+                db.query(ChatConversation.history)
+                .filter(ChatConversation.user_id == user_id, ChatConversation.updated_at >= cutoff)
+                .first()
+            )
+        finally:
+            db.close()
+        if row is None:
+            return None
+        return {"history": list(row.history or [])}
+
+    def save(self, user_id: UUID, *, history: list[dict]):
+        stmt = pg_insert(ChatConversation).values(
+            user_id=user_id,
+            history=history,
+            updated_at=datetime.datetime.now(),
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ChatConversation.user_id],
+            set_={
+                "history": stmt.excluded.history,
+                "updated_at": stmt.excluded.updated_at,
+            },
+        )
+        db = session()
+        try:
+            db.execute(stmt)
+            db.commit()
+        finally:
+            db.close()
+
+    def delete(self, user_id: UUID):
+        db = session()
+        try:
+            db.query(ChatConversation).filter(ChatConversation.user_id == user_id).delete(
+                synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def purge_expired(self) -> int:
+        cutoff = datetime.datetime.now() - datetime.timedelta(seconds=self.ttl_seconds)
+        db = session()
+        try:
+            deleted = (
+                db.query(ChatConversation)
+                .filter(ChatConversation.updated_at < cutoff)
+                .delete(synchronize_session=False)
+            )
+            db.commit()
+            return deleted
+        finally:
+            db.close()
+
+    def stats(self) -> dict[str, Any]:
+        return {"backend": "database", "ttl_seconds": self.ttl_seconds}
+
+
+def build_conversation_store():
+    if CHAT_STORE_BACKEND == "database":
+        return DatabaseConversationStore(ttl_seconds=CHAT_SESSION_TTL_SECONDS)
+    return InMemoryConversationStore(
+        max_entries=CHAT_MAX_CONVERSATIONS,
+        ttl_seconds=CHAT_SESSION_TTL_SECONDS,
+    )
+
+
+conversation_store = build_conversation_store()
+
+# Sin esta purga, chat_conversation (o el dict en memoria) solo se limpia cuando el mismo
+# usuario vuelve a escribir. Corre en cada worker: con el backend memory cada proceso purga
+# su propio historial, que es el unico que puede ver.
+conversation_purger = PeriodicTask(
+    name="chat-conversation-purge",
+    interval_seconds=CHAT_PURGE_INTERVAL_SECONDS,
+    job=conversation_store.purge_expired,
+)
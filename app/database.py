@@ -1,37 +1,190 @@
 import os
+import threading
+import time
 from pathlib import Path
+from typing import Any
 
+from anyio import to_thread
 from dotenv import load_dotenv
 from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.pool import NullPool, QueuePool
 
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 load_dotenv(PROJECT_ROOT / ".env")
 
 
+def _normalize_database_url(db_url: str) -> str:
+    # Compatibilidad con URLs legacy postgres://
+    if db_url.startswith("postgres://"):
+        db_url = "postgresql://" + db_url[len("postgres://"):]
+    return db_url
+
+
 def _resolve_database_url() -> str:
     db_url = (os.getenv("DATABASE_URL") or "").strip()
     if not db_url:
         raise RuntimeError(
             "DATABASE_URL no definida. Configura DATABASE_URL en variables de entorno o en el archivo .env"
         )
-
-    # Compatibilidad con URLs legacy postgres://
-    if db_url.startswith("postgres://"):
-        db_url = "postgresql://" + db_url[len("postgres://"):]
-    return db_url
+    return _normalize_database_url(db_url)
 
 
 SQLALCHEMY_DATABASE_URL = _resolve_database_url()
+# Replica de solo lectura opcional (estadisticas, categorias, listados y auditoria admin).
+SQLALCHEMY_READ_DATABASE_URL = _normalize_database_url((os.getenv("DATABASE_READ_URL") or "").strip())
+
+# BLOQUE CONCURRENCIA: pool de conexiones. pre_ping descarta conexiones muertas (p. ej. tras
+# reiniciar el proxy de la BD) y recycle las renueva antes de que el proxy las corte.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT_SECONDS = int(os.getenv("DB_POOL_TIMEOUT_SECONDS", "10"))
+DB_POOL_RECYCLE_SECONDS = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800"))
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "15000"))
+
+# BLOQUE CONCURRENCIA: la sesion es sincrona. Los endpoints "def" y las dependencias
+# corren en el threadpool de AnyIO; este valor fija cuantos hilos atienden BD/CPU a la vez.
+# Por defecto iguala la capacidad del pool (DB_POOL_SIZE + DB_MAX_OVERFLOW): con mas hilos que
+# conexiones, los sobrantes solo esperan en el pool y, pasados DB_POOL_TIMEOUT_SECONDS, fallan.
+DB_THREADPOOL_SIZE = int(os.getenv("DB_THREADPOOL_SIZE", str(DB_POOL_SIZE + DB_MAX_OVERFLOW)))
+
+
+class PoolMetrics:
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._checkouts = 0
+        self._timeouts = 0
+        self._wait_sum_ms = 0.0
+        self._wait_max_ms = 0.0
+
+    def observe_wait(self, elapsed_ms: float, *, timed_out: bool):
+        with self._lock:
+            if timed_out:
+                self._timeouts += 1
+            else:
+                self._checkouts += 1
+            self._wait_sum_ms += elapsed_ms
+            self._wait_max_ms = max(self._wait_max_ms, elapsed_ms)
+
+    def snapshot(self, pool) -> dict[str, Any]:
+        with self._lock:
+            waits = self._checkouts + self._timeouts
+            data = {
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "wait_avg_ms": round(self._wait_sum_ms / waits, 3) if waits else 0.0,
+                "wait_max_ms": round(self._wait_max_ms, 3),
+            }
+        if isinstance(pool, QueuePool):
+            data.update(
+                {
+                    "size": pool.size(),
+                    "in_use": pool.checkedout(),
+                    "idle": pool.checkedin(),
+                    "overflow": pool.overflow(),
+                }
+            )
+        return data
+
+
+def _instrumented_pool_class(metrics: PoolMetrics):
+    # Mide cuanto espera cada checkout por una conexion libre (y los timeouts del pool).
+    class InstrumentedQueuePool(QueuePool):
+        def _do_get(self):
+            started = time.perf_counter()
+            try:
+                connection = super()._do_get()
+            except PoolTimeoutError:
+                metrics.observe_wait((time.perf_counter() - started) * 1000, timed_out=True)
+                raise
+            metrics.observe_wait((time.perf_counter() - started) * 1000, timed_out=False)
+            return connection
+
+    return InstrumentedQueuePool
+
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+def _build_engine(db_url: str, metrics: PoolMetrics):
+    if db_url.startswith("sqlite"):
+        # SQLite solo se usa en desarrollo local; conserva el pool por defecto.
+        return create_engine(db_url, pool_pre_ping=True)
+
+    connect_args = {}
+    if db_url.startswith("postgresql") and DB_STATEMENT_TIMEOUT_MS > 0:
+        connect_args["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+
+    return create_engine(
+        db_url,
+        poolclass=_instrumented_pool_class(metrics),
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT_SECONDS,
+        pool_recycle=DB_POOL_RECYCLE_SECONDS,
+        pool_pre_ping=True,
+        connect_args=connect_args,
+    )
+
+
+primary_pool_metrics = PoolMetrics("primary")
+engine = _build_engine(SQLALCHEMY_DATABASE_URL, primary_pool_metrics)
 session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+if SQLALCHEMY_READ_DATABASE_URL:
+    replica_pool_metrics: PoolMetrics | None = PoolMetrics("replica")
+    read_engine = _build_engine(SQLALCHEMY_READ_DATABASE_URL, replica_pool_metrics)
+else:
+    replica_pool_metrics = None
+    read_engine = engine
+read_session = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
 Base = declarative_base()
 
+_maintenance_engine = None
+
+
+def maintenance_session():
+    # Sesion para los CLIs de mantenimiento (rollup, particiones, migracion de passwords, barrido
+    # de desafios): engine propio sin DB_STATEMENT_TIMEOUT_MS, que es para requests, y sin pool
+    # porque el proceso es corto y usa una sola conexion.
+    global _maintenance_engine
+    if _maintenance_engine is None:
+        connect_args = {}
+        if SQLALCHEMY_DATABASE_URL.startswith("postgresql"):
+            connect_args["options"] = "-c statement_timeout=0"
+        _maintenance_engine = create_engine(
+            SQLALCHEMY_DATABASE_URL,
+            poolclass=NullPool,
+            connect_args=connect_args,
+        )
+    return sessionmaker(autocommit=False, autoflush=False, bind=_maintenance_engine)()
+
+def configure_threadpool():
+    # Debe llamarse dentro del event loop (lifespan): el limitador es por loop.
+    to_thread.current_default_thread_limiter().total_tokens = max(1, DB_THREADPOOL_SIZE)
+
+
 def get_db():
     db = session()
     try:
         yield db
     finally:
         db.close()
+
+
+def get_read_db():
+    # Sin DATABASE_READ_URL usa el mismo engine que get_db. Con replica puede haber retraso
+    # de replicacion: no usar en flujos que leen justo despues de escribir.
+    db = read_session()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def pool_stats() -> dict[str, Any]:
+    stats = {"primary": primary_pool_metrics.snapshot(engine.pool)}
+    if replica_pool_metrics is not None:
+        stats["replica"] = replica_pool_metrics.snapshot(read_engine.pool)
+    return stats
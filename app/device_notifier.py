@@ -0,0 +1,59 @@
+import asyncio
+import threading
+
+# BLOQUE 2FA: canal en proceso para despertar los long-poll de /device/notify/wait cuando un
+# desafio pasa a VERIFIED. verify_two_factor corre en el threadpool, por eso notify() entrega
+# el aviso al event loop con call_soon_threadsafe.
+
+
+class DeviceNotifier:
+    def __init__(self):
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._event: asyncio.Event | None = None
+        self._lock = threading.Lock()
+        self._waiting = 0
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        with self._lock:
+            self._loop = loop
+            self._event = None
+
+    def unbind(self):
+        with self._lock:
+            self._loop = None
+            self._event = None
+
+    def current(self) -> asyncio.Event:
+        # Se toma el evento ANTES de consultar la BD: un aviso que llegue entre la consulta
+        # y la espera deja el evento ya activado y no se pierde.
+        if self._event is None:
+            self._event = asyncio.Event()
+        return self._event
+
+    def notify(self):
+        with self._lock:
+            loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        loop.call_soon_threadsafe(self._wake)
+
+    async def wait(self, event: asyncio.Event, timeout: float) -> bool:
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(event.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self._waiting -= 1
+
+    def stats(self) -> dict:
+        return {"waiting": self._waiting, "bound": self._loop is not None}
+
+    def _wake(self):
+        event, self._event = self._event, None
+        if event is not None:
+            event.set()
+
+
+device_notifier = DeviceNotifier()
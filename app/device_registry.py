@@ -0,0 +1,130 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Optional
+from uuid import UUID
+
+from sqlalchemy.orm import Session
+
+from .models import TokenDevice
+from .totp_utils import decode_totp_secret
+
+# BLOQUE 2FA: las filas de token_device casi nunca cambian, pero se consultan en cada login,
+# verificacion 2FA y consulta del dispositivo. Se guardan en memoria con TTL (para ver cambios
+# hechos por otros workers) e invalidacion explicita cuando este proceso las modifica.
+# Los seriales no registrados se recuerdan en un LRU aparte y acotado: /device/notify, /wait y
+# /ping no piden autenticacion, asi que cualquiera puede consultar seriales al azar.
+DEVICE_REGISTRY_TTL_SECONDS = int(os.getenv("DEVICE_REGISTRY_TTL_SECONDS", "300"))
+DEVICE_REGISTRY_MISS_MAX_ENTRIES = int(os.getenv("DEVICE_REGISTRY_MISS_MAX_ENTRIES", "1024"))
+
+
+@dataclass(frozen=True)
+class DeviceRecord:
+    id: UUID
+    serial: str
+    status: str
+    digits: int
+    period: int
+    secret: str
+    # None si el secreto esta vacio o no es base32 valido.
+    key_bytes: Optional[bytes]
+
+    @property
+    def active(self) -> bool:
+        return (self.status or "").upper() == "ACTIVE"
+
+
+def _to_record(device: TokenDevice) -> DeviceRecord:
+    secret = (device.secret_enc or "").strip()
+    try:
+        key_bytes = decode_totp_secret(secret) if secret else None
+    except ValueError:
+        key_bytes = None
+    return DeviceRecord(
+        id=device.id,
+        serial=device.serial,
+        status=device.status or "",
+        digits=device.digits,
+        period=device.period,
+        secret=secret,
+        key_bytes=key_bytes,
+    )
+
+
+class DeviceRegistry:
+    def __init__(self, *, ttl_seconds: int, miss_max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.miss_max_entries = max(0, miss_max_entries)
+        # serial -> (expires_at, record) de los dispositivos registrados.
+        self._entries: dict[str, tuple[float, DeviceRecord]] = {}
+        # serial -> expires_at de los seriales que no existen (LRU).
+        self._unknown: OrderedDict[str, float] = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, serial: str, db: Session) -> Optional[DeviceRecord]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(serial)
+            if entry is not None:
+                if entry[0] > now:
+                    self._hits += 1
+                    return entry[1]
+                del self._entries[serial]
+            unknown_until = self._unknown.get(serial)
+            if unknown_until is not None:
+                if unknown_until > now:
+                    self._unknown.move_to_end(serial)
+                    self._hits += 1
+                    return None
+                del self._unknown[serial]
+            self._misses += 1
+
+        device = db.query(TokenDevice).filter(TokenDevice.serial == serial).first()
+        record = _to_record(device) if device else None
+        with self._lock:
+            if record is not None:
+                self._entries[serial] = (now + self.ttl_seconds, record)
+            elif self.miss_max_entries:
+                self._unknown[serial] = now + self.ttl_seconds
+                self._unknown.move_to_end(serial)
+                while len(self._unknown) > self.miss_max_entries:
+                    self._unknown.popitem(last=False)
+        return record
+
+    def load_all(self, db: Session) -> int:
+        records = [_to_record(device) for device in db.query(TokenDevice).all()]
+        expires_at = time.monotonic() + self.ttl_seconds
+        with self._lock:
+            self._entries = {record.serial: (expires_at, record) for record in records}
+            self._unknown.clear()
+        return len(records)
+
+    def invalidate(self, serial: Optional[str] = None):
+        with self._lock:
+            if serial is None:
+                self._entries.clear()
+                self._unknown.clear()
+            else:
+                self._entries.pop(serial, None)
+                self._unknown.pop(serial, None)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "unknown": len(self._unknown),
+                "unknown_max_entries": self.miss_max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self._hits,
+                "misses": self._misses,
+            }
+
+
+device_registry = DeviceRegistry(
+    ttl_seconds=DEVICE_REGISTRY_TTL_SECONDS,
+    miss_max_entries=DEVICE_REGISTRY_MISS_MAX_ENTRIES,
+)
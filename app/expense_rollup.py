@@ -0,0 +1,175 @@
+import argparse
+from datetime import datetime
+from decimal import Decimal
+from uuid import UUID
+
+from sqlalchemy import Integer, cast, extract, func, insert, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from .database import maintenance_session
+from .models import Expense, ExpenseMonthlyRollup, User
+
+# BLOQUE ESTADISTICAS: expense_monthly_rollup guarda total y cantidad por
+# (user_id, year, month, category_id). Los handlers de egresos aplican deltas en la
+# misma transaccion y las estadisticas leen el acumulado en vez de las filas crudas.
+
+
+def apply_expense_delta(
+    db: Session,
+    *,
+    user_id: UUID,
+    category_id: UUID,
+    expense_date: datetime,
+    amount: Decimal,
+    count: int,
+):
+    stmt = pg_insert(ExpenseMonthlyRollup).values(
+        user_id=user_id,
+        year=expense_date.year,
+        month=expense_date.month,
+        category_id=category_id,
+        total=amount,
+        count=count,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[
+            ExpenseMonthlyRollup.user_id,
+            ExpenseMonthlyRollup.year,
+            ExpenseMonthlyRollup.month,
+            ExpenseMonthlyRollup.category_id,
+        ],
+        set_={
+            "total": ExpenseMonthlyRollup.total + stmt.excluded.total,
+            "count": ExpenseMonthlyRollup.count + stmt.excluded.count,
+        },
+    )
+    db.execute(stmt)
+
+
+def record_expense_added(db: Session, expense: Expense):
+    apply_expense_delta(
+        db,
+        user_id=expense.user_id,
+        category_id=expense.category_id,
+        expense_date=expense.expense_date,
+        amount=Decimal(expense.amount),
+        count=1,
+    )
+
+
+def record_expense_removed(db: Session, expense: Expense):
+    apply_expense_delta(
+        db,
+        user_id=expense.user_id,
+        category_id=expense.category_id,
+        expense_date=expense.expense_date,
+        amount=-Decimal(expense.amount),
+        count=-1,
+    )
+
+
+def bump_expense_version(db: Session, user_id: UUID):
+    # Contador barato por usuario: los caches derivados de sus egresos comparan esta version
+    # en vez de recalcular estadisticas para saber si algo cambio.
+    db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(expense_version=User.expense_version + 1)
+    )
+
+
+def _raw_rollup_query(user_id: UUID | None = None):
+    year_expr = cast(extract("year", Expense.expense_date), Integer)
+    month_expr = cast(extract("month", Expense.expense_date), Integer)
+    query = (
+        select(
+            Expense.user_id,
+            year_expr.label("year"),
+            month_expr.label("month"),
+            Expense.category_id,
+            func.sum(Expense.amount).label("total"),
+            func.count(Expense.id).label("count"),
+        )
+        .group_by(Expense.user_id, year_expr, month_expr, Expense.category_id)
+    )
+    if user_id is not None:
+        query = query.where(Expense.user_id == user_id)
+    return query
+
+
+def rebuild_rollup(db: Session, user_id: UUID | None = None) -> int:
+    delete_query = db.query(ExpenseMonthlyRollup)
+    if user_id is not None:
+        delete_query = delete_query.filter(ExpenseMonthlyRollup.user_id == user_id)
+    delete_query.delete(synchronize_session=False)
+
+    result = db.execute(
+        insert(ExpenseMonthlyRollup).from_select(
+            ["user_id", "year", "month", "category_id", "total", "count"],
+            _raw_rollup_query(user_id),
+        )
+    )
+    db.commit()
+    return result.rowcount
+
+
+def verify_rollup(db: Session, user_id: UUID | None = None) -> list[dict]:
+    expected = {
+        (row.user_id, int(row.year), int(row.month), row.category_id): (Decimal(row.total), int(row.count))
+        for row in db.execute(_raw_rollup_query(user_id))
+    }
+
+    rollup_query = db.query(ExpenseMonthlyRollup).filter(ExpenseMonthlyRollup.count != 0)
+    if user_id is not None:
+        rollup_query = rollup_query.filter(ExpenseMonthlyRollup.user_id == user_id)
+    actual = {
+        (row.user_id, row.year, row.month, row.category_id): (Decimal(row.total), row.count)
+        for row in rollup_query
+    }
+
+    drift = []
+    for key in sorted(expected.keys() | actual.keys(), key=str):
+        if expected.get(key) == actual.get(key):
+            continue
+        expected_total, expected_count = expected.get(key, (Decimal("0"), 0))
+        actual_total, actual_count = actual.get(key, (Decimal("0"), 0))
+        drift.append(
+            {
+                "user_id": str(key[0]),
+                "year": key[1],
+                "month": key[2],
+                "category_id": str(key[3]),
+                "expected_total": str(expected_total),
+                "rollup_total": str(actual_total),
+                "expected_count": expected_count,
+                "rollup_count": actual_count,
+            }
+        )
+    return drift
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Recalcula o verifica expense_monthly_rollup")
+    parser.add_argument("command", choices=["rebuild", "verify"])
+    parser.add_argument("--user-id", type=UUID, default=None)
+    args = parser.parse_args(argv)
+
+    db = maintenance_session()
+    try:
+        if args.command == "rebuild":
+            rows = rebuild_rollup(db, args.user_id)
+            print(f"Rollup reconstruido: {rows} filas")
+            return 0
+
+        drift = verify_rollup(db, args.user_id)
+        for item in drift:
+            print(item)
+        print(f"Diferencias encontradas: {len(drift)}")
+        return 1 if drift else 0
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
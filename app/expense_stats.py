@@ -0,0 +1,62 @@
+from collections import defaultdict
+from decimal import Decimal
+from typing import Optional
+from uuid import UUID
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from .models import Category, ExpenseMonthlyRollup
+
+
+def compute_expense_stats(
+    db: Session,
+    user_id: UUID,
+    *,
+    year: Optional[int] = None,
+    month: Optional[int] = None,
+):
+    # Lee el acumulado mensual (O(meses x categorias)) y pliega los desgloses en Python.
+    query = (
+        db.query(
+            ExpenseMonthlyRollup.month.label("month"),
+            Category.name.label("category"),
+            func.sum(ExpenseMonthlyRollup.total).label("total"),
+        )
+        .join(Category, ExpenseMonthlyRollup.category_id == Category.id)
+        .filter(ExpenseMonthlyRollup.user_id == user_id, ExpenseMonthlyRollup.count > 0)
+    )
+
+    if year:
+        query = query.filter(ExpenseMonthlyRollup.year == year)
+    if month:
+        query = query.filter(ExpenseMonthlyRollup.month == month)
+
+    rows = query.group_by(ExpenseMonthlyRollup.month, Category.name).all()
+
+    total = Decimal("0")
+    by_month: dict[int, Decimal] = defaultdict(Decimal)
+    by_category: dict[str, Decimal] = defaultdict(Decimal)
+    monthly_by_category = []
+    for row in rows:
+        row_month = int(row.month)
+        total += row.total
+        by_month[row_month] += row.total
+        by_category[row.category] += row.total
+        monthly_by_category.append((row_month, row.category, row.total))
+
+    return {
+        "total": float(total),
+        "monthly": [
+            {"month": row_month, "total": float(amount)}
+            for row_month, amount in sorted(by_month.items())
+        ],
+        "by_category": [
+            {"category": category, "total": float(amount)}
+            for category, amount in sorted(by_category.items(), key=lambda item: item[1], reverse=True)
+        ],
+        "monthly_by_category": [
+            {"month": row_month, "category": category, "total": float(amount)}
+            for row_month, category, amount in sorted(monthly_by_category, key=lambda item: (item[0], item[1]))
+        ],
+    }
@@ -0,0 +1,163 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable
+
+from .security import get_password_hash, verify_password
+
+# BLOQUE SEGURIDAD: Argon2 (m=65536) es caro en CPU. Se ejecuta en un pool de procesos
+# acotado para que una rafaga de logins no deje sin CPU al resto de endpoints.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "16"))
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+logger = logging.getLogger(__name__)
+
+
+class HashingPoolSaturated(RuntimeError):
+    pass
+
+
+class HashingPoolUnavailable(HashingPoolSaturated):
+    # El pool se rompio otra vez tras reconstruirlo; se responde 503 igual que con saturacion.
+    pass
+
+
+class LatencyHistogram:
+    def __init__(self, buckets_ms: tuple[int, ...] = LATENCY_BUCKETS_MS):
+        self.buckets_ms = buckets_ms
+        self._counts = [0] * (len(buckets_ms) + 1)
+        self._total = 0
+        self._sum_ms = 0.0
+        self._max_ms = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, elapsed_ms: float):
+        index = len(self.buckets_ms)
+        for position, upper in enumerate(self.buckets_ms):
+            if elapsed_ms <= upper:
+                index = position
+                break
+
+        with self._lock:
+            self._counts[index] += 1
+            self._total += 1
+            self._sum_ms += elapsed_ms
+            self._max_ms = max(self._max_ms, elapsed_ms)
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            buckets = {f"le_{upper}ms": count for upper, count in zip(self.buckets_ms, self._counts)}
+            buckets["le_inf"] = self._counts[-1]
+            return {
+                "count": self._total,
+                "avg_ms": round(self._sum_ms / self._total, 2) if self._total else 0.0,
+                "max_ms": round(self._max_ms, 2),
+                "buckets": buckets,
+            }
+
+
+class PasswordHashingPool:
+    def __init__(self, *, workers: int, max_pending: int):
+        self.workers = max(0, workers)
+        self.max_pending = max(0, max_pending)
+        # Capacidad total = trabajos ejecutandose + trabajos en cola.
+        self._slots = threading.BoundedSemaphore(max(1, self.workers) + self.max_pending)
+        self._executor: ProcessPoolExecutor | None = None
+        self._executor_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._in_flight = 0
+        self._rejected = 0
+        self._restarts = 0
+        self._histograms = {
+            "hash": LatencyHistogram(),
+            "verify": LatencyHistogram(),
+        }
+
+    def start(self) -> ProcessPoolExecutor | None:
+        if self.workers == 0:
+            return None
+        with self._executor_lock:
+            if self._executor is None:
+                # spawn evita heredar hilos/conexiones del proceso web al hacer fork.
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    def shutdown(self):
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _replace_broken(self, broken: ProcessPoolExecutor) -> ProcessPoolExecutor | None:
+        # Un worker murio (p. ej. OOM con la memoria de argon2) y el pool queda inutilizable para
+        # siempre. Solo el primer hilo que lo detecta lo reemplaza; los demas usan el nuevo.
+        with self._executor_lock:
+            if self._executor is broken:
+                self._executor = None
+                with self._stats_lock:
+                    self._restarts += 1
+                logger.warning("Pool de hashing roto; se crea uno nuevo")
+        broken.shutdown(wait=False, cancel_futures=True)
+        return self.start()
+
+    def hash(self, password: str) -> str:
+        return self._run("hash", get_password_hash, password)
+
+    def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return self._run("verify", verify_password, plain_password, hashed_password)
+
+    def stats(self) -> dict[str, Any]:
+        with self._stats_lock:
+            in_flight = self._in_flight
+            rejected = self._rejected
+            restarts = self._restarts
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "in_flight": in_flight,
+            "rejected": rejected,
+            "restarts": restarts,
+            "latency": {name: histogram.snapshot() for name, histogram in self._histograms.items()},
+        }
+
+    def _run(self, operation: str, func: Callable[..., Any], *args: Any) -> Any:
+        if not self._slots.acquire(blocking=False):
+            with self._stats_lock:
+                self._rejected += 1
+            raise HashingPoolSaturated(f"Pool de hashing saturado ({operation})")
+
+        with self._stats_lock:
+            self._in_flight += 1
+        started = time.perf_counter()
+        try:
+            executor = self.start()
+            if executor is None:
+                return func(*args)
+            try:
+                return executor.submit(func, *args).result()
+            except BrokenProcessPool:
+                executor = self._replace_broken(executor)
+            try:
+                return executor.submit(func, *args).result()
+            except BrokenProcessPool as exc:
+                self._replace_broken(executor)
+                raise HashingPoolUnavailable(f"Pool de hashing no disponible ({operation})") from exc
+        finally:
+            self._histograms[operation].observe((time.perf_counter() - started) * 1000)
+            with self._stats_lock:
+                self._in_flight -= 1
+            self._slots.release()
+
+
+password_hasher = PasswordHashingPool(
+    workers=PASSWORD_HASH_WORKERS,
+    max_pending=PASSWORD_HASH_MAX_PENDING,
+)
@@ -0,0 +1,25 @@
+from decimal import Decimal
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+
+# BLOQUE RESPUESTAS JSON: orjson serializa UUID, datetime/date y Enum de forma nativa (en C),
+# asi los serializers devuelven los valores tal cual vienen de la BD. Decimal se emite como
+# numero para mantener el contrato previo (montos como float en el JSON).
+_ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def _default(value: Any):
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError
+
+
+def dumps_json(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=_ORJSON_OPTIONS)
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps_json(content)
@@ -0,0 +1,207 @@
+import argparse
+import os
+import re
+from datetime import date
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from .database import maintenance_session
+
+# BLOQUE AUDITORIA: mantenimiento de las particiones mensuales de access_log y admin_audit_log
+# (ver migracion 9c1e5a7d3f20). Crea los meses futuros, saca de DEFAULT las filas de meses sin
+# particion y separa (DETACH) o borra las particiones que ya superaron la retencion. Pensado para un cron diario:
+#   python -m app.log_partitions
+LOG_PARTITION_MONTHS_AHEAD = int(os.getenv("LOG_PARTITION_MONTHS_AHEAD", "3"))
+ACCESS_LOG_RETENTION_MONTHS = int(os.getenv("ACCESS_LOG_RETENTION_MONTHS", "12"))
+ADMIN_AUDIT_LOG_RETENTION_MONTHS = int(os.getenv("ADMIN_AUDIT_LOG_RETENTION_MONTHS", "24"))
+LOG_PARTITION_RETENTION_ACTION = (os.getenv("LOG_PARTITION_RETENTION_ACTION") or "detach").strip().lower()
+
+PARTITIONED_LOG_TABLES = ("access_log", "admin_audit_log")
+_PARTITION_SUFFIX = re.compile(r"_p(\d{4})(\d{2})$")
+
+
+def _add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table_name: str, month: date) -> str:
+    return f"{table_name}_p{month:%Y%m}"
+
+
+def list_partitions(db: Session, table_name: str) -> dict[date, str]:
+    rows = db.execute(
+        text(
+            """
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = :table_name
+            """
+        ),
+        {"table_name": table_name},
+    ).scalars()
+
+    partitions = {}
+    for name in rows:
+        match = _PARTITION_SUFFIX.search(name)
+        if match:
+            partitions[date(int(match.group(1)), int(match.group(2)), 1)] = name
+    return partitions
+
+
+def default_partition_months(db: Session, table_name: str) -> set[date]:
+    # Meses con filas en la particion DEFAULT (p. ej. si el cron no corrio a tiempo).
+    rows = db.execute(
+        text(
+            "SELECT DISTINCT date_trunc('month', created_at)::date "
+            f'FROM "{table_name}_pdefault"'
+        )
+    ).scalars()
+    return set(rows)
+
+
+def create_partition(db: Session, table_name: str, month: date) -> int:
+    # Las filas que hayan caido en la particion DEFAULT para ese mes se mueven antes del
+    # ATTACH (Postgres rechaza el ATTACH si DEFAULT tiene filas del rango). El lock sobre
+    # DEFAULT frena los inserts concurrentes a ella hasta el commit: sin el, una fila del mes
+    # insertada entre el DELETE y el ATTACH hace fallar el ATTACH.
+    name = partition_name(table_name, month)
+    start, end = month, _add_months(month, 1)
+    db.execute(text(f'LOCK TABLE "{table_name}_pdefault" IN SHARE ROW EXCLUSIVE MODE'))
+    db.execute(text(f'CREATE TABLE "{name}" (LIKE "{table_name}" INCLUDING DEFAULTS)'))
+    moved = db.execute(
+        text(
+            f"""
+            WITH moved AS (
+                DELETE FROM "{table_name}_pdefault"
+                WHERE created_at >= :start AND created_at < :end
+                RETURNING *
+            )
+            INSERT INTO "{name}" SELECT * FROM moved
+            """
+        ),
+        {"start": start, "end": end},
+    ).rowcount
+    db.execute(
+        text(
+            f'ALTER TABLE "{table_name}" ATTACH PARTITION "{name}" '
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        )
+    )
+    return moved
+
+
+def maintain_table(
+    db: Session,
+    table_name: str,
+    *,
+    today: date,
+    months_ahead: int,
+    retention_months: int,
+    action: str,
+    dry_run: bool = False,
+) -> dict[str, list[str]]:
+    current_month = today.replace(day=1)
+    partitions = list_partitions(db, table_name)
+    report = {"created": [], "removed": []}
+
+    months = {_add_months(current_month, offset) for offset in range(months_ahead + 1)}
+    # Los meses que solo existen en DEFAULT reciben su particion: asi sus filas salen de DEFAULT
+    # y, si ya superaron la retencion, se retiran abajo junto con las demas.
+    months |= default_partition_months(db, table_name)
+    for month in sorted(months - partitions.keys()):
+        if not dry_run:
+            create_partition(db, table_name, month)
+        partitions[month] = partition_name(table_name, month)
+        report["created"].append(partitions[month])
+
+    # retention_months <= 0 conserva todo el historial.
+    if retention_months > 0:
+        cutoff = _add_months(current_month, -retention_months)
+        for month, name in sorted(partitions.items()):
+            if _add_months(month, 1) > cutoff:
+                break
+            if not dry_run:
+                db.execute(text(f'ALTER TABLE "{table_name}" DETACH PARTITION "{name}"'))
+                if action == "drop":
+                    db.execute(text(f'DROP TABLE "{name}"'))
+            report["removed"].append(name)
+
+    if not dry_run:
+        db.commit()
+    return report
+
+
+def maintain_log_partitions(
+    db: Session,
+    *,
+    today: date | None = None,
+    months_ahead: int = LOG_PARTITION_MONTHS_AHEAD,
+    retention_months: dict[str, int] | None = None,
+    action: str = LOG_PARTITION_RETENTION_ACTION,
+    dry_run: bool = False,
+) -> dict[str, dict[str, list[str]]]:
+    if action not in {"detach", "drop"}:
+        raise ValueError("La accion de retencion debe ser detach o drop")
+
+    retention = {
+        "access_log": ACCESS_LOG_RETENTION_MONTHS,
+        "admin_audit_log": ADMIN_AUDIT_LOG_RETENTION_MONTHS,
+        **(retention_months or {}),
+    }
+    today = today or date.today()
+    return {
+        table_name: maintain_table(
+            db,
+            table_name,
+            today=today,
+            months_ahead=months_ahead,
+            retention_months=retention[table_name],
+            action=action,
+            dry_run=dry_run,
+        )
+        for table_name in PARTITIONED_LOG_TABLES
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Crea y retira particiones mensuales de los logs")
+    parser.add_argument("--months-ahead", type=int, default=LOG_PARTITION_MONTHS_AHEAD)
+    parser.add_argument("--access-log-retention-months", type=int, default=ACCESS_LOG_RETENTION_MONTHS)
+    parser.add_argument("--admin-audit-retention-months", type=int, default=ADMIN_AUDIT_LOG_RETENTION_MONTHS)
+    parser.add_argument("--action", choices=("detach", "drop"), default=LOG_PARTITION_RETENTION_ACTION)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args(argv)
+
+    db = maintenance_session()
+    try:
+        if db.get_bind().dialect.name != "postgresql":
+            print("El particionado de logs solo aplica a PostgreSQL")
+            return 1
+        report = maintain_log_partitions(
+            db,
+            months_ahead=args.months_ahead,
+            retention_months={
+                "access_log": args.access_log_retention_months,
+                "admin_audit_log": args.admin_audit_retention_months,
+            },
+            action=args.action,
+            dry_run=args.dry_run,
+        )
+    finally:
+        db.close()
+
+    prefix = "[dry-run] " if args.dry_run else ""
+    for table_name, changes in report.items():
+        print(
+            f"{prefix}{table_name}: creadas {changes['created'] or '-'}, "
+            f"retiradas ({args.action}) {changes['removed'] or '-'}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
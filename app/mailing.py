@@ -1,8 +1,13 @@
+import asyncio
 import logging
 import os
+import time
+from dataclasses import dataclass
+from email.message import EmailMessage
 
+import aiosmtplib
 import httpx
-from fastapi_mail import ConnectionConfig, FastMail, MessageSchema
+from fastapi_mail import ConnectionConfig
 
 logger = logging.getLogger(__name__)
 
@@ -96,68 +101,340 @@ def _using_resend() -> bool:
     return bool((os.getenv("RESEND_API_KEY") or "").strip())
 
 
-async def _send_email_with_resend(*, subject: str, recipients: list[str], html_body: str):
-    resend_api_key = (os.getenv("RESEND_API_KEY") or "").strip()
-    if not resend_api_key:
-        raise ValueError("Falta RESEND_API_KEY para envio por API")
-
-    mail_from = _resolve_resend_mail_from()
-    payload = {
-        "from": _build_mail_from_header(mail_from),
-        "to": recipients,
-        "subject": subject,
-        "html": html_body,
-    }
-
-    timeout_seconds = _parse_int_env("MAIL_TIMEOUT", 12, min_value=1, max_value=300)
-    request_timeout = httpx.Timeout(timeout_seconds)
-    async with httpx.AsyncClient(timeout=request_timeout) as client:
-        response = await client.post(
-            "https://api.resend.com/emails",
-            headers={
-                "Authorization": f"Bearer {resend_api_key}",
-                "Content-Type": "application/json",
-            },
-            json=payload,
-        )
+# BLOQUE CORREO: un solo transporte por proceso (cliente HTTP con keep-alive para Resend
+# y conexion SMTP persistente) y una cola de entrega en memoria con concurrencia acotada,
+# reintentos con backoff y envio en lote cuando el proveedor lo permite.
+RESEND_API_URL = (os.getenv("RESEND_API_URL") or "https://api.resend.com").strip().rstrip("/")
+RESEND_BATCH_MAX_SIZE = 100
+MAIL_HTTP_MAX_CONNECTIONS = _parse_int_env("MAIL_HTTP_MAX_CONNECTIONS", 10, min_value=1, max_value=200)
+MAIL_QUEUE_MAX_SIZE = _parse_int_env("MAIL_QUEUE_MAX_SIZE", 1000, min_value=1, max_value=100000)
+MAIL_QUEUE_WORKERS = _parse_int_env("MAIL_QUEUE_WORKERS", 4, min_value=1, max_value=64)
+MAIL_BATCH_SIZE = _parse_int_env("MAIL_BATCH_SIZE", 50, min_value=1, max_value=RESEND_BATCH_MAX_SIZE)
+MAIL_BATCH_LINGER_MS = _parse_int_env("MAIL_BATCH_LINGER_MS", 200, min_value=0, max_value=10000)
+MAIL_MAX_RETRIES = _parse_int_env("MAIL_MAX_RETRIES", 3, min_value=0, max_value=10)
+MAIL_RETRY_BASE_MS = _parse_int_env("MAIL_RETRY_BASE_MS", 500, min_value=10, max_value=60000)
+MAIL_QUEUE_DRAIN_SECONDS = _parse_int_env("MAIL_QUEUE_DRAIN_SECONDS", 10, min_value=0, max_value=300)
 
-    if response.status_code >= 400:
-        detail = (response.text or "").strip()
-        if len(detail) > 300:
-            detail = detail[:300] + "..."
-        raise RuntimeError(
-            f"Resend respondio {response.status_code}" + (f": {detail}" if detail else "")
-        )
 
+@dataclass(frozen=True)
+class OutgoingEmail:
+    subject: str
+    recipients: tuple[str, ...]
+    html_body: str
+
+
+class MailDeliveryError(RuntimeError):
+    def __init__(self, message: str, *, retryable: bool):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+def _is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, MailDeliveryError):
+        return exc.retryable
+    if isinstance(exc, ValueError):
+        return False
+    if isinstance(exc, (httpx.TransportError, asyncio.TimeoutError)):
+        return True
+    if isinstance(exc, aiosmtplib.SMTPRecipientsRefused):
+        return False
+    if isinstance(exc, aiosmtplib.SMTPResponseException):
+        # 4xx es temporal en SMTP; 5xx es definitivo.
+        return 400 <= exc.code < 500
+    return isinstance(exc, (aiosmtplib.SMTPException, OSError))
 
-async def _send_email_with_smtp(*, subject: str, recipients: list[str], html_body: str):
-    conf = build_mail_config()
-    if not conf:
-        raise ValueError(
-            "Configuracion de correo incompleta: define SENDER_EMAIL y SENDER_PASSWORD"
-        )
 
-    message = MessageSchema(
-        subject=subject,
-        recipients=recipients,
-        body=html_body,
-        subtype="html",
+def _raise_for_resend_response(response: httpx.Response):
+    if response.status_code < 400:
+        return
+
+    detail = (response.text or "").strip()
+    if len(detail) > 300:
+        detail = detail[:300] + "..."
+    retryable = response.status_code == 429 or response.status_code >= 500
+    raise MailDeliveryError(
+        f"Resend respondio {response.status_code}" + (f": {detail}" if detail else ""),
+        retryable=retryable,
     )
-    fm = FastMail(conf)
-    await fm.send_message(message)
 
 
-async def send_html_email(*, subject: str, recipients: list[str], html_body: str):
-    if _using_resend():
-        await _send_email_with_resend(
-            subject=subject,
-            recipients=recipients,
-            html_body=html_body,
+class MailTransport:
+    def __init__(self):
+        self._http_client: httpx.AsyncClient | None = None
+        self._smtp: aiosmtplib.SMTP | None = None
+        self._smtp_lock: asyncio.Lock | None = None
+
+    @property
+    def supports_batch(self) -> bool:
+        return _using_resend()
+
+    async def send(self, message: OutgoingEmail):
+        if _using_resend():
+            await self._send_resend([message])
+            return
+        await self._send_smtp(message)
+
+    async def send_batch(self, messages: list[OutgoingEmail]):
+        # Resend acepta hasta 100 correos por llamada y el lote es todo o nada.
+        if not _using_resend():
+            raise ValueError("El envio en lote solo esta disponible con Resend")
+        for start in range(0, len(messages), RESEND_BATCH_MAX_SIZE):
+            await self._send_resend(messages[start:start + RESEND_BATCH_MAX_SIZE])
+
+    async def aclose(self):
+        http_client, self._http_client = self._http_client, None
+        if http_client is not None:
+            await http_client.aclose()
+        await self._close_smtp()
+        self._smtp_lock = None
+
+    def _get_http_client(self) -> httpx.AsyncClient:
+        if self._http_client is None or self._http_client.is_closed:
+            timeout_seconds = _parse_int_env("MAIL_TIMEOUT", 12, min_value=1, max_value=300)
+            self._http_client = httpx.AsyncClient(
+                base_url=RESEND_API_URL,
+                timeout=httpx.Timeout(timeout_seconds),
+                limits=httpx.Limits(
+                    max_connections=MAIL_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=MAIL_HTTP_MAX_CONNECTIONS,
+                    keepalive_expiry=60,
+                ),
+            )
+        return self._http_client
+
+    async def _send_resend(self, messages: list[OutgoingEmail]):
+        resend_api_key = (os.getenv("RESEND_API_KEY") or "").strip()
+        if not resend_api_key:
+            raise ValueError("Falta RESEND_API_KEY para envio por API")
+
+        mail_from = _build_mail_from_header(_resolve_resend_mail_from())
+        payload = [
+            {
+                "from": mail_from,
+                "to": list(message.recipients),
+                "subject": message.subject,
+                "html": message.html_body,
+            }
+            for message in messages
+        ]
+        headers = {"Authorization": f"Bearer {resend_api_key}"}
+
+        client = self._get_http_client()
+        if len(payload) == 1:
+            response = await client.post("/emails", headers=headers, json=payload[0])
+        else:
+            response = await client.post("/emails/batch", headers=headers, json=payload)
+        _raise_for_resend_response(response)
+
+    async def _send_smtp(self, message: OutgoingEmail):
+        conf = build_mail_config()
+        if not conf:
+            raise ValueError(
+                "Configuracion de correo incompleta: define SENDER_EMAIL y SENDER_PASSWORD"
+            )
+
+        email_message = EmailMessage()
+        email_message["From"] = (
+            f"{conf.MAIL_FROM_NAME} <{conf.MAIL_FROM}>" if conf.MAIL_FROM_NAME else conf.MAIL_FROM
         )
-        return
+        email_message["To"] = ", ".join(message.recipients)
+        email_message["Subject"] = message.subject
+        email_message.set_content(message.html_body, subtype="html")
+
+        if self._smtp_lock is None:
+            self._smtp_lock = asyncio.Lock()
+        # Una sola conexion SMTP compartida: los comandos SMTP son secuenciales.
+        async with self._smtp_lock:
+            try:
+                smtp = await self._get_smtp(conf)
+                await smtp.send_message(email_message)
+            except (aiosmtplib.SMTPServerDisconnected, aiosmtplib.SMTPConnectError):
+                # El servidor cierra conexiones ociosas; se reconecta una vez antes de fallar.
+                await self._close_smtp()
+                smtp = await self._get_smtp(conf)
+                await smtp.send_message(email_message)
+
+    async def _get_smtp(self, conf: ConnectionConfig) -> aiosmtplib.SMTP:
+        if self._smtp is not None and self._smtp.is_connected:
+            return self._smtp
+
+        smtp = aiosmtplib.SMTP(
+            hostname=conf.MAIL_SERVER,
+            port=conf.MAIL_PORT,
+            username=conf.MAIL_USERNAME,
+            password=conf.MAIL_PASSWORD.get_secret_value(),
+            use_tls=conf.MAIL_SSL_TLS,
+            start_tls=conf.MAIL_STARTTLS,
+            validate_certs=conf.VALIDATE_CERTS,
+            timeout=conf.TIMEOUT,
+        )
+        await smtp.connect()
+        self._smtp = smtp
+        return smtp
+
+    async def _close_smtp(self):
+        smtp, self._smtp = self._smtp, None
+        if smtp is None or not smtp.is_connected:
+            return
+        try:
+            await smtp.quit()
+        except aiosmtplib.SMTPException:
+            smtp.close()
+
+
+class MailDeliveryQueue:
+    def __init__(
+        self,
+        transport: MailTransport,
+        *,
+        workers: int,
+        max_size: int,
+        batch_size: int,
+        linger_ms: int,
+        max_retries: int,
+        retry_base_ms: int,
+    ):
+        self.transport = transport
+        self.workers = workers
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.linger_ms = linger_ms
+        self.max_retries = max_retries
+        self.retry_base_ms = retry_base_ms
+        self._queue: asyncio.Queue[OutgoingEmail] | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._counters = {
+            "enqueued": 0,
+            "sent": 0,
+            "failed": 0,
+            "retries": 0,
+            "batches": 0,
+            "split_batches": 0,
+        }
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"mail-worker-{index}")
+            for index in range(self.workers)
+        ]
+
+    async def stop(self, drain_seconds: float = MAIL_QUEUE_DRAIN_SECONDS):
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=drain_seconds)
+        except asyncio.TimeoutError:
+            logger.warning(
+                "Se descartan %s correos pendientes al apagar", self._queue.qsize()
+            )
+
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._queue = None
+
+    async def enqueue(self, *, subject: str, recipients: list[str], html_body: str):
+        message = OutgoingEmail(subject=subject, recipients=tuple(recipients), html_body=html_body)
+        if not self.running:
+            # Sin cola activa (scripts, tests sin lifespan) se entrega en linea.
+            await self._deliver([message])
+            return
+        # Cola acotada: si esta llena, quien encola espera (backpressure) en vez de crecer sin limite.
+        await self._queue.put(message)
+        self._counters["enqueued"] += 1
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "workers": self.workers,
+            "pending": self._queue.qsize() if self._queue is not None else 0,
+            "max_size": self.max_size,
+            **self._counters,
+        }
+
+    async def _worker(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._deliver(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _next_batch(self) -> list[OutgoingEmail]:
+        batch = [await self._queue.get()]
+        if not self.transport.supports_batch or self.batch_size <= 1:
+            return batch
+
+        deadline = time.monotonic() + self.linger_ms / 1000
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _deliver(self, batch: list[OutgoingEmail]):
+        if len(batch) > 1:
+            self._counters["batches"] += 1
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                if len(batch) > 1:
+                    await self.transport.send_batch(batch)
+                else:
+                    await self.transport.send(batch[0])
+                self._counters["sent"] += len(batch)
+                return
+            except Exception as exc:
+                if len(batch) > 1 and not _is_retryable(exc):
+                    # El lote de Resend es todo o nada: un 422 por un destinatario invalido rechaza
+                    # todos los correos. Se reenvian por separado para que solo falle el problematico.
+                    logger.warning("Lote de %s correos rechazado (%s); se envian por separado", len(batch), exc)
+                    self._counters["split_batches"] += 1
+                    for message in batch:
+                        await self._deliver([message])
+                    return
+                if attempt >= self.max_retries or not _is_retryable(exc):
+                    self._counters["failed"] += len(batch)
+                    logger.exception(
+                        "Fallo envio de %s correo(s) tras %s intento(s)", len(batch), attempt + 1
+                    )
+                    return
+                self._counters["retries"] += 1
+                await asyncio.sleep(self.retry_base_ms / 1000 * (2 ** attempt))
+
+
+mail_transport = MailTransport()
+mail_queue = MailDeliveryQueue(
+    mail_transport,
+    workers=MAIL_QUEUE_WORKERS,
+    max_size=MAIL_QUEUE_MAX_SIZE,
+    batch_size=MAIL_BATCH_SIZE,
+    linger_ms=MAIL_BATCH_LINGER_MS,
+    max_retries=MAIL_MAX_RETRIES,
+    retry_base_ms=MAIL_RETRY_BASE_MS,
+)
 
-    await _send_email_with_smtp(
-        subject=subject,
-        recipients=recipients,
-        html_body=html_body,
+
+async def send_html_email(*, subject: str, recipients: list[str], html_body: str):
+    # Envio directo (el llamador necesita el resultado), reutilizando las conexiones del transporte.
+    await mail_transport.send(
+        OutgoingEmail(subject=subject, recipients=tuple(recipients), html_body=html_body)
     )
+
+
+async def enqueue_html_email(*, subject: str, recipients: list[str], html_body: str):
+    # Envio diferido: la cola reintenta y agrupa; los fallos definitivos quedan en el log.
+    await mail_queue.enqueue(subject=subject, recipients=recipients, html_body=html_body)
@@ -1,15 +1,19 @@
 ﻿from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional
 from uuid import UUID, uuid4
 
+import asyncio
 import os
 
-from fastapi import Depends, FastAPI, File, Header, HTTPException, Request, UploadFile, status
+from fastapi import Depends, FastAPI, File, Header, HTTPException, Query, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.security import OAuth2PasswordBearer
+from fastapi.responses import JSONResponse
 from pydantic import AliasChoices, BaseModel, EmailStr, Field, field_validator
+from sqlalchemy import select, update
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
 
@@ -20,19 +24,36 @@ except Exception:
     cloudinary = None
     cloudinary_uploader = None
 
-from .database import get_db, session
-from .models import AccessEventType, AccessLog, AuthChallenge, TokenDevice, User, UserRole
+from .access_log_writer import access_log_writer
+from .auth import (
+    TWO_FACTOR_REQUIRED,
+    bump_token_epoch,
+    create_user_access_token,
+    get_current_user,
+    invalidate_principal,
+    resolve_principal,
+    revoke_access_token,
+    revoked_token_purger,
+)
+from .category_index import category_index
+from .challenge_sweeper import challenge_sweeper
+from .conversation_store import conversation_purger
+from .database import configure_threadpool, get_db, session
+from .device_notifier import device_notifier
+from .device_registry import DeviceRecord, device_registry
+from .hashing import HashingPoolSaturated, password_hasher
+from .json_response import FastJSONResponse
+from .mailing import mail_queue, mail_transport
+from .models import AccessEventType, AuthChallenge, TokenDevice, User, UserRole
 from .password_policy import ensure_password_policy
 from .routers import admin, expenses, resetPass, categories, mailVerif, chatbot
 from .security import (
     DUMMY_HASH,
     create_access_token,
     decode_access_token,
-    get_password_hash,
     is_password_hashed,
-    verify_password,
 )
-from .totp_utils import verify_totp_code
+from .totp_utils import TotpVerifier, decode_totp_secret
 
 MAX_AVATAR_BYTES = 5 * 1024 * 1024
 CLOUDINARY_FOLDER = (os.getenv("CLOUDINARY_FOLDER") or "pw-backend-grupo5/avatars").strip()
@@ -43,8 +64,9 @@ TOTP_PERIOD_SECONDS = int(os.getenv("TOTP_PERIOD_SECONDS", "60"))
 TOTP_VALID_WINDOW = int(os.getenv("TOTP_VALID_WINDOW", "1"))
 TWO_FACTOR_TMP_TOKEN_EXPIRE_MINUTES = int(os.getenv("TWO_FACTOR_TMP_TOKEN_EXPIRE_MINUTES", "5"))
 TWO_FACTOR_MAX_ATTEMPTS = int(os.getenv("TWO_FACTOR_MAX_ATTEMPTS", "5"))
-TWO_FACTOR_REQUIRED = (os.getenv("TWO_FACTOR_REQUIRED", "true").strip().lower() not in {"0", "false", "no", "off"})
 DEVICE_NOTIFY_PATTERN = (os.getenv("DEVICE_NOTIFY_PATTERN") or "TRIPLE").strip().upper() or "TRIPLE"
+DEVICE_NOTIFY_WAIT_MAX_SECONDS = int(os.getenv("DEVICE_NOTIFY_WAIT_MAX_SECONDS", "25"))
+DEVICE_NOTIFY_DB_RECHECK_MS = int(os.getenv("DEVICE_NOTIFY_DB_RECHECK_MS", "1500"))
 ALLOWED_AVATAR_EXTENSIONS = {
     ".png",
     ".jpg",
@@ -70,27 +92,6 @@ ALLOWED_AVATAR_EXTENSIONS = {
 }
 
 
-def migrate_plain_passwords_to_hash():
-    # BLOQUE SEGURIDAD: migra passwords en texto plano a hash Argon2.
-    db = session()
-    try:
-        users = db.query(User).filter(User.password_hash.isnot(None)).all()
-        changed = 0
-        for user in users:
-            if user.password_hash and not is_password_hashed(user.password_hash):
-                user.password_hash = get_password_hash(user.password_hash)
-                changed += 1
-
-        if changed:
-            db.commit()
-    except SQLAlchemyError as exc:
-        db.rollback()
-        # BLOQUE SEGURIDAD: evita caida total de la API si falla la migracion.
-        print(f"No se pudo completar la migracion de passwords a hash: {exc}")
-    finally:
-        db.close()
-
-
 def _utcnow() -> datetime:
     return datetime.utcnow()
 
@@ -99,26 +100,53 @@ def _is_two_factor_enabled() -> bool:
     return TWO_FACTOR_REQUIRED
 
 
-def _resolve_totp_secret(db: Session | None = None) -> str:
-    if TOTP_SECRET_GLOBAL:
-        return TOTP_SECRET_GLOBAL
-
+def _resolve_totp_device(db: Session | None) -> DeviceRecord | None:
     if db is None or not DEVICE_SERIAL:
-        return ""
+        return None
 
     try:
-        device = db.query(TokenDevice).filter(TokenDevice.serial == DEVICE_SERIAL).first()
+        device = device_registry.get(DEVICE_SERIAL, db)
     except SQLAlchemyError:
         db.rollback()
-        return ""
+        return None
 
-    if not device:
-        return ""
+    if not device or not device.active:
+        return None
+    return device
+
+
+def _resolve_totp_secret(db: Session | None = None) -> str:
+    if TOTP_SECRET_GLOBAL:
+        return TOTP_SECRET_GLOBAL
+
+    device = _resolve_totp_device(db)
+    return device.secret if device else ""
 
-    if (device.status or "").upper() != "ACTIVE":
-        return ""
 
-    return (device.secret_enc or "").strip()
+def _resolve_totp_key(db: Session | None = None) -> bytes:
+    # Clave ya decodificada (cacheada en el registro); ValueError si falta o es invalida.
+    if TOTP_SECRET_GLOBAL:
+        return _global_totp_key()
+
+    device = _resolve_totp_device(db)
+    if not device or device.key_bytes is None:
+        raise ValueError("TOTP secret invalido")
+    return device.key_bytes
+
+
+@lru_cache(maxsize=1)
+def _global_totp_key() -> bytes:
+    return decode_totp_secret(TOTP_SECRET_GLOBAL)
+
+
+@lru_cache(maxsize=8)
+def _totp_verifier(key: bytes) -> TotpVerifier:
+    return TotpVerifier(
+        key,
+        period=TOTP_PERIOD_SECONDS,
+        digits=TOTP_DIGITS,
+        valid_window=TOTP_VALID_WINDOW,
+    )
 
 
 def _serialize_login_success(user: User, access_token: str):
@@ -168,35 +196,38 @@ def _ensure_demo_device(db: Session):
             updated = True
         if updated:
             db.commit()
+            device_registry.invalidate(DEVICE_SERIAL)
     except SQLAlchemyError:
         db.rollback()
 
 
-def _get_active_device_or_404(serial: str, db: Session) -> TokenDevice:
+def _get_active_device_or_404(serial: str, db: Session) -> DeviceRecord:
     requested_serial = (serial or "").strip()
     if not requested_serial:
         raise HTTPException(status_code=400, detail="Serial requerido")
 
     try:
-        device = db.query(TokenDevice).filter(TokenDevice.serial == requested_serial).first()
+        device = device_registry.get(requested_serial, db)
         if not device and requested_serial == DEVICE_SERIAL and TOTP_SECRET_GLOBAL:
-            device = TokenDevice(
-                serial=DEVICE_SERIAL,
-                secret_enc=TOTP_SECRET_GLOBAL,
-                digits=TOTP_DIGITS,
-                period=TOTP_PERIOD_SECONDS,
-                status="ACTIVE",
+            db.add(
+                TokenDevice(
+                    serial=DEVICE_SERIAL,
+                    secret_enc=TOTP_SECRET_GLOBAL,
+                    digits=TOTP_DIGITS,
+                    period=TOTP_PERIOD_SECONDS,
+                    status="ACTIVE",
+                )
             )
-            db.add(device)
             db.commit()
-            db.refresh(device)
+            device_registry.invalidate(requested_serial)
+            device = device_registry.get(requested_serial, db)
     except SQLAlchemyError as exc:
         db.rollback()
         raise HTTPException(status_code=503, detail="Esquema 2FA pendiente de migracion") from exc
 
     if not device:
         raise HTTPException(status_code=404, detail="Dispositivo no registrado")
-    if (device.status or "").upper() != "ACTIVE":
+    if not device.active:
         raise HTTPException(status_code=403, detail="Dispositivo inactivo")
     return device
 
@@ -252,8 +283,12 @@ def _create_access_log(
     attempt_email: str,
     request: Request,
     detail: str | None = None,
+    durable: bool = False,
 ):
-    log = AccessLog(
+    # durable=True: la fila se confirma junto con la transaccion del request.
+    access_log_writer.record(
+        db,
+        durable=durable,
         user_id=user.id if user else None,
         event_type=event_type,
         attempt_email=attempt_email,
@@ -261,27 +296,6 @@ def _create_access_log(
         web_agent=_extract_web_agent(request),
         detail=detail,
     )
-    db.add(log)
-
-
-def _get_user_from_token(token: str, db: Session) -> User | None:
-    try:
-        payload = decode_access_token(token)
-    except Exception:
-        return None
-
-    token_stage = str(payload.get("stage") or "").upper()
-    if _is_two_factor_enabled():
-        if token_stage != "FULL":
-            return None
-    elif token_stage and token_stage != "FULL":
-        return None
-
-    email = (payload.get("sub") or "").strip().lower()
-    if not email:
-        return None
-
-    return db.query(User).filter(User.email == email).first()
 
 
 def _resolve_token(
@@ -296,10 +310,12 @@ def _resolve_token(
 
 
 def _register_logout(token: str, request: Request, db: Session):
-    user = _get_user_from_token(token, db)
+    user = resolve_principal(token, db)
     if not user:
         raise HTTPException(status_code=401, detail="Token invalido")
 
+    # Solo se cierra esta sesion; las de otros dispositivos siguen activas.
+    revoke_access_token(db, token, user)
     _create_access_log(
         db,
         user=user,
@@ -308,16 +324,17 @@ def _register_logout(token: str, request: Request, db: Session):
         request=request,
     )
     db.commit()
+    invalidate_principal(user.id)
 
 
 def _serialize_user(user: User):
     return {
-        "id": str(user.id),
+        "id": user.id,
         "email": user.email,
         "name": user.full_name,
         "rol": user.role.value if user.role else "user",
         "avatar_url": _sanitize_avatar_url(user.avatar_url),
-        "updated_at": user.updated_at.isoformat() if user.updated_at else None,
+        "updated_at": user.updated_at,
     }
 
 
@@ -377,16 +394,38 @@ def _upload_avatar_to_cloudinary(file_bytes: bytes, *, user_id: str):
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    migrate_plain_passwords_to_hash()
+    configure_threadpool()
+    password_hasher.start()
     db = session()
     try:
         _ensure_demo_device(db)
+        try:
+            device_registry.load_all(db)
+            category_index.load_all(db)
+        except SQLAlchemyError:
+            db.rollback()
     finally:
         db.close()
-    yield
+    await mail_queue.start()
+    device_notifier.bind(asyncio.get_running_loop())
+    challenge_sweeper.start()
+    conversation_purger.start()
+    revoked_token_purger.start()
+    access_log_writer.start()
+    try:
+        yield
+    finally:
+        await challenge_sweeper.stop()
+        await conversation_purger.stop()
+        await revoked_token_purger.stop()
+        await access_log_writer.stop()
+        device_notifier.unbind()
+        await mail_queue.stop()
+        await mail_transport.aclose()
+        password_hasher.shutdown()
 
 
-app = FastAPI(lifespan=lifespan)
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -396,6 +435,16 @@ app.add_middleware(
 )
 
 
+@app.exception_handler(HashingPoolSaturated)
+async def hashing_pool_saturated_handler(request: Request, exc: HashingPoolSaturated):
+    # BLOQUE SEGURIDAD: ante una rafaga de logins se rechaza rapido en vez de encolar sin limite.
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Servicio de autenticacion ocupado, intenta nuevamente"},
+        headers={"Retry-After": "1"},
+    )
+
+
 class LoginRequest(BaseModel):
     # Campo canonico de login: email.
     # Compatibilidad: tambien acepta payloads legacy con "correo" o "username".
@@ -438,11 +487,8 @@ class ChangePasswordRequest(BaseModel):
     new_password: str = Field(..., min_length=1, max_length=300)
 
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
-
-
 @app.post("/register", status_code=201)
-async def register(register_request: RegisterRequest, db: Session = Depends(get_db)):
+def register(register_request: RegisterRequest, db: Session = Depends(get_db)):
     email = register_request.email.strip().lower()
     full_name = register_request.full_name.strip()
 
@@ -456,7 +502,7 @@ async def register(register_request: RegisterRequest, db: Session = Depends(get_
     user = User(
         full_name=full_name,
         email=email,
-        password_hash=get_password_hash(register_request.password),
+        password_hash=password_hasher.hash(register_request.password),
         role=UserRole.user,
         is_active=True,
     )
@@ -472,14 +518,14 @@ async def register(register_request: RegisterRequest, db: Session = Depends(get_
 
 @app.post("/auth/login")
 @app.post("/login")
-async def login(login_request: LoginRequest, request: Request, db: Session = Depends(get_db)):
+def login(login_request: LoginRequest, request: Request, db: Session = Depends(get_db)):
     # BLOQUE LOGIN BD: validacion real contra tabla user en PostgreSQL.
     login_email = login_request.email.strip().lower()
 
     user = db.query(User).filter(User.email == login_email).first()
 
     if not user:
-        verify_password(login_request.password, DUMMY_HASH)
+        password_hasher.verify(login_request.password, DUMMY_HASH)
         _create_access_log(
             db,
             user=None,
@@ -497,12 +543,13 @@ async def login(login_request: LoginRequest, request: Request, db: Session = Dep
         )
 
     if is_password_hashed(user.password_hash):
-        password_ok = verify_password(login_request.password, user.password_hash)
+        password_ok = password_hasher.verify(login_request.password, user.password_hash)
     else:
         password_ok = user.password_hash == login_request.password
         if password_ok:
-            user.password_hash = get_password_hash(login_request.password)
+            user.password_hash = password_hasher.hash(login_request.password)
             db.commit()
+            invalidate_principal(user.id)
 
     if not password_ok:
         _create_access_log(
@@ -516,7 +563,8 @@ async def login(login_request: LoginRequest, request: Request, db: Session = Dep
         raise HTTPException(status_code=400, detail="Credenciales incorrectas")
 
     if not _is_two_factor_enabled():
-        access_token = create_access_token({"sub": user.email})
+        access_token = create_user_access_token(user)
+        user.last_login_at = _utcnow()
         _create_access_log(
             db,
             user=user,
@@ -536,16 +584,7 @@ async def login(login_request: LoginRequest, request: Request, db: Session = Dep
     request_ip = _extract_client_ip(request)
     user_agent = _extract_web_agent(request)
 
-    (
-        db.query(AuthChallenge)
-        .filter(
-            AuthChallenge.user_id == user.id,
-            AuthChallenge.status == "PENDING",
-            AuthChallenge.expires_at < now,
-        )
-        .update({"status": "EXPIRED"}, synchronize_session=False)
-    )
-
+    # Los PENDING vencidos los marca challenge_sweeper; aqui basta con excluirlos del filtro.
     challenge = (
         db.query(AuthChallenge)
         .filter(
@@ -624,7 +663,7 @@ def _decode_2fa_token_or_401(raw_token: str) -> dict:
 
 
 @app.post("/auth/2fa/verify")
-async def verify_two_factor(payload: TwoFactorVerifyRequest, request: Request, db: Session = Depends(get_db)):
+def verify_two_factor(payload: TwoFactorVerifyRequest, request: Request, db: Session = Depends(get_db)):
     if not _is_two_factor_enabled():
         raise HTTPException(status_code=400, detail="2FA no esta habilitado")
 
@@ -717,13 +756,7 @@ async def verify_two_factor(payload: TwoFactorVerifyRequest, request: Request, d
 
     provided_code = "".join(ch for ch in payload.code if ch.isdigit())
     try:
-        valid_code = verify_totp_code(
-            totp_secret,
-            provided_code,
-            period=TOTP_PERIOD_SECONDS,
-            digits=TOTP_DIGITS,
-            valid_window=TOTP_VALID_WINDOW,
-        )
+        valid_code = _totp_verifier(_resolve_totp_key(db)).verify(provided_code)
     except ValueError as exc:
         raise HTTPException(status_code=503, detail="2FA no configurado correctamente") from exc
 
@@ -747,8 +780,8 @@ async def verify_two_factor(payload: TwoFactorVerifyRequest, request: Request, d
     challenge.device_notified = False
     challenge.device_notified_at = None
 
-    role_name = user.role.value if user.role else "user"
-    access_token = create_access_token({"sub": user.email, "role": role_name, "stage": "FULL"})
+    access_token = create_user_access_token(user, stage="FULL")
+    user.last_login_at = now
     _create_access_log(
         db,
         user=user,
@@ -766,6 +799,7 @@ async def verify_two_factor(payload: TwoFactorVerifyRequest, request: Request, d
         detail=f"challenge_id={challenge.id};2FA_OK",
     )
     db.commit()
+    device_notifier.notify()
 
     response = _serialize_login_success(user, access_token)
     response["requires_2fa"] = False
@@ -773,8 +807,36 @@ async def verify_two_factor(payload: TwoFactorVerifyRequest, request: Request, d
     return response
 
 
+def _claim_device_notification(db: Session) -> bool:
+    # Toma y marca como notificado el desafio VERIFIED mas antiguo en un solo UPDATE ... RETURNING;
+    # SKIP LOCKED evita que dos esperas concurrentes reclamen el mismo desafio.
+    oldest_pending = (
+        select(AuthChallenge.id)
+        .where(AuthChallenge.status == "VERIFIED", AuthChallenge.device_notified.is_(False))
+        .order_by(AuthChallenge.verified_at.asc(), AuthChallenge.created_at.asc())
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    claimed_id = db.execute(
+        update(AuthChallenge)
+        .where(AuthChallenge.id == oldest_pending)
+        .values(device_notified=True, device_notified_at=_utcnow())
+        .returning(AuthChallenge.id)
+        .execution_options(synchronize_session=False)
+    ).scalar_one_or_none()
+    # Siempre se cierra la transaccion para devolver la conexion al pool antes de esperar.
+    db.commit()
+    return claimed_id is not None
+
+
+def _check_device_and_claim(serial: str, db: Session) -> bool:
+    _get_active_device_or_404(serial, db)
+    return _claim_device_notification(db)
+
+
 @app.get("/device/notify")
-async def device_notify(serial: str, db: Session = Depends(get_db)):
+def device_notify(serial: str, db: Session = Depends(get_db)):
     _get_active_device_or_404(serial, db)
     pending = (
         db.query(AuthChallenge)
@@ -789,25 +851,41 @@ async def device_notify(serial: str, db: Session = Depends(get_db)):
 
 
 @app.post("/device/notify/ack")
-async def device_notify_ack(serial: str, db: Session = Depends(get_db)):
-    _get_active_device_or_404(serial, db)
-    pending = (
-        db.query(AuthChallenge)
-        .filter(AuthChallenge.status == "VERIFIED", AuthChallenge.device_notified.is_(False))
-        .order_by(AuthChallenge.verified_at.asc(), AuthChallenge.created_at.asc())
-        .first()
-    )
-    if not pending:
+def device_notify_ack(serial: str, db: Session = Depends(get_db)):
+    if not _check_device_and_claim(serial, db):
         return {"acknowledged": False}
-
-    pending.device_notified = True
-    pending.device_notified_at = _utcnow()
-    db.commit()
     return {"acknowledged": True, "pattern": DEVICE_NOTIFY_PATTERN}
 
 
+@app.get("/device/notify/wait")
+async def device_notify_wait(
+    serial: str,
+    timeout: int = Query(default=DEVICE_NOTIFY_WAIT_MAX_SECONDS, ge=1),
+    db: Session = Depends(get_db),
+):
+    # Long-poll: mantiene la conexion hasta que verify_two_factor avise (o vence el timeout).
+    # El reclamo ya marca el desafio como notificado, asi que no hace falta /device/notify/ack.
+    # Con varios workers el aviso de otro proceso no llega al evento local: la espera se corta
+    # cada DEVICE_NOTIFY_DB_RECHECK_MS para volver a consultar la BD (una consulta por corte).
+    wait_seconds = min(timeout, DEVICE_NOTIFY_WAIT_MAX_SECONDS)
+    recheck_seconds = DEVICE_NOTIFY_DB_RECHECK_MS / 1000 if DEVICE_NOTIFY_DB_RECHECK_MS > 0 else wait_seconds
+    deadline = asyncio.get_running_loop().time() + wait_seconds
+
+    event = device_notifier.current()
+    claimed = await run_in_threadpool(_check_device_and_claim, serial, db)
+    while not claimed:
+        remaining = deadline - asyncio.get_running_loop().time()
+        if remaining <= 0:
+            return {"beep": False, "pattern": None}
+        await device_notifier.wait(event, min(remaining, recheck_seconds))
+        event = device_notifier.current()
+        claimed = await run_in_threadpool(_claim_device_notification, db)
+
+    return {"beep": True, "pattern": DEVICE_NOTIFY_PATTERN}
+
+
 @app.get("/device/epoch")
-async def device_epoch(serial: str, db: Session = Depends(get_db)):
+def device_epoch(serial: str, db: Session = Depends(get_db)):
     _get_active_device_or_404(serial, db)
     now = _utcnow()
     return {
@@ -819,15 +897,21 @@ async def device_epoch(serial: str, db: Session = Depends(get_db)):
 
 
 @app.post("/device/ping")
-async def device_ping(serial: str, db: Session = Depends(get_db)):
+def device_ping(serial: str, db: Session = Depends(get_db)):
     device = _get_active_device_or_404(serial, db)
-    device.last_seen_at = _utcnow()
+    last_seen_at = _utcnow()
+    db.execute(
+        update(TokenDevice)
+        .where(TokenDevice.id == device.id)
+        .values(last_seen_at=last_seen_at)
+        .execution_options(synchronize_session=False)
+    )
     db.commit()
-    return {"ok": True, "serial": device.serial, "last_seen_at": device.last_seen_at.isoformat()}
+    return {"ok": True, "serial": device.serial, "last_seen_at": last_seen_at.isoformat()}
 
 
 @app.post("/logout")
-async def logout(
+def logout(
     request: Request,
     logout_request: Optional[LogoutRequest] = None,
     authorization: Optional[str] = Header(default=None),
@@ -842,31 +926,18 @@ async def logout(
 
 
 @app.get("/logout")
-async def logout_get(token: str, request: Request, db: Session = Depends(get_db)):
+def logout_get(token: str, request: Request, db: Session = Depends(get_db)):
     _register_logout(token, request, db)
     return {"msg": "Sesion cerrada"}
 
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="No autorizado",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-
-    user = _get_user_from_token(token, db)
-    if not user or not user.is_active or not user.email_verified:
-        raise credentials_exception
-    return user
-
-
 @app.get("/me")
-async def read_me(current_user: User = Depends(get_current_user)):
+def read_me(current_user: User = Depends(get_current_user)):
     return _serialize_user(current_user)
 
 
 @app.patch("/me/profile")
-async def update_my_profile(
+def update_my_profile(
     payload: UpdateProfileRequest,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -899,6 +970,7 @@ async def update_my_profile(
 
     current_user.updated_at = datetime.utcnow()
     db.commit()
+    invalidate_principal(current_user.id)
     db.refresh(current_user)
 
     return {
@@ -908,7 +980,7 @@ async def update_my_profile(
 
 
 @app.patch("/me/password")
-async def change_my_password(
+def change_my_password(
     payload: ChangePasswordRequest,
     request: Request,
     current_user: User = Depends(get_current_user),
@@ -929,29 +1001,40 @@ async def change_my_password(
         raise HTTPException(status_code=400, detail=str(exc)) from exc
 
     if is_password_hashed(current_user.password_hash):
-        password_ok = verify_password(current_password, current_user.password_hash)
+        password_ok = password_hasher.verify(current_password, current_user.password_hash)
     else:
         password_ok = current_user.password_hash == current_password
 
     if not password_ok:
         raise HTTPException(status_code=400, detail="La contrasena actual es incorrecta")
 
-    current_user.password_hash = get_password_hash(new_password)
+    current_user.password_hash = password_hasher.hash(new_password)
     current_user.updated_at = datetime.utcnow()
+    bump_token_epoch(db, current_user.id)
     _create_access_log(
         db,
         user=current_user,
         event_type=AccessEventType.PASSWORD_RESET_SUCCESS,
         attempt_email=current_user.email,
         request=request,
+        durable=True,
     )
     db.commit()
+    invalidate_principal(current_user.id)
+    db.refresh(current_user)
 
-    return {"msg": "Contrasena actualizada"}
+    # Los tokens anteriores quedan revocados; la sesion actual sigue con uno nuevo.
+    access_token = create_user_access_token(current_user, stage="FULL")
+    return {
+        "msg": "Contrasena actualizada",
+        "token": access_token,
+        "access_token": access_token,
+        "token_type": "bearer",
+    }
 
 
 @app.post("/me/avatar")
-async def upload_my_avatar(
+def upload_my_avatar(
     file: UploadFile = File(...),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -964,7 +1047,7 @@ async def upload_my_avatar(
     if not content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="El archivo debe ser una imagen")
 
-    file_bytes = await file.read()
+    file_bytes = file.file.read()
     if not file_bytes:
         raise HTTPException(status_code=400, detail="El archivo esta vacio")
     if len(file_bytes) > MAX_AVATAR_BYTES:
@@ -977,6 +1060,7 @@ async def upload_my_avatar(
     current_user.avatar_url = cloudinary_avatar_url
     current_user.updated_at = datetime.utcnow()
     db.commit()
+    invalidate_principal(current_user.id)
     db.refresh(current_user)
 
     return {
@@ -8,7 +8,9 @@ from sqlalchemy import (
     DateTime,
     Enum,
     ForeignKey,
+    Index,
     Integer,
+    JSON,
     Numeric,
     String,
     Text,
@@ -66,6 +68,12 @@ class User(Base):
 
     email_verified = Column(Boolean, nullable=False, default=False, server_default=text("false"))
     is_active = Column(Boolean, nullable=False, default=False, server_default=text("false"))
+    # Se incrementa en cada alta/edicion/baja de egresos; invalida caches derivados (chatbot).
+    expense_version = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    # Va en el claim "epoch" del JWT; incrementarlo revoca todos los tokens emitidos antes.
+    token_epoch = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    # Ultimo LOGIN_SUCCESS; evita buscarlo en access_log (particionado y con retencion).
+    last_login_at = Column(DateTime, nullable=True)
 
     created_at = Column(DateTime, nullable=False, server_default=func.current_timestamp())
     updated_at = Column(DateTime, nullable=False, server_default=func.current_timestamp())
@@ -74,6 +82,14 @@ class User(Base):
     access_logs = relationship("AccessLog", back_populates="user")
     auth_challenges = relationship("AuthChallenge", back_populates="user", cascade="all, delete-orphan")
 
+    # Orden "ultimo acceso, mas reciente primero" del listado admin (sort=last_access&order=desc).
+    # Solo en Postgres: SQLite no acepta NULLS LAST en un indice.
+    __table_args__ = (
+        Index("ix_user_last_login_at_id", last_login_at.desc().nulls_last(), id.desc()).ddl_if(
+            dialect="postgresql"
+        ),
+    )
+
 
 class Category(Base):
     __tablename__ = "category"
@@ -85,6 +101,9 @@ class Category(Base):
 
     expenses = relationship("Expense", back_populates="category")
 
+    # Unicidad sin distinguir mayusculas; es el arbitro del upsert de app/category_index.py.
+    __table_args__ = (Index("uq_category_lower_name", func.lower(name), unique=True),)
+
 
 class Expense(Base):
     __tablename__ = "expense"
@@ -104,9 +123,36 @@ class Expense(Base):
     user = relationship("User", back_populates="expenses")
     category = relationship("Category", back_populates="expenses")
 
+    # created_at/updated_at vuelven en el RETURNING del INSERT: no hace falta refresh().
+    __mapper_args__ = {"eager_defaults": True}
+
+
+class ExpenseMonthlyRollup(Base):
+    # Acumulado por usuario/mes/categoria; se mantiene en la misma transaccion que expense.
+    __tablename__ = "expense_monthly_rollup"
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey("user.id", ondelete="CASCADE"), primary_key=True)
+    year = Column(Integer, primary_key=True)
+    month = Column(Integer, primary_key=True)
+    category_id = Column(UUID(as_uuid=True), ForeignKey("category.id"), primary_key=True)
+
+    total = Column(Numeric(18, 2), nullable=False, default=0, server_default=text("0"))
+    count = Column(Integer, nullable=False, default=0, server_default=text("0"))
+
+
+class ChatConversation(Base):
+    # Historial del chatbot por usuario (backend "database" del conversation store).
+    __tablename__ = "chat_conversation"
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey("user.id", ondelete="CASCADE"), primary_key=True)
+    history = Column(JSON, nullable=False, default=list)
+    updated_at = Column(DateTime, nullable=False, server_default=func.current_timestamp())
+
 
 class AccessLog(Base):
     __tablename__ = "access_log"
+    # En Postgres la tabla esta particionada por mes sobre created_at y la PK fisica es
+    # (id, created_at); ver app/log_partitions.py.
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
 
@@ -163,6 +209,7 @@ class AuthChallenge(Base):
 
 class AdminAuditLog(Base):
     __tablename__ = "admin_audit_log"
+    # Particionada por mes igual que access_log.
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
 
@@ -177,3 +224,12 @@ class AdminAuditLog(Base):
     created_at = Column(DateTime, nullable=False, server_default=func.current_timestamp())
     ip_address = Column(String(45), nullable=True)
     web_agent = Column(String(255), nullable=True)
+
+
+class RevokedToken(Base):
+    # Tokens cerrados con logout (claim "jti"). La fila sirve hasta que el token vence.
+    __tablename__ = "revoked_token"
+
+    jti = Column(String(64), primary_key=True)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("user.id", ondelete="CASCADE"), nullable=False, index=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
@@ -0,0 +1,20 @@
+import base64
+from datetime import datetime
+from uuid import UUID
+
+
+# BLOQUE CURSOR KEYSET: el cursor es (fecha, id) de la ultima fila de la pagina en base64 url-safe
+# sin padding. Lo comparten los listados de egresos y de auditoria; cada router traduce el
+# ValueError a su propio HTTPException.
+def encode_keyset_cursor(sort_value: datetime, row_id: UUID) -> str:
+    raw = f"{sort_value.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_keyset_cursor(cursor: str) -> tuple[datetime, UUID]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw_date, raw_id = base64.urlsafe_b64decode(padded.encode()).decode().split("|", 1)
+        return datetime.fromisoformat(raw_date), UUID(raw_id)
+    except Exception as exc:
+        raise ValueError("Cursor invalido") from exc
@@ -0,0 +1,106 @@
+import argparse
+import os
+from uuid import UUID
+
+from sqlalchemy import and_, bindparam, select, update
+from sqlalchemy.orm import Session
+
+from .database import maintenance_session
+from .hashing import password_hasher
+from .models import User
+from .security import get_password_hash
+
+# BLOQUE SEGURIDAD: migra passwords en texto plano a Argon2 bajo demanda (ya no en el arranque).
+# Solo se leen las filas que no empiezan con "$argon2", por lotes con cursor por id; el hash
+# corre en el pool de procesos y cada lote se confirma por separado.
+# El login tambien re-hashea al vuelo, asi que correr esto es opcional.
+PASSWORD_MIGRATION_BATCH_SIZE = int(os.getenv("PASSWORD_MIGRATION_BATCH_SIZE", "100"))
+
+_user_table = User.__table__
+_update_if_unchanged = (
+    update(_user_table)
+    .where(
+        and_(
+            _user_table.c.id == bindparam("b_id"),
+            # Si el usuario cambio su password mientras tanto, no se pisa.
+            _user_table.c.password_hash == bindparam("b_old"),
+        )
+    )
+    .values(password_hash=bindparam("b_new"))
+)
+
+
+def _plain_password_batch(db: Session, after_id: UUID | None, batch_size: int):
+    query = (
+        select(User.id, User.password_hash)
+        .where(User.password_hash.isnot(None), User.password_hash.notlike("$argon2%"))
+        .order_by(User.id)
+        .limit(batch_size)
+    )
+    if after_id is not None:
+        query = query.where(User.id > after_id)
+    return db.execute(query).all()
+
+
+def migrate_plain_passwords(
+    db: Session,
+    *,
+    batch_size: int = PASSWORD_MIGRATION_BATCH_SIZE,
+    dry_run: bool = False,
+) -> int:
+    executor = password_hasher.start()
+    migrated = 0
+    after_id = None
+    while True:
+        batch = _plain_password_batch(db, after_id, batch_size)
+        if not batch:
+            break
+        after_id = batch[-1].id
+
+        rows = [row for row in batch if row.password_hash]
+        if dry_run:
+            migrated += len(rows)
+            continue
+
+        plain_values = [row.password_hash for row in rows]
+        if executor is None:
+            hashed_values = [get_password_hash(value) for value in plain_values]
+        else:
+            hashed_values = list(executor.map(get_password_hash, plain_values))
+
+        if rows:
+            result = db.execute(
+                _update_if_unchanged,
+                [
+                    {"b_id": row.id, "b_old": row.password_hash, "b_new": hashed}
+                    for row, hashed in zip(rows, hashed_values)
+                ],
+            )
+            db.commit()
+            migrated += result.rowcount
+
+        if len(batch) < batch_size:
+            break
+    return migrated
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Migra passwords en texto plano a hash Argon2")
+    parser.add_argument("--batch-size", type=int, default=PASSWORD_MIGRATION_BATCH_SIZE)
+    parser.add_argument("--dry-run", action="store_true", help="Solo cuenta las filas pendientes")
+    args = parser.parse_args(argv)
+
+    db = maintenance_session()
+    try:
+        migrated = migrate_plain_passwords(db, batch_size=args.batch_size, dry_run=args.dry_run)
+    finally:
+        db.close()
+        password_hasher.shutdown()
+
+    label = "Passwords pendientes" if args.dry_run else "Passwords migradas"
+    print(f"{label}: {migrated}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,54 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Callable
+
+from fastapi.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicTask:
+    # Tarea de mantenimiento en segundo plano: llama a `job` (sincrono, en el threadpool) cada
+    # interval_seconds. job devuelve cuantas filas/entradas proceso; 0 en interval lo desactiva.
+    def __init__(self, *, name: str, interval_seconds: int, job: Callable[[], int]):
+        self.name = name
+        self.interval_seconds = interval_seconds
+        self._job = job
+        self._task: asyncio.Task | None = None
+        self._runs = 0
+        self._failures = 0
+        self._processed = 0
+        self._last_run_at: datetime | None = None
+
+    def start(self):
+        if self._task is None and self.interval_seconds > 0:
+            self._task = asyncio.create_task(self._run(), name=self.name)
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is None:
+            return
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "running": self._task is not None,
+            "interval_seconds": self.interval_seconds,
+            "runs": self._runs,
+            "failures": self._failures,
+            "processed": self._processed,
+            "last_run_at": self._last_run_at.isoformat() if self._last_run_at else None,
+        }
+
+    async def _run(self):
+        while True:
+            try:
+                self._processed += await run_in_threadpool(self._job)
+                self._runs += 1
+                self._last_run_at = datetime.utcnow()
+            except Exception:
+                self._failures += 1
+                logger.exception("Fallo la tarea periodica %s", self.name)
+            await asyncio.sleep(self.interval_seconds)
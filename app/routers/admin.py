@@ -1,4 +1,5 @@
 ﻿import os
+from datetime import datetime, timedelta
 from typing import Optional
 from uuid import UUID, uuid4
 
@@ -6,12 +7,29 @@ from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
 from pydantic import BaseModel, EmailStr, Field, field_validator
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-
-from app.database import get_db
-from app.models import AccessEventType, AccessLog, AdminAuditLog, User, UserRole
+from sqlalchemy import func, or_, tuple_
+
+from app.access_log_writer import access_log_writer
+from app.auth import (
+    bump_token_epoch,
+    invalidate_principal,
+    principal_cache,
+    resolve_principal,
+    revoked_token_purger,
+    token_epochs,
+)
+from app.database import get_db, get_read_db, pool_stats
+from app.category_index import category_index
+from app.challenge_sweeper import challenge_sweeper
+from app.conversation_store import conversation_purger, conversation_store
+from app.device_notifier import device_notifier
+from app.device_registry import device_registry
+from app.hashing import password_hasher
+from app.json_response import FastJSONResponse
+from app.mailing import mail_queue
+from app.models import AccessLog, AdminAuditLog, User, UserRole
+from app.pagination import decode_keyset_cursor, encode_keyset_cursor
 from app.password_policy import ensure_password_policy
-from app.security import decode_access_token, get_password_hash
 
 ROLE_TO_TYPE = {
     UserRole.user: 1,
@@ -21,6 +39,10 @@ ROLE_TO_TYPE = {
 }
 TYPE_TO_ROLE = {value: key for key, value in ROLE_TO_TYPE.items()}
 ADMIN_PANEL_ROLES = {UserRole.owner, UserRole.admin, UserRole.auditor}
+MAX_USERS_PAGE_SIZE = 200
+# access_log y admin_audit_log estan particionados por mes: sin rango explicito las consultas
+# de los listados de logs se limitan a esta ventana para tocar solo las particiones recientes.
+ADMIN_LOG_LOOKBACK_DAYS = int(os.getenv("ADMIN_LOG_LOOKBACK_DAYS", "180"))
 
 
 class UserCreate(BaseModel):
@@ -40,6 +62,7 @@ class UserUpdate(BaseModel):
     email: Optional[EmailStr] = Field(default=None, max_length=100)
     password: Optional[str] = Field(default=None, min_length=8, max_length=300)
     type: Optional[int] = Field(None, ge=1, le=4)
+    is_active: Optional[bool] = None
 
     @field_validator("password")
     @classmethod
@@ -79,23 +102,18 @@ def _sanitize_avatar_url(avatar_url: str | None):
     return clean_avatar
 
 
-def _latest_login_date(db: Session, user_id: UUID):
-    latest_access = (
-        db.query(AccessLog)
-        .filter(
-            AccessLog.user_id == user_id,
-            AccessLog.event_type == AccessEventType.LOGIN_SUCCESS,
-        )
-        .order_by(AccessLog.created_at.desc())
-        .first()
-    )
-    return latest_access.created_at.strftime("%d/%m/%Y") if latest_access else "-"
+def _format_login_date(login_at):
+    return login_at.strftime("%d/%m/%Y") if login_at else "-"
+
+
+def _log_window_start(date_to: Optional[datetime] = None) -> datetime:
+    return (date_to or datetime.utcnow()) - timedelta(days=ADMIN_LOG_LOOKBACK_DAYS)
 
 
 def _serialize_user_payload(user: User):
     role_value = user.role.value if user.role else UserRole.user.value
     return {
-        "id": str(user.id),
+        "id": user.id,
         "nombre": user.full_name,
         "name": user.full_name,
         "full_name": user.full_name,
@@ -104,7 +122,7 @@ def _serialize_user_payload(user: User):
         "rol": role_value,
         "role_value": role_value,
         "avatar_url": _sanitize_avatar_url(user.avatar_url),
-        "updated_at": user.updated_at.isoformat() if user.updated_at else None,
+        "updated_at": user.updated_at,
     }
 
 
@@ -250,7 +268,7 @@ def _ensure_can_manage_users(actor: User):
         raise HTTPException(status_code=403, detail={"msg": "No tienes permisos para gestionar usuarios"})
 
 
-async def verify_admin_token(
+def verify_admin_token(
     x_token: Optional[str] = Header(default=None),
     authorization: Optional[str] = Header(default=None),
     db: Session = Depends(get_db),
@@ -259,16 +277,7 @@ async def verify_admin_token(
     if not token:
         raise HTTPException(status_code=401, detail={"msg": "Token requerido"})
 
-    try:
-        payload = decode_access_token(token)
-    except Exception as exc:
-        raise HTTPException(status_code=403, detail={"msg": "Token incorrecto"}) from exc
-
-    email = (payload.get("sub") or "").strip().lower()
-    if not email:
-        raise HTTPException(status_code=403, detail={"msg": "Token incorrecto"})
-
-    user = db.query(User).filter(User.email == email).first()
+    user = resolve_principal(token, db)
     if not user or not user.is_active or not user.email_verified:
         raise HTTPException(status_code=403, detail={"msg": "Token incorrecto"})
 
@@ -283,7 +292,7 @@ async def verify_admin_token(
 router = APIRouter(prefix="/admin", tags=["Admin"])
 
 @router.post("/", status_code=201)
-async def add_user(
+def add_user(
     user: UserCreate,
     request: Request,
     actor: User = Depends(verify_admin_token),
@@ -306,7 +315,7 @@ async def add_user(
         id=uuid4(),
         full_name=full_name,
         email=email,
-        password_hash=get_password_hash(user.password),
+        password_hash=password_hasher.hash(user.password),
         role=new_role,
     )
     db.add(db_user)
@@ -331,41 +340,73 @@ async def add_user(
 
 
 @router.get("/")
-async def get_users(
+def get_users(
     user_type: Optional[int] = Query(default=None, ge=1, le=4),
+    search: Optional[str] = Query(default=None, max_length=100),
+    sort: str = Query(default="created_at", pattern="^(name|email|type|last_access|created_at)$"),
+    order: str = Query(default="asc", pattern="^(asc|desc)$"),
+    page: Optional[int] = Query(default=None, ge=1),
+    page_size: int = Query(default=50, ge=1, le=MAX_USERS_PAGE_SIZE),
     actor: User = Depends(verify_admin_token),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
-    users = db.query(User).all()
+    query = db.query(User)
 
-    data = []
-    for user in users:
-        current_type = _user_type_by_role(user.role)
-        if user_type is not None and current_type != user_type:
-            continue
+    if user_type is not None:
+        query = query.filter(User.role == _role_by_type(user_type))
+    if actor.role == UserRole.admin:
+        query = query.filter(User.role == UserRole.user)
+
+    search_term = (search or "").strip()
+    if search_term:
+        query = query.filter(
+            or_(
+                User.full_name.icontains(search_term, autoescape=True),
+                User.email.icontains(search_term, autoescape=True),
+            )
+        )
 
-        if actor.role == UserRole.admin and user.role != UserRole.user:
-            continue
+    sort_column = {
+        "name": User.full_name,
+        "email": User.email,
+        "type": User.role,
+        "last_access": User.last_login_at,
+        "created_at": User.created_at,
+    }[sort]
+    if order == "desc":
+        query = query.order_by(sort_column.desc().nulls_last(), User.id.desc())
+    else:
+        query = query.order_by(sort_column.asc().nulls_last(), User.id.asc())
+
+    total = None
+    if page is not None:
+        total = query.order_by(None).count()
+        query = query.offset((page - 1) * page_size).limit(page_size)
 
+    data = []
+    for user in query.all():
         data.append(
             {
-                "id": str(user.id),
+                "id": user.id,
                 "nombre": user.full_name,
                 "name": user.full_name,
                 "full_name": user.full_name,
                 "email": user.email,
                 "rol": _role_label(user.role),
-                "ultimoAcceso": _latest_login_date(db, user.id),
-                "type": current_type,
+                "ultimoAcceso": _format_login_date(user.last_login_at),
+                "type": _user_type_by_role(user.role),
                 "role_value": user.role.value if user.role else UserRole.user.value,
             }
         )
 
-    return {"msg": "", "data": data}
+    response = {"msg": "", "data": data}
+    if page is not None:
+        response.update({"total": total, "page": page, "page_size": page_size})
+    return FastJSONResponse(response)
 
 
 @router.get("/email/{email}")
-async def get_user_by_email(
+def get_user_by_email(
     email: EmailStr,
     actor: User = Depends(verify_admin_token),
     db: Session = Depends(get_db),
@@ -379,7 +420,7 @@ async def get_user_by_email(
     _ensure_can_view_user(actor, user)
 
     payload = _serialize_user_payload(user)
-    payload["ultimoAcceso"] = _latest_login_date(db, user.id)
+    payload["ultimoAcceso"] = _format_login_date(user.last_login_at)
 
     return {
         "msg": "",
@@ -388,11 +429,16 @@ async def get_user_by_email(
 
 
 @router.get("/auditoria/admin")
-async def get_admin_audit_logs(
+def get_admin_audit_logs(
     action: Optional[str] = Query(default=None, max_length=100),
     limit: int = Query(default=100, ge=1, le=500),
+    actor_id: Optional[UUID] = Query(default=None),
+    target_id: Optional[UUID] = Query(default=None),
+    date_from: Optional[datetime] = Query(default=None),
+    date_to: Optional[datetime] = Query(default=None),
+    cursor: Optional[str] = Query(default=None, max_length=200),
     actor: User = Depends(verify_admin_token),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     if actor.role not in {UserRole.owner, UserRole.auditor}:
         raise HTTPException(
@@ -400,46 +446,79 @@ async def get_admin_audit_logs(
             detail={"msg": "Solo Owner o Auditor pueden ver la auditoria administrativa"},
         )
 
-    query = db.query(AdminAuditLog).order_by(AdminAuditLog.created_at.desc())
+    if date_from and date_to and date_from > date_to:
+        raise HTTPException(status_code=400, detail={"msg": "Rango de fechas invalido"})
+
+    query = db.query(AdminAuditLog)
     if action:
         query = query.filter(AdminAuditLog.action == action.strip().upper())
+    if actor_id:
+        query = query.filter(AdminAuditLog.actor_user_id == actor_id)
+    if target_id:
+        query = query.filter(
+            or_(
+                AdminAuditLog.target_user_id == target_id,
+                AdminAuditLog.target_snapshot_id == target_id,
+            )
+        )
+    query = query.filter(AdminAuditLog.created_at >= (date_from or _log_window_start(date_to)))
+    if date_to:
+        query = query.filter(AdminAuditLog.created_at <= date_to)
+    if cursor:
+        try:
+            cursor_created_at, cursor_id = decode_keyset_cursor(cursor)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail={"msg": "Cursor invalido"}) from exc
+        query = query.filter(
+            tuple_(AdminAuditLog.created_at, AdminAuditLog.id) < tuple_(cursor_created_at, cursor_id)
+        )
 
-    logs_db = query.limit(limit).all()
-    users = db.query(User).all()
-    users_by_id = {str(user.id): user for user in users}
+    logs_db = (
+        query.order_by(AdminAuditLog.created_at.desc(), AdminAuditLog.id.desc())
+        .limit(limit + 1)
+        .all()
+    )
+    has_more = len(logs_db) > limit
+    logs_db = logs_db[:limit]
+
+    # Solo se cargan los usuarios referenciados por la pagina (actor y target).
+    referenced_ids = {log.actor_user_id for log in logs_db}
+    referenced_ids.update(log.target_user_id for log in logs_db if log.target_user_id)
+    users_by_id = {}
+    if referenced_ids:
+        users_by_id = {
+            user.id: user
+            for user in db.query(User).filter(User.id.in_(referenced_ids)).all()
+        }
 
     data = []
     for log in logs_db:
-        actor_user = users_by_id.get(str(log.actor_user_id))
-        target_user = users_by_id.get(str(log.target_user_id)) if log.target_user_id else None
-        target_id = (
-            str(log.target_snapshot_id)
-            if log.target_snapshot_id
-            else (str(log.target_user_id) if log.target_user_id else None)
-        )
+        actor_user = users_by_id.get(log.actor_user_id)
+        target_user = users_by_id.get(log.target_user_id) if log.target_user_id else None
+        log_target_id = log.target_snapshot_id or log.target_user_id
         target_name = log.target_snapshot_name or (target_user.full_name if target_user else "-")
         target_email = log.target_snapshot_email or (target_user.email if target_user else "-")
         has_target = bool(
-            target_id
+            log_target_id
             or log.target_snapshot_name
             or log.target_snapshot_email
             or log.target_user_id
         )
         data.append(
             {
-                "id": str(log.id),
+                "id": log.id,
                 "accion": log.action,
                 "detalle": log.details or "",
                 "fecha": log.created_at.strftime("%d/%m/%Y") if log.created_at else "-",
                 "hora": log.created_at.strftime("%H:%M") if log.created_at else "-",
                 "actor": {
-                    "id": str(log.actor_user_id),
+                    "id": log.actor_user_id,
                     "nombre": actor_user.full_name if actor_user else "-",
                     "email": actor_user.email if actor_user else "-",
                 },
                 "target": (
                     {
-                        "id": target_id or "-",
+                        "id": log_target_id or "-",
                         "nombre": target_name,
                         "email": target_email,
                     }
@@ -451,24 +530,55 @@ async def get_admin_audit_logs(
             }
         )
 
-    return {"msg": "", "data": data}
+    next_cursor = encode_keyset_cursor(logs_db[-1].created_at, logs_db[-1].id) if has_more else None
+    return FastJSONResponse({"msg": "", "data": data, "next_cursor": next_cursor})
 
 
 @router.get("/userStats", dependencies=[Depends(verify_admin_token)])
-async def get_user_stats(db: Session = Depends(get_db)):
+def get_user_stats(db: Session = Depends(get_read_db)):
     return _build_user_stats_payload(db)
 
 
 @router.get("/user_stats", dependencies=[Depends(verify_admin_token)])
-async def get_user_stats_snake_case(db: Session = Depends(get_db)):
+def get_user_stats_snake_case(db: Session = Depends(get_read_db)):
     return _build_user_stats_payload(db)
 
 
+@router.get("/metrics")
+async def get_runtime_metrics(actor: User = Depends(verify_admin_token)):
+    if actor.role not in {UserRole.owner, UserRole.auditor}:
+        raise HTTPException(
+            status_code=403,
+            detail={"msg": "Solo Owner o Auditor pueden ver las metricas"},
+        )
+
+    return {
+        "msg": "",
+        "data": {
+            "auth_cache": principal_cache.stats(),
+            "token_epochs": token_epochs.stats(),
+            "revoked_token_purge": revoked_token_purger.stats(),
+            "password_hashing": password_hasher.stats(),
+            "mail_queue": mail_queue.stats(),
+            "chat_store": conversation_store.stats(),
+            "chat_purge": conversation_purger.stats(),
+            "device_notifier": device_notifier.stats(),
+            "device_registry": device_registry.stats(),
+            "challenge_sweeper": challenge_sweeper.stats(),
+            "access_log_writer": access_log_writer.stats(),
+            "category_index": category_index.stats(),
+            "db_pool": pool_stats(),
+        },
+    }
+
+
 @router.get("/auditoria/usuario/{user_id}")
-async def get_logs_user(
+def get_logs_user(
     user_id: str,
+    date_from: Optional[datetime] = Query(default=None),
+    date_to: Optional[datetime] = Query(default=None),
     actor: User = Depends(verify_admin_token),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     try:
         user_uuid = UUID(user_id)
@@ -481,12 +591,16 @@ async def get_logs_user(
 
     _ensure_can_view_user(actor, user)
 
-    logs_db = (
-        db.query(AccessLog)
-        .filter(AccessLog.user_id == user_uuid)
-        .order_by(AccessLog.created_at.desc())
-        .all()
+    if date_from and date_to and date_from > date_to:
+        raise HTTPException(status_code=400, detail={"msg": "Rango de fechas invalido"})
+
+    query = db.query(AccessLog).filter(
+        AccessLog.user_id == user_uuid,
+        AccessLog.created_at >= (date_from or _log_window_start(date_to)),
     )
+    if date_to:
+        query = query.filter(AccessLog.created_at <= date_to)
+    logs_db = query.order_by(AccessLog.created_at.desc()).all()
 
     logs = []
     for access in logs_db:
@@ -501,15 +615,15 @@ async def get_logs_user(
             }
         )
 
-    return {
+    return FastJSONResponse({
         "msg": "",
         "user": _serialize_user_payload(user),
         "data": logs,
-    }
+    })
 
 
 @router.get("/{user_id}")
-async def get_user(
+def get_user(
     user_id: str,
     actor: User = Depends(verify_admin_token),
     db: Session = Depends(get_db),
@@ -526,7 +640,7 @@ async def get_user(
     _ensure_can_view_user(actor, user)
 
     payload = _serialize_user_payload(user)
-    payload["ultimoAcceso"] = _latest_login_date(db, user.id)
+    payload["ultimoAcceso"] = _format_login_date(user.last_login_at)
 
     return {
         "msg": "",
@@ -535,7 +649,7 @@ async def get_user(
 
 
 @router.patch("/{user_id}")
-async def update_user(
+def update_user(
     updated_user: UserUpdate,
     user_id: str,
     request: Request,
@@ -587,8 +701,16 @@ async def update_user(
         user.email = new_email
         changed_fields.append("email")
     if updated_user.password is not None:
-        user.password_hash = get_password_hash(updated_user.password)
+        user.password_hash = password_hasher.hash(updated_user.password)
         changed_fields.append("password")
+    if updated_user.is_active is not None and updated_user.is_active != user.is_active:
+        if user.id == actor.id and not updated_user.is_active:
+            raise HTTPException(status_code=400, detail={"msg": "No puedes desactivar tu propia cuenta"})
+        user.is_active = updated_user.is_active
+        changed_fields.append("is_active")
+    # Cambio de password o desactivacion: se revocan todos los tokens del usuario.
+    if "password" in changed_fields or ("is_active" in changed_fields and not user.is_active):
+        bump_token_epoch(db, user.id)
     _add_admin_audit_log(
         db,
         actor=actor,
@@ -599,6 +721,7 @@ async def update_user(
     )
 
     db.commit()
+    invalidate_principal(user.id)
     db.refresh(user)
 
     return {
@@ -608,7 +731,7 @@ async def update_user(
 
 
 @router.delete("/{user_id}")
-async def delete_user(
+def delete_user(
     user_id: str,
     request: Request,
     actor: User = Depends(verify_admin_token),
@@ -645,4 +768,5 @@ async def delete_user(
             status_code=409,
             detail={"msg": "No se puede eliminar el usuario porque tiene registros relacionados"},
         ) from exc
+    invalidate_principal(user_uuid)
     return {"msg": "User borrado correctamente."}
@@ -4,7 +4,7 @@ from typing import List
 
 from ..models import Category
 from ..schemas import CategoryOut
-from ..database import get_db
+from ..database import get_read_db
 
 router = APIRouter(
     prefix="/categories",
@@ -12,6 +12,6 @@ router = APIRouter(
 )
 
 @router.get("/", response_model=List[CategoryOut])
-def get_categories(db: Session = Depends(get_db)):
+def get_categories(db: Session = Depends(get_read_db)):
     categorias = db.query(Category).all()
     return categorias
\ No newline at end of file
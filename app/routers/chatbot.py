@@ -1,30 +1,51 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 import google.generativeai as genai
 import os
-from typing import Dict, Optional
-import time
-from sqlalchemy import extract, func
+from typing import Optional
+from collections import OrderedDict
 from sqlalchemy.orm import Session
+from app.auth import get_current_user
+from app.conversation_store import conversation_store, truncate_history
 from app.database import get_db
+from app.expense_stats import compute_expense_stats
 from app.models import Category, Expense, User
-from app.security import decode_access_token
 import threading
 import logging
 import datetime
 import hashlib
+import json
 
 router = APIRouter(prefix="/chat", tags=["Chatbot"])
 
 logger = logging.getLogger("chatbot")
 
-SESSION_TIMEOUT = 900
 MAX_EXPENSES_CONTEXT = 5
-MAX_ACTIVE_SESSIONS = 5
-
-sessions: Dict[str, dict] = {}
-lock = threading.Lock()
+CHAT_MODEL_CACHE_SIZE = int(os.getenv("CHAT_MODEL_CACHE_SIZE", "256"))
+CHAT_CONTEXT_CACHE_SIZE = int(os.getenv("CHAT_CONTEXT_CACHE_SIZE", "4096"))
+
+CHAT_GENERATION_CONFIG = {
+    "temperature": 0.4,
+    "max_output_tokens": 500,
+}
+CONTINUATION_GENERATION_CONFIG = {
+    "temperature": 0.2,
+    "max_output_tokens": 200,
+}
+CONTINUATION_PROMPT = "Continúa exactamente donde te quedaste y cierra la idea."
+
+# BLOQUE CHATBOT: genai se configura una sola vez por API key y los GenerativeModel se
+# reutilizan por hash de contexto (LRU acotado). El historial vive en conversation_store.
+_genai_lock = threading.Lock()
+_configured_api_key: Optional[str] = None
+_model_cache: OrderedDict[str, genai.GenerativeModel] = OrderedDict()
+_model_lock = threading.Lock()
+# user_id -> ((expense_version, dia), contexto, hash). Solo se recalcula si cambian los egresos
+# del usuario (user.expense_version) o el dia.
+_context_cache: OrderedDict[str, tuple[tuple[int, datetime.date], str, str]] = OrderedDict()
+_context_lock = threading.Lock()
 
 
 def _resolve_api_key() -> str:
@@ -35,51 +56,47 @@ def _resolve_model_name() -> str:
     return (os.getenv("GEMINI_MODEL") or "gemini-2.5-flash-lite").strip()
 
 
-class ChatRequest(BaseModel):
-    message: str = Field(..., min_length=1, max_length=2000)
-
-
-def cleanup_sessions():
-    now = time.time()
-    with lock:
-        expired = [
-            uid for uid, data in sessions.items()
-            if now - data["last_used"] > SESSION_TIMEOUT
-        ]
-        for uid in expired:
-            del sessions[uid]
-
+def _ensure_genai_configured():
+    global _configured_api_key
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
+    api_key = _resolve_api_key()
+    if not api_key:
+        raise HTTPException(
+            status_code=503,
+            detail="Falta GEMINI_API_KEY",
+        )
 
+    if _configured_api_key != api_key:
+        with _genai_lock:
+            if _configured_api_key != api_key:
+                genai.configure(api_key=api_key)
+                _configured_api_key = api_key
 
-def _get_user_from_token(token: str, db: Session) -> Optional[User]:
-    try:
-        payload = decode_access_token(token)
-    except Exception:
-        return None
 
-    email = (payload.get("sub") or "").strip().lower()
-    if not email:
-        return None
+def _build_model(system_instruction: str):
+    return genai.GenerativeModel(
+        model_name=_resolve_model_name(),
+        system_instruction=system_instruction,
+    )
 
-    return db.query(User).filter(User.email == email).first()
 
+def _get_model(context_hash: str, system_instruction: str):
+    with _model_lock:
+        model = _model_cache.get(context_hash)
+        if model is not None:
+            _model_cache.move_to_end(context_hash)
+            return model
 
-def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-):
-    user = _get_user_from_token(token, db)
+    model = _build_model(system_instruction)
+    with _model_lock:
+        _model_cache[context_hash] = model
+        while len(_model_cache) > CHAT_MODEL_CACHE_SIZE:
+            _model_cache.popitem(last=False)
+    return model
 
-    if not user or not user.is_active or not user.email_verified:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="No autorizado",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
 
-    return user
+class ChatRequest(BaseModel):
+    message: str = Field(..., min_length=1, max_length=2000)
 
 
 def get_expenses_stats(
@@ -88,60 +105,10 @@ def get_expenses_stats(
     year: Optional[int] = None,
     month: Optional[int] = None
 ):
-    db_query = db.query(Expense).filter(Expense.user_id == current_user.id)
-
-    if year:
-        db_query = db_query.filter(extract("year", Expense.expense_date) == year)
-    if month:
-        db_query = db_query.filter(extract("month", Expense.expense_date) == month)
-
-    total_general = db_query.with_entities(
-        func.coalesce(func.sum(Expense.amount), 0)
-    ).scalar()
-
-    monthly_rows = db_query.with_entities(
-        extract("month", Expense.expense_date).label("month"),
-        func.sum(Expense.amount).label("total")
-    ).group_by("month").order_by("month").all()
-
-    monthly = [
-        {"month": int(row.month), "total": float(row.total)}
-        for row in monthly_rows
-    ]
-
-    category_rows = (
-        db.query(Category.name.label("category"),
-                 func.sum(Expense.amount).label("total"))
-        .join(Expense, Expense.category_id == Category.id)
-        .filter(Expense.user_id == current_user.id)
-    )
-
-    if year:
-        category_rows = category_rows.filter(
-            extract("year", Expense.expense_date) == year
-        )
-    if month:
-        category_rows = category_rows.filter(
-            extract("month", Expense.expense_date) == month
-        )
-
-    category_rows = (
-        category_rows
-        .group_by(Category.name)
-        .order_by(func.sum(Expense.amount).desc())
-        .all()
-    )
-
-    by_category = [
-        {"category": row.category, "total": float(row.total)}
-        for row in category_rows
-    ]
-
-    return {
-        "total": float(total_general or 0),
-        "monthly": monthly,
-        "by_category": by_category,
-    }
+    stats = compute_expense_stats(db, current_user.id, year=year, month=month)
+    # El contexto del chatbot no usa el desglose mes x categoria.
+    stats.pop("monthly_by_category", None)
+    return stats
 
 
 def _response_cut_by_tokens(response) -> bool:
@@ -160,48 +127,32 @@ def _response_cut_by_tokens(response) -> bool:
         return False
 
 
-@router.post("/")
-async def chat(
-    request: ChatRequest,
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
-):
-    try:
-        cleanup_sessions()
-        user_id = str(user.id)
-
-        with lock:
-            if len(sessions) >= MAX_ACTIVE_SESSIONS and user_id not in sessions:
-                oldest = min(
-                    sessions.items(),
-                    key=lambda x: x[1]["last_used"]
-                )[0]
-                del sessions[oldest]
-
-        stats = get_expenses_stats(current_user=user, db=db)
-
-        expenses = (
-            db.query(Expense)
-            .filter(Expense.user_id == user.id)
-            .order_by(Expense.expense_date.desc())
-            .limit(MAX_EXPENSES_CONTEXT)
-            .all()
-        )
+def _build_user_context(user: User, db: Session, today: datetime.date) -> tuple[str, str]:
+    stats = get_expenses_stats(current_user=user, db=db)
 
-        expenses_list = [
-            {
-                "amount": float(e.amount),
-                "category": e.category.name if e.category else None,
-                "date": str(e.expense_date),
-            }
-            for e in expenses
-        ]
+    expenses = (
+        db.query(Expense.amount, Expense.expense_date, Category.name.label("category"))
+        .outerjoin(Category, Expense.category_id == Category.id)
+        .filter(Expense.user_id == user.id)
+        .order_by(Expense.expense_date.desc())
+        .limit(MAX_EXPENSES_CONTEXT)
+        .all()
+    )
 
-        contexto = f"""
+    expenses_list = [
+        {
+            "amount": float(e.amount),
+            "category": e.category,
+            "date": str(e.expense_date),
+        }
+        for e in expenses
+    ]
+
+    contexto = f"""
 Eres un asesor financiero personal.
 Responde claro, breve y útil.
 No dejes frases incompletas.
-Hoy es {datetime.datetime.today()}.
+Hoy es {today}.
 
 ESTADISTICAS:
 {stats}
@@ -210,43 +161,83 @@ ULTIMOS EGRESOS:
 {expenses_list}
 """
 
-        raw_context = str(stats) + str(expenses_list)
-        context_hash = hashlib.md5(raw_context.encode()).hexdigest()
-
-        with lock:
-            session = sessions.get(user_id)
-
-            if session is None or session["context_hash"] != context_hash:
-                sessions[user_id] = {
-                    "context": contexto,
-                    "context_hash": context_hash,
-                    "last_used": time.time(),
-                }
-            else:
-                sessions[user_id]["last_used"] = time.time()
-
-        api_key = _resolve_api_key()
-        if not api_key:
-            raise HTTPException(
-                status_code=503,
-                detail="Falta GEMINI_API_KEY",
-            )
+    context_hash = hashlib.md5(contexto.encode()).hexdigest()
+    return contexto, context_hash
 
-        genai.configure(api_key=api_key)
 
-        model = genai.GenerativeModel(
-            model_name=_resolve_model_name(),
-            system_instruction=sessions[user_id]["context"],
-        )
+def _load_user_context(user: User, db: Session) -> tuple[str, str]:
+    # La version se lee de la BD (una busqueda por PK): el usuario autenticado puede venir
+    # del cache de principal y no refleja cambios recientes.
+    expense_version = db.query(User.expense_version).filter(User.id == user.id).scalar() or 0
+    today = datetime.date.today()
+    cache_key = str(user.id)
+    version = (expense_version, today)
+
+    with _context_lock:
+        cached = _context_cache.get(cache_key)
+        if cached is not None and cached[0] == version:
+            _context_cache.move_to_end(cache_key)
+            return cached[1], cached[2]
 
-        chat = model.start_chat()
+    contexto, context_hash = _build_user_context(user, db, today)
 
-        response = chat.send_message(
+    with _context_lock:
+        _context_cache[cache_key] = (version, contexto, context_hash)
+        _context_cache.move_to_end(cache_key)
+        while len(_context_cache) > CHAT_CONTEXT_CACHE_SIZE:
+            _context_cache.popitem(last=False)
+    return contexto, context_hash
+
+
+def _prepare_chat_session(user: User, db: Session):
+    # Trabajo sincrono (BD + armado de contexto): corre en el threadpool.
+    _ensure_genai_configured()
+    contexto, context_hash = _load_user_context(user, db)
+
+    conversation = conversation_store.get(user.id)
+    history = conversation["history"] if conversation else []
+
+    model = _get_model(context_hash, contexto)
+    chat_session = model.start_chat(
+        history=[{"role": turn["role"], "parts": [turn["text"]]} for turn in history]
+    )
+    return chat_session, history
+
+
+def _remember_turn(user: User, history: list[dict], message: str, answer: str):
+    history = history + [
+        {"role": "user", "text": message},
+        {"role": "model", "text": answer},
+    ]
+    conversation_store.save(user.id, history=truncate_history(history))
+
+
+def _chunk_text(chunk) -> str:
+    # Los chunks sin partes (p. ej. solo finish_reason) lanzan ValueError en .text.
+    try:
+        return chunk.text or ""
+    except ValueError:
+        return ""
+
+
+def _sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.post("/")
+async def chat(
+    request: ChatRequest,
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    try:
+        chat_session, history = await run_in_threadpool(
+            _prepare_chat_session, user, db
+        )
+
+        response = await chat_session.send_message_async(
             request.message,
-            generation_config={
-                "temperature": 0.4,
-                "max_output_tokens": 500,
-            },
+            generation_config=CHAT_GENERATION_CONFIG,
         )
 
         if not response or not response.text:
@@ -255,17 +246,15 @@ ULTIMOS EGRESOS:
         text = response.text
 
         if _response_cut_by_tokens(response):
-            continuation = chat.send_message(
-                "Continúa exactamente donde te quedaste y cierra la idea.",
-                generation_config={
-                    "temperature": 0.2,
-                    "max_output_tokens": 200,
-                },
+            continuation = await chat_session.send_message_async(
+                CONTINUATION_PROMPT,
+                generation_config=CONTINUATION_GENERATION_CONFIG,
             )
 
             if continuation and continuation.text:
                 text = f"{text.rstrip()}\n{continuation.text.strip()}"
 
+        await run_in_threadpool(_remember_turn, user, history, request.message, text)
         return {"text": text}
 
     except HTTPException:
@@ -273,3 +262,60 @@ ULTIMOS EGRESOS:
     except Exception:
         logger.exception("Error en chatbot")
         raise HTTPException(500, "Error generando respuesta")
+
+
+async def _stream_chat_events(user: User, prepared, message: str):
+    chat_session, history = prepared
+    parts: list[str] = []
+    try:
+        response = await chat_session.send_message_async(
+            message,
+            generation_config=CHAT_GENERATION_CONFIG,
+            stream=True,
+        )
+        async for chunk in response:
+            text = _chunk_text(chunk)
+            if text:
+                parts.append(text)
+                yield _sse_event("token", {"text": text})
+
+        if _response_cut_by_tokens(response):
+            continuation = await chat_session.send_message_async(
+                CONTINUATION_PROMPT,
+                generation_config=CONTINUATION_GENERATION_CONFIG,
+                stream=True,
+            )
+            parts.append("\n")
+            yield _sse_event("token", {"text": "\n"})
+            async for chunk in continuation:
+                text = _chunk_text(chunk)
+                if text:
+                    parts.append(text)
+                    yield _sse_event("token", {"text": text})
+
+        await run_in_threadpool(_remember_turn, user, history, message, "".join(parts))
+        yield _sse_event("done", {})
+    except Exception:
+        logger.exception("Error en chatbot (stream)")
+        yield _sse_event("error", {"detail": "Error generando respuesta"})
+
+
+@router.post("/stream")
+async def chat_stream(
+    request: ChatRequest,
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    try:
+        prepared = await run_in_threadpool(_prepare_chat_session, user, db)
+    except HTTPException:
+        raise
+    except Exception:
+        logger.exception("Error en chatbot")
+        raise HTTPException(500, "Error generando respuesta")
+
+    return StreamingResponse(
+        _stream_chat_events(user, prepared, request.message),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
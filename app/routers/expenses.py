@@ -1,17 +1,31 @@
+import csv
+import io
+import os
 from datetime import date, datetime, time
 from decimal import Decimal
-from typing import Optional
-from uuid import UUID
-
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from fastapi.security import OAuth2PasswordBearer
-from pydantic import BaseModel, Field
-from sqlalchemy import extract, func
-from sqlalchemy.orm import Session, joinedload
-
-from ..database import get_db
+from typing import Iterator, Optional
+from uuid import UUID, uuid4
+
+import orjson
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+from sqlalchemy import insert, tuple_
+from sqlalchemy.orm import Session
+
+from ..auth import get_current_user
+from ..category_index import category_index, normalize_category_name, resolve_categories, resolve_category
+from ..database import get_db, get_read_db
+from ..expense_rollup import (
+    apply_expense_delta,
+    bump_expense_version,
+    record_expense_added,
+    record_expense_removed,
+)
+from ..expense_stats import compute_expense_stats
+from ..json_response import FastJSONResponse, dumps_json
 from ..models import Category, Expense, User
-from ..security import decode_access_token
+from ..pagination import decode_keyset_cursor, encode_keyset_cursor
 from ..schemas import ExpenseUpdate
 
 router = APIRouter(
@@ -19,8 +33,26 @@ router = APIRouter(
     tags=["Expenses"],
 )
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
-
+MAX_EXPENSES_PAGE_SIZE = 500
+AMOUNT_QUANTUM = Decimal("0.01")
+EXPENSES_IMPORT_MAX_ROWS = int(os.getenv("EXPENSES_IMPORT_MAX_ROWS", "100000"))
+EXPENSES_IMPORT_BATCH_SIZE = int(os.getenv("EXPENSES_IMPORT_BATCH_SIZE", "1000"))
+EXPENSES_IMPORT_MAX_ERRORS = int(os.getenv("EXPENSES_IMPORT_MAX_ERRORS", "1000"))
+IMPORT_CSV_COLUMNS = ("amount", "expense_date", "description", "category_name")
+EXPENSES_STREAM_BATCH_SIZE = 500
+
+# Columnas proyectables en GET /expenses/ (mismo contrato que _serialize_expense).
+EXPENSE_FIELD_COLUMNS = {
+    "id": Expense.id,
+    "user_id": Expense.user_id,
+    "category_id": Expense.category_id,
+    "category_name": Category.name,
+    "amount": Expense.amount,
+    "expense_date": Expense.expense_date,
+    "description": Expense.description,
+    "created_at": Expense.created_at,
+    "updated_at": Expense.updated_at,
+}
 
 class ExpenseCreateRequest(BaseModel):
     amount: Decimal = Field(..., gt=0, max_digits=15, decimal_places=2)
@@ -29,90 +61,88 @@ class ExpenseCreateRequest(BaseModel):
     category_name: str = Field(..., min_length=1, max_length=100)
 
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="No autorizado",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    try:
-        payload = decode_access_token(token)
-    except Exception as exc:
-        raise credentials_exception from exc
+def _serialize_expense(expense: Expense, category_name: Optional[str] = None):
+    # Valores nativos (UUID, Decimal, datetime): los codifica FastJSONResponse.
+    if category_name is None and expense.category:
+        category_name = expense.category.name
+    return {
+        "id": expense.id,
+        "user_id": expense.user_id,
+        "category_id": expense.category_id,
+        "category_name": category_name,
+        "amount": expense.amount,
+        "expense_date": expense.expense_date,
+        "description": expense.description,
+        "created_at": expense.created_at,
+        "updated_at": expense.updated_at,
+    }
 
-    email = (payload.get("sub") or "").strip().lower()
-    if not email:
-        raise credentials_exception
 
-    user = db.query(User).filter(User.email == email).first()
-    if not user or not user.is_active or not user.email_verified:
-        raise credentials_exception
-    return user
+def _parse_expense_fields(fields: Optional[str]) -> list[str]:
+    if not fields:
+        return list(EXPENSE_FIELD_COLUMNS)
 
+    selected = []
+    for raw_field in fields.split(","):
+        field = raw_field.strip()
+        if not field:
+            continue
+        if field not in EXPENSE_FIELD_COLUMNS:
+            raise HTTPException(status_code=400, detail=f"Campo no permitido: {field}")
+        if field not in selected:
+            selected.append(field)
 
-def _serialize_expense(expense: Expense):
-    return {
-        "id": str(expense.id),
-        "user_id": str(expense.user_id),
-        "category_id": str(expense.category_id),
-        "category_name": expense.category.name if expense.category else None,
-        "amount": float(expense.amount),
-        "expense_date": expense.expense_date.isoformat(),
-        "description": expense.description,
-        "created_at": expense.created_at.isoformat() if expense.created_at else None,
-        "updated_at": expense.updated_at.isoformat() if expense.updated_at else None,
-    }
+    if not selected:
+        raise HTTPException(status_code=400, detail="Debe indicar al menos un campo")
+    return selected
 
 
-def _normalize_category_name(value: str):
-    return " ".join(value.strip().split())
+def _serialize_expense_row(row, fields: list[str]):
+    mapping = row._mapping
+    return {field: mapping[field] for field in fields}
 
 
 @router.post("/", status_code=201)
-async def create_expense(
+def create_expense(
     payload: ExpenseCreateRequest,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
-    category_name = _normalize_category_name(payload.category_name)
+    category_name = normalize_category_name(payload.category_name)
     if not category_name:
         raise HTTPException(status_code=400, detail="Categoria invalida")
 
-    category = (
-        db.query(Category)
-        .filter(func.lower(Category.name) == category_name.lower())
-        .first()
-    )
-
-    if not category:
-        category = Category(name=category_name)
-        db.add(category)
-        db.flush()
-
     clean_description = payload.description.strip()
     if not clean_description:
         raise HTTPException(status_code=400, detail="Descripcion invalida")
 
+    category_id, category_name = resolve_category(db, category_name)
+
     expense = Expense(
         user_id=current_user.id,
-        category_id=category.id,
-        amount=payload.amount,
+        category_id=category_id,
+        # Misma escala que Numeric(15, 2): el monto se serializa igual que al leerlo de la BD.
+        amount=payload.amount.quantize(AMOUNT_QUANTUM),
         expense_date=datetime.combine(payload.expense_date, time.min),
         description=clean_description,
     )
     db.add(expense)
+    record_expense_added(db, expense)
+    bump_expense_version(db, current_user.id)
+    db.flush()
+    # Se serializa antes del commit (que expira los atributos) para no releer la fila.
+    data = _serialize_expense(expense, category_name)
     db.commit()
-    db.refresh(expense)
-    expense.category = category
+    category_index.remember(category_id, category_name)
 
     return {
         "msg": "Egreso registrado",
-        "data": _serialize_expense(expense),
+        "data": data,
     }
 
 
 @router.get("/")
-async def get_expenses(
+def get_expenses(
     current_user: User = Depends(get_current_user),
     category_id: Optional[UUID] = Query(default=None),
     date_from: Optional[datetime] = Query(default=None),
@@ -120,6 +150,10 @@ async def get_expenses(
     amount_min: Optional[float] = Query(default=None, ge=0),
     amount_max: Optional[float] = Query(default=None, ge=0),
     order: str = Query(default="desc", pattern="^(asc|desc)$"),
+    limit: Optional[int] = Query(default=None, ge=1, le=MAX_EXPENSES_PAGE_SIZE),
+    cursor: Optional[str] = Query(default=None, max_length=200),
+    fields: Optional[str] = Query(default=None, max_length=300),
+    response_format: str = Query(default="json", alias="format", pattern="^(json|ndjson)$"),
     db: Session = Depends(get_db),
 ):
     if date_from and date_to and date_from > date_to:
@@ -128,11 +162,14 @@ async def get_expenses(
     if amount_min is not None and amount_max is not None and amount_min > amount_max:
         raise HTTPException(status_code=400, detail="Rango de montos invalido")
 
-    query = (
-        db.query(Expense)
-        .options(joinedload(Expense.category))
-        .filter(Expense.user_id == current_user.id)
-    )
+    selected_fields = _parse_expense_fields(fields)
+
+    # id y expense_date siempre se leen: son la llave del cursor (keyset).
+    query_fields = list(dict.fromkeys(["id", "expense_date", *selected_fields]))
+    query = db.query(*(EXPENSE_FIELD_COLUMNS[field].label(field) for field in query_fields)).select_from(Expense)
+    if "category_name" in query_fields:
+        query = query.outerjoin(Category, Category.id == Expense.category_id)
+    query = query.filter(Expense.user_id == current_user.id)
 
     if category_id:
         query = query.filter(Expense.category_id == category_id)
@@ -145,22 +182,243 @@ async def get_expenses(
     if amount_max is not None:
         query = query.filter(Expense.amount <= amount_max)
 
+    keyset = tuple_(Expense.expense_date, Expense.id)
+    if cursor:
+        try:
+            cursor_date, cursor_id = decode_keyset_cursor(cursor)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail="Cursor invalido") from exc
+        if order == "asc":
+            query = query.filter(keyset > tuple_(cursor_date, cursor_id))
+        else:
+            query = query.filter(keyset < tuple_(cursor_date, cursor_id))
+
     if order == "asc":
-        query = query.order_by(Expense.expense_date.asc())
+        query = query.order_by(Expense.expense_date.asc(), Expense.id.asc())
     else:
-        query = query.order_by(Expense.expense_date.desc())
-    
-    expenses_list = query.all()
-    return {
+        query = query.order_by(Expense.expense_date.desc(), Expense.id.desc())
+
+    if response_format == "ndjson":
+        if limit is not None:
+            query = query.limit(limit)
+
+        def stream_rows():
+            # yield_per usa cursor del lado del servidor: memoria constante sin importar el historial.
+            for row in query.yield_per(EXPENSES_STREAM_BATCH_SIZE):
+                yield dumps_json(_serialize_expense_row(row, selected_fields)) + b"\n"
+
+        return StreamingResponse(stream_rows(), media_type="application/x-ndjson")
+
+    # Se devuelve la respuesta ya armada para no pasar miles de filas por jsonable_encoder.
+    if limit is None:
+        return FastJSONResponse({
+            "msg": "",
+            "data": [_serialize_expense_row(row, selected_fields) for row in query.all()],
+        })
+
+    rows = query.limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return FastJSONResponse({
         "msg": "",
-        "data": [_serialize_expense(expense) for expense in expenses_list],
+        "data": [_serialize_expense_row(row, selected_fields) for row in rows],
+        "next_cursor": encode_keyset_cursor(rows[-1].expense_date, rows[-1].id) if has_more else None,
+    })
+
+
+# BLOQUE IMPORTACION: el archivo se lee por lineas desde el spool de UploadFile (nunca entero en
+# memoria). Cada fila se valida con ExpenseCreateRequest y las validas se insertan en lotes
+# (INSERT multi-fila) dentro de una sola transaccion; las invalidas van al reporte de errores.
+def _detect_import_format(file: UploadFile, requested: Optional[str]) -> str:
+    if requested:
+        return requested
+    filename = (file.filename or "").lower()
+    content_type = (file.content_type or "").lower()
+    if filename.endswith((".ndjson", ".jsonl")) or "ndjson" in content_type:
+        return "ndjson"
+    if filename.endswith(".csv") or "csv" in content_type:
+        return "csv"
+    raise HTTPException(status_code=400, detail="Formato no soportado: use CSV o NDJSON")
+
+
+def _iter_import_lines(file: UploadFile) -> Iterator[str]:
+    # utf-8-sig descarta el BOM que agregan las hojas de calculo al exportar; newline="" deja
+    # que csv maneje los saltos de linea dentro de campos entre comillas.
+    file.file.seek(0)
+    yield from io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+
+
+def _iter_csv_rows(lines: Iterator[str]) -> Iterator[tuple[int, object]]:
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if header is None:
+        return
+    columns = [column.strip().lower() for column in header]
+    missing = [column for column in IMPORT_CSV_COLUMNS if column not in columns]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Faltan columnas en el CSV: {', '.join(missing)}")
+
+    for values in reader:
+        if not any(value.strip() for value in values):
+            continue
+        yield reader.line_num, dict(zip(columns, values))
+
+
+def _iter_ndjson_rows(lines: Iterator[str]) -> Iterator[tuple[int, object]]:
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, orjson.loads(line)
+        except orjson.JSONDecodeError:
+            yield line_number, None
+
+
+def _validate_import_row(raw: object) -> tuple[Optional[dict], list[dict]]:
+    if not isinstance(raw, dict):
+        return None, [{"field": "-", "msg": "La fila debe ser un objeto JSON valido"}]
+
+    try:
+        payload = ExpenseCreateRequest.model_validate(raw)
+    except ValidationError as exc:
+        return None, [
+            {"field": ".".join(str(part) for part in error["loc"]) or "-", "msg": error["msg"]}
+            for error in exc.errors(include_url=False)
+        ]
+
+    # Mismas reglas que create_expense.
+    category_name = normalize_category_name(payload.category_name)
+    if not category_name:
+        return None, [{"field": "category_name", "msg": "Categoria invalida"}]
+    description = payload.description.strip()
+    if not description:
+        return None, [{"field": "description", "msg": "Descripcion invalida"}]
+
+    return {
+        "amount": payload.amount.quantize(AMOUNT_QUANTUM),
+        "expense_date": datetime.combine(payload.expense_date, time.min),
+        "description": description,
+        "category_name": category_name,
+    }, []
+
+
+def _insert_import_batch(db: Session, user_id: UUID, batch: list[dict], categories: dict, rollup: dict):
+    # Solo las categorias nuevas para esta importacion: las de lotes previos ya estan resueltas.
+    # dict.fromkeys conserva el orden: ante variantes de mayusculas gana la primera del archivo.
+    new_names = list(dict.fromkeys(
+        row["category_name"] for row in batch if row["category_name"].lower() not in categories
+    ))
+    if new_names:
+        categories.update(resolve_categories(db, new_names))
+
+    values = []
+    for row in batch:
+        category_id = categories[row["category_name"].lower()][0]
+        values.append(
+            {
+                "id": uuid4(),
+                "user_id": user_id,
+                "category_id": category_id,
+                "amount": row["amount"],
+                "expense_date": row["expense_date"],
+                "description": row["description"],
+            }
+        )
+        key = (category_id, row["expense_date"].year, row["expense_date"].month)
+        total, count = rollup.get(key, (Decimal(0), 0))
+        rollup[key] = (total + row["amount"], count + 1)
+
+    db.execute(insert(Expense), values)
+
+
+@router.post("/import")
+def import_expenses(
+    file: UploadFile = File(...),
+    import_format: Optional[str] = Query(default=None, alias="format", pattern="^(csv|ndjson)$"),
+    dry_run: bool = Query(default=False),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    import_format = _detect_import_format(file, import_format)
+    lines = _iter_import_lines(file)
+    rows = _iter_csv_rows(lines) if import_format == "csv" else _iter_ndjson_rows(lines)
+
+    batch: list[dict] = []
+    categories: dict = {}
+    # (category_id, anio, mes) -> (total, cantidad): un upsert de rollup por grupo, no por fila.
+    rollup: dict = {}
+    errors: list[dict] = []
+    processed = imported = rejected = 0
+
+    try:
+        for line_number, raw in rows:
+            processed += 1
+            if processed > EXPENSES_IMPORT_MAX_ROWS:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"El archivo supera el maximo de {EXPENSES_IMPORT_MAX_ROWS} filas",
+                )
+
+            row, row_errors = _validate_import_row(raw)
+            if row_errors:
+                rejected += 1
+                if len(errors) < EXPENSES_IMPORT_MAX_ERRORS:
+                    errors.append({"line": line_number, "errors": row_errors})
+                continue
+
+            imported += 1
+            if dry_run:
+                continue
+            batch.append(row)
+            if len(batch) >= EXPENSES_IMPORT_BATCH_SIZE:
+                _insert_import_batch(db, current_user.id, batch, categories, rollup)
+                batch = []
+
+        if batch:
+            _insert_import_batch(db, current_user.id, batch, categories, rollup)
+
+        for (category_id, year, month), (total, count) in rollup.items():
+            apply_expense_delta(
+                db,
+                user_id=current_user.id,
+                category_id=category_id,
+                expense_date=datetime(year, month, 1),
+                amount=total,
+                count=count,
+            )
+        if imported and not dry_run:
+            bump_expense_version(db, current_user.id)
+            db.commit()
+    except UnicodeDecodeError as exc:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="El archivo debe estar en UTF-8") from exc
+    except csv.Error as exc:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=f"CSV invalido: {exc}") from exc
+    except Exception:
+        db.rollback()
+        raise
+
+    for category_id, category_name in categories.values():
+        category_index.remember(category_id, category_name)
+
+    return {
+        "msg": "Validacion completada" if dry_run else "Importacion completada",
+        "data": {
+            "processed": processed,
+            "imported": 0 if dry_run else imported,
+            "valid": imported,
+            "rejected": rejected,
+            "errors": errors,
+            "errors_truncated": rejected > len(errors),
+        },
     }
 
 
 @router.get("/categories")
-async def get_expense_categories(
+def get_expense_categories(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     categories = (
         db.query(Category.id, Category.name)
@@ -173,11 +431,11 @@ async def get_expense_categories(
 
     return {
         "msg": "",
-        "data": [{"id": str(category.id), "name": category.name} for category in categories],
+        "data": [{"id": category.id, "name": category.name} for category in categories],
     }
 
 @router.put("/{expense_id}")
-async def update_expense(
+def update_expense(
     expense_id: UUID,
     payload: ExpenseUpdate,
     db: Session = Depends(get_db),
@@ -197,6 +455,9 @@ async def update_expense(
         )
     
     has_changes = False
+    previous_amount = expense.amount
+    previous_category_id = expense.category_id
+    previous_expense_date = expense.expense_date
 
     if payload.amount is not None:
         expense.amount = payload.amount
@@ -224,7 +485,23 @@ async def update_expense(
         raise HTTPException(status_code=400, detail="No hay cambios para actualizar")
     
     expense.updated_at = datetime.utcnow()
-    
+
+    if (expense.amount, expense.category_id, expense.expense_date) != (
+        previous_amount,
+        previous_category_id,
+        previous_expense_date,
+    ):
+        apply_expense_delta(
+            db,
+            user_id=expense.user_id,
+            category_id=previous_category_id,
+            expense_date=previous_expense_date,
+            amount=-previous_amount,
+            count=-1,
+        )
+        record_expense_added(db, expense)
+    bump_expense_version(db, current_user.id)
+
     db.commit()
     db.refresh(expense)
     
@@ -234,7 +511,7 @@ async def update_expense(
     }
 
 @router.delete("/{expense_id}")
-async def delete_expense(
+def delete_expense(
     expense_id: UUID,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -252,6 +529,8 @@ async def delete_expense(
             detail="Egreso no encontrado"
         )
     
+    record_expense_removed(db, expense)
+    bump_expense_version(db, current_user.id)
     db.delete(expense)
     db.commit()
     
@@ -260,117 +539,10 @@ async def delete_expense(
     }
 
 @router.get("/stats")
-async def get_expenses_stats(
+def get_expenses_stats(
     year: Optional[int] = Query(default=None, ge=1900, le=9999),
     month: Optional[int] = Query(default=None, ge=1, le=12),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
-    db_query = db.query(Expense).filter(Expense.user_id == current_user.id)
-
-    # Filtrado por año
-    if year:
-        db_query = db_query.filter(extract("year", Expense.expense_date) == year)
-
-    # filtrado por mes
-    if month:
-        db_query = db_query.filter(extract("month", Expense.expense_date) == month)
-    
-    # total general
-    total_general = (
-        db_query.with_entities(
-            func.coalesce(func.sum(Expense.amount), 0)
-        ).scalar()
-    )
-
-    # total por mes
-    monthly_rows = (
-        db_query.with_entities(
-            extract("month", Expense.expense_date).label("month"),
-            func.sum(Expense.amount).label("total")
-        )
-        .group_by("month")
-        .order_by("month")
-        .all()
-    )
-
-    monthly = [
-        {
-            "month": int(row.month),
-            "total": float(row.total)
-        }
-        for row in monthly_rows
-    ]
-
-    # total por categoria
-    category_query = (
-    db.query(
-        Category.name.label("category"),
-        func.sum(Expense.amount).label("total")
-    )
-    .join(Expense, Expense.category_id == Category.id)
-    .filter(Expense.user_id == current_user.id)
-    )
-
-    if year:
-        category_query = category_query.filter(extract("year", Expense.expense_date) == year)
-
-    if month:
-        category_query = category_query.filter(extract("month", Expense.expense_date) == month)
-
-    category_rows = (
-        category_query
-        .group_by(Category.name)
-        .order_by(func.sum(Expense.amount).desc())
-        .all()
-        )
-
-    by_category = [
-        {
-            "category": row.category,
-            "total": float(row.total)
-        }
-        for row in category_rows
-    ]
-
-    # total por mes y categoria (para stacked bar)
-    monthly_category_rows = (
-        db.query(
-            extract("month", Expense.expense_date).label("month"),
-            Category.name.label("category"),
-            func.sum(Expense.amount).label("total")
-        )
-        .join(Category, Expense.category_id == Category.id)
-        .filter(Expense.user_id == current_user.id)
-    )
-
-    if year:
-        monthly_category_rows = monthly_category_rows.filter(extract("year", Expense.expense_date) == year)
-
-    if month:
-        monthly_category_rows = monthly_category_rows.filter(extract("month", Expense.expense_date) == month)
-
-    monthly_category_rows = (
-        monthly_category_rows
-        .group_by("month", Category.name)
-        .order_by("month")
-        .all()
-    )
-
-    monthly_by_category = [
-        {
-            "month": int(row.month),
-            "category": row.category,
-            "total": float(row.total)
-        }
-        for row in monthly_category_rows
-    ]
-
-    return {
-        "total": float(total_general or 0),
-        "monthly": monthly,
-        "by_category": by_category,
-        "monthly_by_category": monthly_by_category
-    }
-
-
+    return compute_expense_stats(db, current_user.id, year=year, month=month)
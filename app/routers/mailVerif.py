@@ -4,8 +4,10 @@ import os
 import uuid
 
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 
+from ..auth import invalidate_principal
 from ..database import get_db
 from ..mailing import send_html_email
 from ..models import User
@@ -26,8 +28,7 @@ def _build_frontend_verify_link(token: str):
     return f"{frontend_url}/#/registro/verif?token={token}"
 
 
-async def send_verification_email_for_user(*, email: str, db: Session):
-    clean_email = (email or "").strip().lower()
+def _issue_verification_token(clean_email: str, db: Session) -> str:
     user = db.query(User).filter(User.email == clean_email).first()
     if not user:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
@@ -41,6 +42,13 @@ async def send_verification_email_for_user(*, email: str, db: Session):
     user.token_verification = token
     user.token_verification_expires = expires_at
     db.commit()
+    return token
+
+
+async def send_verification_email_for_user(*, email: str, db: Session):
+    clean_email = (email or "").strip().lower()
+    # La sesion es sincrona: el trabajo de BD corre en el threadpool, no en el event loop.
+    token = await run_in_threadpool(_issue_verification_token, clean_email, db)
 
     try:
         link = _build_frontend_verify_link(token)
@@ -135,7 +143,7 @@ async def send_verification_email(request: VerifRequest, db: Session = Depends(g
 
 
 @router.post("/confirm")
-async def confirm_email(body: TokenRequest, db: Session = Depends(get_db)):
+def confirm_email(body: TokenRequest, db: Session = Depends(get_db)):
     token = (body.token or "").strip()
     if not token:
         raise HTTPException(status_code=400, detail="Token invalido")
@@ -152,5 +160,6 @@ async def confirm_email(body: TokenRequest, db: Session = Depends(get_db)):
     user.token_verification = None
     user.token_verification_expires = None
     db.commit()
+    invalidate_principal(user.id)
 
     return {"msg": "Correo verificado y cuenta activada"}
@@ -6,11 +6,13 @@ import uuid
 from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
 
+from ..access_log_writer import access_log_writer
+from ..auth import bump_token_epoch, invalidate_principal
 from ..database import get_db
-from ..mailing import send_html_email
-from ..models import AccessEventType, AccessLog, User
+from ..hashing import password_hasher
+from ..mailing import enqueue_html_email
+from ..models import AccessEventType, User
 from ..schemas import ResetForm, ResetRequest
-from ..security import get_password_hash
 
 # Estos metodos se mantienen aqui para evitar imports circulares.
 
@@ -73,15 +75,17 @@ def _create_access_log(
     event_type: AccessEventType,
     attempt_email: str,
     request: Request,
+    durable: bool = False,
 ):
-    log = AccessLog(
+    access_log_writer.record(
+        db,
+        durable=durable,
         user_id=user.id if user else None,
         event_type=event_type,
         attempt_email=attempt_email,
         ip_address=_extract_client_ip(request),
         web_agent=_extract_web_agent(request),
     )
-    db.add(log)
 
 
 def _build_frontend_reset_link(token: str):
@@ -93,7 +97,7 @@ def _build_frontend_reset_link(token: str):
 
 async def _send_reset_email(email: str, html_content: str):
     try:
-        await send_html_email(
+        await enqueue_html_email(
             subject="Restablecer contraseña",
             recipients=[email],
             html_body=html_content,
@@ -103,7 +107,7 @@ async def _send_reset_email(email: str, html_content: str):
 
 
 @router.put("/request")
-async def reset_pass_request(
+def reset_pass_request(
     payload: ResetRequest,
     request: Request,
     bg_tasks: BackgroundTasks,
@@ -221,7 +225,7 @@ async def reset_pass_request(
 
 
 @router.post("/confirm")
-async def reset_pass_confirm(
+def reset_pass_confirm(
     form: ResetForm,
     request: Request,
     db: Session = Depends(get_db),
@@ -243,9 +247,10 @@ async def reset_pass_confirm(
             },
         )
 
-    db_user.password_hash = get_password_hash(form.password)
+    db_user.password_hash = password_hasher.hash(form.password)
     db_user.token_pass = None
     db_user.token_pass_expires = None
+    bump_token_epoch(db, db_user.id)
 
     _create_access_log(
         db,
@@ -253,9 +258,11 @@ async def reset_pass_confirm(
         event_type=AccessEventType.PASSWORD_RESET_SUCCESS,
         attempt_email=db_user.email,
         request=request,
+        durable=True,
     )
 
     db.commit()
+    invalidate_principal(db_user.id)
 
     return {
         "msg": "",
@@ -3,6 +3,9 @@ import hashlib
 import hmac
 import struct
 import time
+from typing import Iterable
+
+_COUNTER = struct.Struct(">Q")
 
 
 def _normalize_base32_secret(secret: str) -> str:
@@ -22,6 +25,64 @@ def _decode_base32_secret(secret: str) -> bytes:
         raise ValueError("TOTP secret invalido") from exc
 
 
+def decode_totp_secret(secret: str) -> bytes:
+    # Decodifica una sola vez; los llamadores guardan los bytes (p. ej. el registro de dispositivos).
+    return _decode_base32_secret(secret)
+
+
+def _normalize_code(code: str) -> str:
+    return "".join(ch for ch in str(code) if ch.isdigit())
+
+
+class TotpVerifier:
+    # Guarda la clave ya decodificada y un HMAC-SHA1 con la clave precargada; por cada contador
+    # solo se copia ese estado y se agrega el mensaje de 8 bytes.
+    def __init__(self, key: bytes, *, period: int = 60, digits: int = 6, valid_window: int = 1):
+        if period <= 0:
+            raise ValueError("El periodo TOTP debe ser mayor que cero")
+        if digits <= 0:
+            raise ValueError("La cantidad de digitos TOTP debe ser mayor que cero")
+        if valid_window < 0:
+            raise ValueError("valid_window no puede ser negativo")
+
+        self.period = period
+        self.digits = digits
+        self.valid_window = valid_window
+        self._modulo = 10**digits
+        self._keyed_hmac = hmac.new(key, digestmod=hashlib.sha1)
+
+    @classmethod
+    def from_secret(cls, secret: str, **kwargs) -> "TotpVerifier":
+        return cls(_decode_base32_secret(secret), **kwargs)
+
+    def code_for_counter(self, counter: int) -> str:
+        mac = self._keyed_hmac.copy()
+        mac.update(_COUNTER.pack(counter))
+        digest = mac.digest()
+        offset = digest[-1] & 0x0F
+        binary = int.from_bytes(digest[offset:offset + 4], "big") & 0x7FFFFFFF
+        return str(binary % self._modulo).zfill(self.digits)
+
+    def generate(self, timestamp: int | None = None) -> str:
+        now_ts = int(time.time()) if timestamp is None else int(timestamp)
+        return self.code_for_counter(now_ts // self.period)
+
+    def verify(self, code: str, *, timestamp: int | None = None) -> bool:
+        normalized_code = _normalize_code(code)
+        if len(normalized_code) != self.digits:
+            return False
+
+        now_ts = int(time.time()) if timestamp is None else int(timestamp)
+        counter = now_ts // self.period
+        matched = False
+        # Se revisan todas las ventanas sin salida temprana: el tiempo de respuesta no revela
+        # en que ventana coincidio el codigo.
+        for window in range(-self.valid_window, self.valid_window + 1):
+            expected = self.code_for_counter(counter + window)
+            matched |= hmac.compare_digest(expected, normalized_code)
+        return matched
+
+
 def generate_totp_code(
     secret: str,
     *,
@@ -29,26 +90,8 @@ def generate_totp_code(
     period: int = 60,
     digits: int = 6,
 ) -> str:
-    if period <= 0:
-        raise ValueError("El periodo TOTP debe ser mayor que cero")
-    if digits <= 0:
-        raise ValueError("La cantidad de digitos TOTP debe ser mayor que cero")
-
-    key = _decode_base32_secret(secret)
-    now_ts = int(time.time()) if timestamp is None else int(timestamp)
-    counter = now_ts // period
-    msg = struct.pack(">Q", counter)
-
-    digest = hmac.new(key, msg, hashlib.sha1).digest()
-    offset = digest[-1] & 0x0F
-    binary = (
-        ((digest[offset] & 0x7F) << 24)
-        | ((digest[offset + 1] & 0xFF) << 16)
-        | ((digest[offset + 2] & 0xFF) << 8)
-        | (digest[offset + 3] & 0xFF)
-    )
-    otp = binary % (10**digits)
-    return str(otp).zfill(digits)
+    verifier = TotpVerifier.from_secret(secret, period=period, digits=digits, valid_window=0)
+    return verifier.generate(timestamp)
 
 
 def verify_totp_code(
@@ -59,21 +102,41 @@ def verify_totp_code(
     digits: int = 6,
     valid_window: int = 1,
 ) -> bool:
-    normalized_code = "".join(ch for ch in str(code) if ch.isdigit())
-    if len(normalized_code) != digits:
+    if len(_normalize_code(code)) != digits:
         return False
     if valid_window < 0:
         raise ValueError("valid_window no puede ser negativo")
 
-    now_ts = int(time.time())
-    for window in range(-valid_window, valid_window + 1):
-        expected = generate_totp_code(
-            secret,
-            timestamp=now_ts + (window * period),
-            period=period,
-            digits=digits,
-        )
-        if hmac.compare_digest(expected, normalized_code):
-            return True
-
-    return False
+    verifier = TotpVerifier.from_secret(
+        secret,
+        period=period,
+        digits=digits,
+        valid_window=valid_window,
+    )
+    return verifier.verify(code)
+
+
+def verify_totp_codes(
+    items: Iterable[tuple[str, str]],
+    *,
+    period: int = 60,
+    digits: int = 6,
+    valid_window: int = 1,
+    timestamp: int | None = None,
+) -> list[bool]:
+    # Valida muchos pares (secreto, codigo) con un mismo instante y un verificador por secreto.
+    # Un secreto invalido solo hace fallar su propio par (False), no todo el lote.
+    now_ts = int(time.time()) if timestamp is None else int(timestamp)
+    verifiers: dict[str, TotpVerifier | None] = {}
+    results = []
+    for secret, code in items:
+        if secret not in verifiers:
+            try:
+                key = _decode_base32_secret(secret)
+            except ValueError:
+                verifiers[secret] = None
+            else:
+                verifiers[secret] = TotpVerifier(key, period=period, digits=digits, valid_window=valid_window)
+        verifier = verifiers[secret]
+        results.append(verifier is not None and verifier.verify(code, timestamp=now_ts))
+    return results
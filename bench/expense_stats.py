@@ -0,0 +1,117 @@
+# Benchmark de /expenses/stats (python bench/expense_stats.py desde la raiz del repo).
+# Siembra --rows egresos para un usuario desechable en DATABASE_URL (Postgres), arma su rollup y
+# compara las cuatro consultas agregadas originales sobre expense con compute_expense_stats.
+# Al final borra el usuario, sus egresos, su rollup y las categorias sembradas.
+import argparse
+import statistics
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from sqlalchemy import delete, extract, func, text  # noqa: E402
+
+from app.database import maintenance_session  # noqa: E402
+from app.expense_rollup import rebuild_rollup  # noqa: E402
+from app.expense_stats import compute_expense_stats  # noqa: E402
+from app.models import Category, Expense, ExpenseMonthlyRollup, User  # noqa: E402
+
+
+def legacy_expense_stats(db, user_id, year=None, month=None):
+    def filtered(query):
+        query = query.filter(Expense.user_id == user_id)
+        if year:
+            query = query.filter(extract("year", Expense.expense_date) == year)
+        if month:
+            query = query.filter(extract("month", Expense.expense_date) == month)
+        return query
+
+    month_expr = extract("month", Expense.expense_date)
+    filtered(db.query(func.coalesce(func.sum(Expense.amount), 0))).scalar()
+    filtered(db.query(month_expr.label("month"), func.sum(Expense.amount))).group_by("month").all()
+    filtered(
+        db.query(Category.name, func.sum(Expense.amount)).join(Expense, Expense.category_id == Category.id)
+    ).group_by(Category.name).all()
+    filtered(
+        db.query(month_expr.label("month"), Category.name, func.sum(Expense.amount)).join(
+            Category, Expense.category_id == Category.id
+        )
+    ).group_by("month", Category.name).all()
+
+
+def _timed(function, runs: int) -> float:
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de estadisticas de egresos")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--categories", type=int, default=20)
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    db = maintenance_session()
+    if db.get_bind().dialect.name != "postgresql":
+        print("El benchmark necesita DATABASE_URL apuntando a PostgreSQL")
+        return 1
+
+    suffix = uuid.uuid4().hex[:8]
+    user_id = uuid.uuid4()
+    try:
+        db.add(User(id=user_id, full_name="Bench", email=f"bench-{suffix}@example.com", password_hash="x"))
+        db.flush()
+        db.execute(
+            text(
+                "INSERT INTO category (id, name) "
+                "SELECT gen_random_uuid(), 'Bench ' || :suffix || ' ' || n "
+                "FROM generate_series(1, :categories) AS n"
+            ),
+            {"suffix": suffix, "categories": args.categories},
+        )
+        db.execute(
+            text(
+                """
+                INSERT INTO expense (id, user_id, category_id, amount, expense_date, description)
+                SELECT gen_random_uuid(), :user_id, c.ids[1 + n % array_length(c.ids, 1)],
+                       round((random() * 500)::numeric, 2),
+                       now()::timestamp - make_interval(hours => (random() * 17000)::int), 'bench'
+                FROM generate_series(1, :rows) AS n,
+                     (SELECT array_agg(id) AS ids FROM category WHERE name LIKE 'Bench ' || :suffix || ' %') AS c
+                """
+            ),
+            {"user_id": user_id, "rows": args.rows, "suffix": suffix},
+        )
+        db.commit()
+        rebuild_rollup(db, user_id)
+        db.execute(text("ANALYZE expense"))
+        db.execute(text("ANALYZE expense_monthly_rollup"))
+        db.commit()
+
+        this_year = time.localtime().tm_year
+        for label, filters in (("sin filtros", {}), (f"year={this_year}", {"year": this_year})):
+            legacy = _timed(lambda: legacy_expense_stats(db, user_id, **filters), args.runs)
+            current = _timed(lambda: compute_expense_stats(db, user_id, **filters), args.runs)
+            print(
+                f"{args.rows} egresos, {label:<12} 4 consultas: {legacy:8.2f} ms  "
+                f"compute_expense_stats: {current:6.2f} ms"
+            )
+    finally:
+        db.rollback()
+        db.execute(delete(ExpenseMonthlyRollup).where(ExpenseMonthlyRollup.user_id == user_id))
+        db.execute(delete(Expense).where(Expense.user_id == user_id))
+        db.execute(delete(User).where(User.id == user_id))
+        db.execute(delete(Category).where(Category.name.like(f"Bench {suffix} %")))
+        db.commit()
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
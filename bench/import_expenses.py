@@ -0,0 +1,87 @@
+# Benchmark de POST /expenses/import (python bench/import_expenses.py desde la raiz del repo).
+# Usa la BD de DATABASE_URL (Postgres): crea un usuario desechable, importa N filas generadas
+# por el endpoint real y al final borra sus egresos, su rollup y el usuario.
+import argparse
+import io
+import random
+import sys
+import time
+import uuid
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from fastapi import FastAPI  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import delete  # noqa: E402
+
+from app.auth import get_current_user  # noqa: E402
+from app.database import session  # noqa: E402
+from app.models import Expense, ExpenseMonthlyRollup, User  # noqa: E402
+from app.routers import expenses  # noqa: E402
+
+
+def build_csv(rows: int, categories: int) -> bytes:
+    rng = random.Random(1)
+    start = date(2025, 1, 1)
+    buffer = io.StringIO()
+    buffer.write("amount,expense_date,description,category_name\n")
+    for index in range(rows):
+        amount = f"{rng.randint(100, 50000) / 100:.2f}"
+        expense_date = start + timedelta(days=rng.randint(0, 600))
+        buffer.write(f"{amount},{expense_date},fila {index},Bench categoria {index % categories}\n")
+    return buffer.getvalue().encode()
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de importacion de egresos")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--categories", type=int, default=25)
+    parser.add_argument("--dry-run", action="store_true", help="solo valida, sin escribir")
+    args = parser.parse_args(argv)
+
+    db = session()
+    if db.get_bind().dialect.name != "postgresql":
+        print("El benchmark necesita DATABASE_URL apuntando a PostgreSQL")
+        return 1
+    user = User(
+        id=uuid.uuid4(),
+        full_name="Bench",
+        email=f"bench-{uuid.uuid4().hex[:8]}@example.com",
+        password_hash="x",
+    )
+    db.add(user)
+    db.commit()
+
+    app = FastAPI()
+    app.include_router(expenses.router)
+    app.dependency_overrides[get_current_user] = lambda: user
+    client = TestClient(app)
+    payload = build_csv(args.rows, args.categories)
+
+    try:
+        started = time.perf_counter()
+        response = client.post(
+            "/expenses/import",
+            params={"dry_run": str(args.dry_run).lower()},
+            files={"file": ("bench.csv", payload, "text/csv")},
+        )
+        elapsed = time.perf_counter() - started
+        response.raise_for_status()
+        data = response.json()["data"]
+        print(
+            f"{args.rows} filas ({len(payload) / 1e6:.1f} MB): {elapsed:.2f} s, "
+            f"{args.rows / elapsed:,.0f} filas/s; valid={data['valid']} imported={data['imported']}"
+        )
+    finally:
+        db.execute(delete(Expense).where(Expense.user_id == user.id))
+        db.execute(delete(ExpenseMonthlyRollup).where(ExpenseMonthlyRollup.user_id == user.id))
+        db.execute(delete(User).where(User.id == user.id))
+        db.commit()
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,62 @@
+# Benchmark de serializacion de respuestas (python bench/json_response.py desde la raiz del repo).
+# Compara JSONResponse + jsonable_encoder (camino por defecto de FastAPI) con FastJSONResponse
+# (orjson) para una lista de egresos con UUID, Decimal y datetime como la de GET /expenses/.
+import argparse
+import datetime
+import sys
+import timeit
+import uuid
+from decimal import Decimal
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+
+from app.json_response import FastJSONResponse  # noqa: E402
+
+
+def build_payload(rows: int) -> dict:
+    now = datetime.datetime(2026, 1, 5, 10, 11, 12, 123456)
+    return {
+        "msg": "",
+        "data": [
+            {
+                "id": uuid.uuid4(),
+                "user_id": uuid.uuid4(),
+                "category_id": uuid.uuid4(),
+                "category_name": "Comida",
+                "amount": Decimal("12.50"),
+                "expense_date": now,
+                "description": "x" * 20,
+                "created_at": now,
+                "updated_at": now,
+            }
+            for _ in range(rows)
+        ],
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de FastJSONResponse")
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    payload = build_payload(args.rows)
+    previous = JSONResponse(jsonable_encoder(payload)).body
+    assert FastJSONResponse(payload).body == previous
+
+    cases = {
+        "JSONResponse + jsonable_encoder": lambda: JSONResponse(jsonable_encoder(payload)),
+        "FastJSONResponse": lambda: FastJSONResponse(payload),
+    }
+    for name, case in cases.items():
+        seconds = min(timeit.repeat(case, number=args.runs, repeat=3)) / args.runs
+        print(f"{args.rows} filas, {name:<32} {seconds * 1000:8.1f} ms/respuesta")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,167 @@
+# Carga minima para el threadpool de BD (python bench/threadpool_load.py desde la raiz del repo).
+# Compara un handler "async def" que hace la consulta sincrona en el event loop (como antes) con
+# un handler "def" que FastAPI corre en el threadpool dimensionado por DB_THREADPOOL_SIZE.
+# Cada request hace una consulta de --query-ms sobre DATABASE_URL (pg_sleep en Postgres; en
+# SQLite se simula con time.sleep). Mientras tanto se mide la latencia de un /ping async: es lo
+# que sufre cualquier otro request cuando el event loop esta bloqueado. El servidor (uvicorn)
+# corre en otro proceso para que el cliente no compita con el por el GIL.
+import argparse
+import asyncio
+import multiprocessing
+import socket
+import statistics
+import sys
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import httpx  # noqa: E402
+import uvicorn  # noqa: E402
+from anyio import to_thread  # noqa: E402
+from fastapi import Depends, FastAPI  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from app.database import DB_THREADPOOL_SIZE, engine, get_db, session  # noqa: E402
+
+
+def _slow_query(db: Session, seconds: float):
+    if engine.dialect.name == "postgresql":
+        db.execute(text("SELECT pg_sleep(:seconds)"), {"seconds": seconds})
+    else:
+        time.sleep(seconds)
+        db.execute(text("SELECT 1"))
+
+
+def build_app(query_seconds: float, threads: int) -> FastAPI:
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        # Igual que configure_threadpool, pero con el tamano pedido por linea de comandos.
+        to_thread.current_default_thread_limiter().total_tokens = max(1, threads)
+        yield
+
+    app = FastAPI(lifespan=lifespan)
+
+    @app.get("/blocking")
+    async def blocking():
+        db = session()
+        try:
+            _slow_query(db, query_seconds)
+        finally:
+            db.close()
+        return {"ok": True}
+
+    @app.get("/threadpool")
+    def threadpool(db: Session = Depends(get_db)):
+        _slow_query(db, query_seconds)
+        return {"ok": True}
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    return app
+
+
+def _percentile(values: list[float], percent: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent))]
+
+
+def _serve(port: int, query_seconds: float, threads: int):
+    uvicorn.run(build_app(query_seconds, threads), host="127.0.0.1", port=port, log_level="warning")
+
+
+def start_server(query_seconds: float, threads: int) -> tuple[multiprocessing.Process, str]:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    process = multiprocessing.Process(target=_serve, args=(port, query_seconds, threads), daemon=True)
+    process.start()
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(200):
+        try:
+            httpx.get(f"{base_url}/ping")
+            break
+        except httpx.TransportError:
+            time.sleep(0.05)
+    return process, base_url
+
+
+async def run_case(base_url: str, path: str, *, requests: int, concurrency: int) -> dict:
+    limits = httpx.Limits(max_connections=concurrency + 1)
+    latencies: list[float] = []
+    ping_latencies: list[float] = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        async def one():
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get(path)
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    errors += 1
+
+        async def probe(done: asyncio.Event):
+            while not done.is_set():
+                started = time.perf_counter()
+                await client.get("/ping")
+                ping_latencies.append(time.perf_counter() - started)
+                await asyncio.sleep(0.01)
+
+        done = asyncio.Event()
+        prober = asyncio.create_task(probe(done))
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(requests)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await prober
+
+    return {
+        "req_s": requests / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": _percentile(latencies, 0.95) * 1000,
+        "ping_p95_ms": _percentile(ping_latencies, 0.95) * 1000 if ping_latencies else float("nan"),
+        "errors": errors,
+    }
+
+
+async def main_async(args, base_url: str) -> None:
+    print(
+        f"{args.requests} requests, concurrencia {args.concurrency}, consulta {args.query_ms} ms, "
+        f"{args.threads} hilos, BD {engine.dialect.name}"
+    )
+    cases = (("antes (async def bloqueante)", "/blocking"), ("despues (def + threadpool)", "/threadpool"))
+    for label, path in cases:
+        result = await run_case(base_url, path, requests=args.requests, concurrency=args.concurrency)
+        print(
+            f"{label:<30} {result['req_s']:8.1f} req/s  p50 {result['p50_ms']:7.1f} ms  "
+            f"p95 {result['p95_ms']:7.1f} ms  /ping p95 {result['ping_p95_ms']:7.1f} ms  "
+            f"errores {result['errors']}"
+        )
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Carga minima: event loop bloqueado vs threadpool")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--query-ms", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=DB_THREADPOOL_SIZE)
+    args = parser.parse_args(argv)
+
+    process, base_url = start_server(args.query_ms / 1000, args.threads)
+    try:
+        asyncio.run(main_async(args, base_url))
+    finally:
+        process.terminate()
+        process.join()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,58 @@
+# Micro-benchmark de la verificacion TOTP (python bench/totp_verify.py desde la raiz del repo).
+# Compara la implementacion anterior (decodifica y arma un HMAC por ventana) con
+# verify_totp_code y con un TotpVerifier reutilizado, como hace el registro de dispositivos.
+import argparse
+import hashlib
+import hmac
+import struct
+import sys
+import time
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.totp_utils import TotpVerifier, _decode_base32_secret, verify_totp_code  # noqa: E402
+
+SECRET = "JBSWY3DPEHPK3PXP"
+
+
+def _legacy_generate(secret: str, timestamp: int, period: int = 60, digits: int = 6) -> str:
+    key = _decode_base32_secret(secret)
+    digest = hmac.new(key, struct.pack(">Q", timestamp // period), hashlib.sha1).digest()
+    offset = digest[-1] & 0x0F
+    binary = int.from_bytes(digest[offset:offset + 4], "big") & 0x7FFFFFFF
+    return str(binary % (10**digits)).zfill(digits)
+
+
+def legacy_verify(secret: str, code: str, period: int = 60, valid_window: int = 1) -> bool:
+    now_ts = int(time.time())
+    for window in range(-valid_window, valid_window + 1):
+        expected = _legacy_generate(secret, now_ts + window * period, period)
+        if hmac.compare_digest(expected, code):
+            return True
+    return False
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Micro-benchmark de verificacion TOTP")
+    parser.add_argument("--runs", type=int, default=20000)
+    args = parser.parse_args(argv)
+
+    verifier = TotpVerifier.from_secret(SECRET)
+    # Un codigo que no coincide obliga a revisar las tres ventanas en todas las variantes.
+    code = "000000" if verifier.generate() != "000000" else "111111"
+
+    cases = {
+        "legacy verify": lambda: legacy_verify(SECRET, code),
+        "verify_totp_code": lambda: verify_totp_code(SECRET, code),
+        "TotpVerifier reutilizado": lambda: verifier.verify(code),
+    }
+    for name, case in cases.items():
+        seconds = min(timeit.repeat(case, number=args.runs, repeat=3))
+        print(f"{name:<26} {seconds / args.runs * 1e6:8.1f} us/verificacion")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -17,13 +17,14 @@ static const char* SECRET_BASE32 = "Q3VIRM3IWNOSJGJXLSMNOFZXULFGTHAK";
 static const int TOTP_DIGITS = 6;
 static const int TOTP_PERIOD = 60;
 static const unsigned long POLL_INTERVAL_MS = 1500;
+// Long-poll: el backend retiene la peticion hasta que haya un 2FA verificado (max 25 s).
+static const int NOTIFY_WAIT_SECONDS = 25;
 
 static const int BUZZER_PIN = 25; // Ajustar segun cableado.
 
 LiquidCrystal_I2C lcd(0x27, 16, 2);
 RTC_DS3231 rtc;
 
-unsigned long lastPollMs = 0;
 unsigned long lastRenderMs = 0;
 byte blockChar[8] = {
   B11111,
@@ -124,12 +125,9 @@ void beepTriple() {
   }
 }
 
-String notifyUrl() {
-  return String(BACKEND_BASE_URL) + "/device/notify?serial=" + String(DEVICE_SERIAL);
-}
-
-String ackUrl() {
-  return String(BACKEND_BASE_URL) + "/device/notify/ack?serial=" + String(DEVICE_SERIAL);
+String notifyWaitUrl() {
+  return String(BACKEND_BASE_URL) + "/device/notify/wait?serial=" + String(DEVICE_SERIAL) +
+         "&timeout=" + String(NOTIFY_WAIT_SECONDS);
 }
 
 String pingUrl() {
@@ -146,23 +144,29 @@ void sendPing() {
   http.end();
 }
 
-void checkNotify() {
-  if (WiFi.status() != WL_CONNECTED) return;
+bool waitNotify() {
+  if (WiFi.status() != WL_CONNECTED) return false;
 
   HTTPClient http;
-  http.begin(notifyUrl());
+  http.begin(notifyWaitUrl());
+  http.setTimeout((NOTIFY_WAIT_SECONDS + 10) * 1000);
   int status = http.GET();
   String body = status > 0 ? http.getString() : "";
   http.end();
 
+  // El backend ya marca el desafio como notificado al responder; no hace falta ack.
   if (status == 200 && body.indexOf("\"beep\":true") >= 0) {
     beepTriple();
+  }
+  return status == 200;
+}
 
-    HTTPClient ack;
-    ack.begin(ackUrl());
-    ack.addHeader("Content-Type", "application/json");
-    ack.POST("{}");
-    ack.end();
+// Tarea aparte: la espera bloqueante del long-poll no congela el refresco del LCD en loop().
+void notifyTask(void* param) {
+  for (;;) {
+    if (!waitNotify()) {
+      vTaskDelay(pdMS_TO_TICKS(POLL_INTERVAL_MS));
+    }
   }
 }
 
@@ -209,6 +213,8 @@ void setup() {
   connectWifi();
   sendPing();
   lcd.clear();
+
+  xTaskCreatePinnedToCore(notifyTask, "notify", 8192, NULL, 1, NULL, 0);
 }
 
 void loop() {
@@ -218,9 +224,4 @@ void loop() {
     lastRenderMs = nowMs;
     renderTotp();
   }
-
-  if (nowMs - lastPollMs >= POLL_INTERVAL_MS) {
-    lastPollMs = nowMs;
-    checkNotify();
-  }
 }
@@ -0,0 +1,38 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROJECT_ROOT))
+
+# app.database exige DATABASE_URL al importarse; los tests no tocan la BD real salvo los que
+# piden TEST_DATABASE_URL (Postgres) de forma explicita.
+os.environ.setdefault(
+    "DATABASE_URL", "sqlite:///" + os.path.join(tempfile.gettempdir(), "pw_backend_tests.db")
+)
+
+# Postgres vacio y desechable para los tests que necesitan el esquema real (particiones,
+# planes de consulta). Sin esta variable esos tests se omiten.
+TEST_DATABASE_URL = (os.getenv("TEST_DATABASE_URL") or "").strip()
+
+
+@pytest.fixture(scope="session")
+def postgres_url():
+    if not TEST_DATABASE_URL.startswith(("postgresql", "postgres://")):
+        pytest.skip("requiere TEST_DATABASE_URL apuntando a un Postgres desechable")
+
+    from alembic import command
+    from alembic.config import Config
+
+    database_url = TEST_DATABASE_URL
+    if database_url.startswith("postgres://"):
+        database_url = "postgresql://" + database_url[len("postgres://"):]
+
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        # alembic/env.py toma la URL de DATABASE_URL.
+        monkeypatch.setenv("DATABASE_URL", database_url)
+        command.upgrade(Config(str(PROJECT_ROOT / "alembic.ini")), "head")
+    return database_url
@@ -0,0 +1,83 @@
+import uuid
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import auth
+from app.auth import create_user_access_token
+from app.database import Base, get_db, get_read_db
+from app.models import User, UserRole
+from app.routers import admin, expenses
+
+
+@pytest.fixture
+def auth_env(monkeypatch):
+    # BD SQLite en memoria con un owner verificado; las rutas usan la resolucion real del token.
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    test_session = sessionmaker(bind=engine)
+    with test_session() as db:
+        user = User(
+            id=uuid.uuid4(),
+            full_name="Owner",
+            email=f"owner-{uuid.uuid4().hex[:8]}@example.com",
+            password_hash="x",
+            role=UserRole.owner,
+            is_active=True,
+            email_verified=True,
+            token_epoch=0,
+        )
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+        db.expunge(user)
+
+    def override_db():
+        db = test_session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app = FastAPI()
+    app.include_router(expenses.router)
+    app.include_router(admin.router)
+    app.dependency_overrides[get_db] = override_db
+    app.dependency_overrides[get_read_db] = override_db
+    monkeypatch.setattr(auth, "TWO_FACTOR_REQUIRED", True)
+
+    yield TestClient(app), user
+    engine.dispose()
+
+
+def _get(client: TestClient, path: str, token: str):
+    return client.get(path, headers={"Authorization": f"Bearer {token}"})
+
+
+@pytest.mark.parametrize("path", ["/expenses/", "/admin/"])
+def test_full_stage_token_is_accepted(auth_env, path):
+    client, user = auth_env
+
+    assert _get(client, path, create_user_access_token(user, stage="FULL")).status_code == 200
+
+
+@pytest.mark.parametrize("path, status_code", [("/expenses/", 401), ("/admin/", 403)])
+def test_partial_stage_token_is_rejected(auth_env, path, status_code):
+    # El tmp_token del login (stage PWD_OK) ya no abre las rutas de egresos, chatbot ni admin.
+    client, user = auth_env
+
+    assert _get(client, path, create_user_access_token(user, stage="PWD_OK")).status_code == status_code
+
+
+def test_token_without_stage_depends_on_two_factor_setting(auth_env, monkeypatch):
+    client, user = auth_env
+    token = create_user_access_token(user)
+
+    assert _get(client, "/expenses/", token).status_code == 401
+    monkeypatch.setattr(auth, "TWO_FACTOR_REQUIRED", False)
+    assert _get(client, "/expenses/", token).status_code == 200
+    assert _get(client, "/expenses/", create_user_access_token(user, stage="PWD_OK")).status_code == 401
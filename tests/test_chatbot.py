@@ -0,0 +1,242 @@
+import json
+import uuid
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.auth import get_current_user
+from app.conversation_store import (
+    CHAT_HISTORY_TOKEN_BUDGET,
+    InMemoryConversationStore,
+    estimate_tokens,
+    truncate_history,
+)
+from app.database import get_db
+from app.models import User
+from app.routers import chatbot
+
+
+class StubResponse:
+    def __init__(self, text: str):
+        self.text = text
+        self.candidates = []
+
+
+class StubCandidate:
+    def __init__(self, finish_reason):
+        self.finish_reason = finish_reason
+
+
+class StubStreamResponse:
+    # Como la respuesta con stream=True de genai: se itera con async for y expone candidates.
+    # Un Exception entre los chunks se lanza al llegar a el, como un corte a mitad del stream.
+
+    def __init__(self, chunks: list, finish_reason=None):
+        self._chunks = chunks
+        self.candidates = [StubCandidate(finish_reason)] if finish_reason else []
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for chunk in self._chunks:
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield StubResponse(chunk)
+
+
+class StubChatSession:
+    def __init__(self, model: "StubModel", history: list[dict]):
+        self.model = model
+        self.history = history
+
+    async def send_message_async(self, message, generation_config=None, stream=False):
+        self.model.messages.append(message)
+        if stream:
+            if self.model.stream_replies:
+                return StubStreamResponse(*self.model.stream_replies.pop(0))
+            return StubStreamResponse([f"respuesta {len(self.model.messages)}"])
+        return StubResponse(f"respuesta {len(self.model.messages)}")
+
+
+class StubModel:
+    # Reemplaza a genai.GenerativeModel: no sale a la red y guarda lo que recibe.
+
+    def __init__(self, system_instruction: str):
+        self.system_instruction = system_instruction
+        self.sessions: list[StubChatSession] = []
+        self.messages: list[str] = []
+        # Respuestas con stream=True en orden: (chunks, finish_reason).
+        self.stream_replies: list[tuple[list, object]] = []
+
+    def start_chat(self, history):
+        chat_session = StubChatSession(self, history)
+        self.sessions.append(chat_session)
+        return chat_session
+
+
+@pytest.fixture
+def chat_env(monkeypatch):
+    built: list[StubModel] = []
+    contexts = {"value": ("contexto A", "hash-a")}
+    stream_replies: list[tuple[list, object]] = []
+
+    def build_model(system_instruction):
+        model = StubModel(system_instruction)
+        model.stream_replies = stream_replies
+        built.append(model)
+        return model
+
+    store = InMemoryConversationStore(max_entries=100, ttl_seconds=900)
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    monkeypatch.setattr(chatbot.genai, "configure", lambda **kwargs: None)
+    monkeypatch.setattr(chatbot, "_build_model", build_model)
+    monkeypatch.setattr(chatbot, "_load_user_context", lambda user, db: contexts["value"])
+    monkeypatch.setattr(chatbot, "conversation_store", store)
+    monkeypatch.setattr(chatbot, "_model_cache", chatbot.OrderedDict())
+
+    user = User(id=uuid.uuid4(), email="chat@example.com", full_name="Chat")
+    app = FastAPI()
+    app.include_router(chatbot.router)
+    app.dependency_overrides[get_current_user] = lambda: user
+    app.dependency_overrides[get_db] = lambda: None
+
+    return SimpleNamespace(
+        client=TestClient(app),
+        built=built,
+        contexts=contexts,
+        store=store,
+        user=user,
+        stream_replies=stream_replies,
+    )
+
+
+def _sse_events(body: str) -> list[tuple[str, dict]]:
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_model_is_reused_for_same_context(chat_env):
+    assert chat_env.client.post("/chat/", json={"message": "hola"}).json() == {"text": "respuesta 1"}
+    assert chat_env.client.post("/chat/", json={"message": "y ahora?"}).status_code == 200
+    assert len(chat_env.built) == 1
+
+    chat_env.contexts["value"] = ("contexto B", "hash-b")
+    assert chat_env.client.post("/chat/", json={"message": "cambio"}).status_code == 200
+    assert len(chat_env.built) == 2
+    assert chat_env.built[1].system_instruction == "contexto B"
+
+
+def test_history_is_carried_between_turns(chat_env):
+    chat_env.client.post("/chat/", json={"message": "primera"})
+    chat_env.client.post("/chat/", json={"message": "segunda"})
+
+    first_session, second_session = chat_env.built[0].sessions
+    assert first_session.history == []
+    assert second_session.history == [
+        {"role": "user", "parts": ["primera"]},
+        {"role": "model", "parts": ["respuesta 1"]},
+    ]
+
+
+def test_history_is_truncated_to_token_budget(chat_env):
+    # ~500 tokens por mensaje: el presupuesto se supera en pocas vueltas.
+    messages = [f"{index}" + "x" * 1999 for index in range(6)]
+
+    for message in messages:
+        assert chat_env.client.post("/chat/", json={"message": message}).status_code == 200
+
+    history = chat_env.store.get(chat_env.user.id)["history"]
+    used = sum(estimate_tokens(turn["text"]) for turn in history)
+    assert used <= CHAT_HISTORY_TOKEN_BUDGET
+    assert len(history) < 2 * len(messages)
+    assert history[0]["role"] == "user"
+    assert history[-2]["text"] == messages[-1]
+
+    # La siguiente vuelta arranca con el historial ya truncado.
+    chat_env.client.post("/chat/", json={"message": "fin"})
+    assert len(chat_env.built[0].sessions[-1].history) == len(history)
+
+
+def test_stream_emits_tokens_then_done_and_saves_history(chat_env):
+    chat_env.stream_replies.append((["Hola", " mundo"], None))
+
+    response = chat_env.client.post("/chat/stream", json={"message": "pregunta"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert _sse_events(response.text) == [
+        ("token", {"text": "Hola"}),
+        ("token", {"text": " mundo"}),
+        ("done", {}),
+    ]
+    assert chat_env.store.get(chat_env.user.id)["history"] == [
+        {"role": "user", "text": "pregunta"},
+        {"role": "model", "text": "Hola mundo"},
+    ]
+
+
+def test_stream_continues_after_max_tokens(chat_env):
+    chat_env.stream_replies.extend([(["respuesta cortada"], "MAX_TOKENS"), (["y cierre."], None)])
+
+    response = chat_env.client.post("/chat/stream", json={"message": "pregunta"})
+
+    assert _sse_events(response.text) == [
+        ("token", {"text": "respuesta cortada"}),
+        ("token", {"text": "\n"}),
+        ("token", {"text": "y cierre."}),
+        ("done", {}),
+    ]
+    assert chat_env.built[0].messages == ["pregunta", chatbot.CONTINUATION_PROMPT]
+    history = chat_env.store.get(chat_env.user.id)["history"]
+    assert history[-1] == {"role": "model", "text": "respuesta cortada\ny cierre."}
+
+
+def test_stream_error_emits_error_event_without_saving(chat_env):
+    chat_env.stream_replies.append((["parcial", RuntimeError("corte del modelo")], None))
+
+    response = chat_env.client.post("/chat/stream", json={"message": "pregunta"})
+
+    assert response.status_code == 200
+    assert _sse_events(response.text) == [
+        ("token", {"text": "parcial"}),
+        ("error", {"detail": "Error generando respuesta"}),
+    ]
+    assert chat_env.store.get(chat_env.user.id) is None
+
+
+def test_truncate_history_keeps_recent_pairs():
+    history = []
+    for index in range(4):
+        history.append({"role": "user", "text": f"pregunta {index} " + "x" * 40})
+        history.append({"role": "model", "text": f"respuesta {index} " + "y" * 40})
+
+    kept = truncate_history(history, token_budget=50)
+
+    assert kept == history[-4:]
+    assert truncate_history(history, token_budget=1) == []
+
+
+def test_memory_store_expires_by_entry_ttl(monkeypatch):
+    clock = {"now": 0.0}
+    monkeypatch.setattr("app.conversation_store.time.monotonic", lambda: clock["now"])
+    store = InMemoryConversationStore(max_entries=10, ttl_seconds=900)
+    first, second = uuid.uuid4(), uuid.uuid4()
+
+    store.save(first, history=[{"role": "user", "text": "a"}])
+    clock["now"] = 800
+    store.save(second, history=[{"role": "user", "text": "b"}])
+    clock["now"] = 850
+    assert store.get(first) is not None
+
+    # La lectura renueva el TTL de la entrada.
+    clock["now"] = 1750
+    assert store.get(first) is not None
+    assert store.get(second) is None
+    clock["now"] = 2651
+    assert store.get(first) is None
@@ -0,0 +1,232 @@
+import uuid
+from decimal import Decimal
+from types import SimpleNamespace
+
+import orjson
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+from app.auth import get_current_user
+from app.category_index import CategoryIndex
+from app.database import get_db
+from app.expense_rollup import verify_rollup
+from app.models import Category, Expense, ExpenseMonthlyRollup, User
+from app.routers import expenses
+
+CSV_HEADER = "amount,expense_date,description,category_name\r\n"
+
+
+@pytest.fixture(scope="module")
+def test_session(postgres_url):
+    engine = create_engine(postgres_url)
+    yield sessionmaker(bind=engine)
+    engine.dispose()
+
+
+@pytest.fixture
+def import_env(test_session, monkeypatch):
+    # El endpoint real contra el Postgres de pruebas, con un usuario nuevo por test. Las
+    # categorias llevan un sufijo propio para no chocar con las de otros tests.
+    monkeypatch.setattr(expenses, "category_index", CategoryIndex(max_entries=100))
+    monkeypatch.setattr("app.category_index.category_index", expenses.category_index)
+
+    db = test_session()
+    user = User(
+        id=uuid.uuid4(),
+        full_name="Import",
+        email=f"import-{uuid.uuid4().hex[:8]}@example.com",
+        password_hash="x",
+    )
+    db.add(user)
+    db.commit()
+
+    def override_db():
+        request_db = test_session()
+        try:
+            yield request_db
+        finally:
+            request_db.close()
+
+    app = FastAPI()
+    app.include_router(expenses.router)
+    app.dependency_overrides[get_current_user] = lambda: user
+    app.dependency_overrides[get_db] = override_db
+
+    yield SimpleNamespace(client=TestClient(app), db=db, user=user, suffix=uuid.uuid4().hex[:6])
+    db.close()
+
+
+def _post(env, filename: str, content: str, **params):
+    return env.client.post(
+        "/expenses/import",
+        params=params,
+        files={"file": (filename, content.encode("utf-8"), "application/octet-stream")},
+    )
+
+
+def _user_expenses(env) -> list[Expense]:
+    env.db.expire_all()
+    return env.db.scalars(
+        select(Expense).where(Expense.user_id == env.user.id).order_by(Expense.expense_date)
+    ).all()
+
+
+def _ndjson(*rows) -> str:
+    return "".join(
+        (row if isinstance(row, str) else orjson.dumps(row).decode()) + "\n" for row in rows
+    )
+
+
+def test_csv_with_bom_and_quoted_newlines(import_env):
+    category = f"Comida {import_env.suffix}"
+    content = (
+        "﻿"
+        + CSV_HEADER
+        + f'12.50,2026-09-01,"linea uno\nlinea dos",{category}\r\n'
+        + "\r\n"
+        + f"3,2026-09-02,simple,{category}\r\n"
+    )
+
+    response = _post(import_env, "gastos.csv", content)
+
+    assert response.status_code == 200
+    assert response.json()["data"] == {
+        "processed": 2,
+        "imported": 2,
+        "valid": 2,
+        "rejected": 0,
+        "errors": [],
+        "errors_truncated": False,
+    }
+    rows = _user_expenses(import_env)
+    assert [row.description for row in rows] == ["linea uno\nlinea dos", "simple"]
+    assert [row.amount for row in rows] == [Decimal("12.50"), Decimal("3.00")]
+
+
+def test_csv_missing_header_is_rejected(import_env):
+    response = _post(import_env, "gastos.csv", "amount,expense_date,description\r\n10,2026-09-01,x\r\n")
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Faltan columnas en el CSV: category_name"
+    assert _user_expenses(import_env) == []
+
+
+def test_ndjson_bad_lines_are_reported(import_env):
+    category = f"Ocio {import_env.suffix}"
+    content = _ndjson(
+        {"amount": "5", "expense_date": "2026-08-10", "description": "cine", "category_name": category},
+        "{no es json",
+        {"amount": "-1", "expense_date": "2026-08-10", "description": "x", "category_name": category},
+        "[1, 2]",
+        {"amount": "5", "expense_date": "2026-08-10", "description": "   ", "category_name": category},
+    )
+
+    response = _post(import_env, "gastos.ndjson", content)
+
+    data = response.json()["data"]
+    assert (data["processed"], data["imported"], data["rejected"]) == (5, 1, 4)
+    assert [error["line"] for error in data["errors"]] == [2, 3, 4, 5]
+    assert data["errors"][0]["errors"] == [{"field": "-", "msg": "La fila debe ser un objeto JSON valido"}]
+    assert data["errors"][1]["errors"][0]["field"] == "amount"
+    assert data["errors"][3]["errors"] == [{"field": "description", "msg": "Descripcion invalida"}]
+    assert len(_user_expenses(import_env)) == 1
+
+
+def test_error_report_is_capped(import_env, monkeypatch):
+    monkeypatch.setattr(expenses, "EXPENSES_IMPORT_MAX_ERRORS", 2)
+
+    response = _post(import_env, "gastos.ndjson", _ndjson(*["{roto"] * 5))
+
+    data = response.json()["data"]
+    assert data["rejected"] == 5
+    assert [error["line"] for error in data["errors"]] == [1, 2]
+    assert data["errors_truncated"] is True
+
+
+def test_dry_run_validates_without_writing(import_env):
+    category = f"Hogar {import_env.suffix}"
+    content = CSV_HEADER + f"10,2026-09-01,luz,{category}\r\n" + "abc,2026-09-01,agua,x\r\n"
+
+    response = _post(import_env, "gastos.csv", content, dry_run="true")
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["msg"] == "Validacion completada"
+    assert (body["data"]["valid"], body["data"]["imported"], body["data"]["rejected"]) == (1, 0, 1)
+    assert _user_expenses(import_env) == []
+    import_env.db.expire_all()
+    assert import_env.db.scalar(select(Category.id).where(Category.name == category)) is None
+
+
+def test_row_limit_rolls_back_earlier_batches(import_env, monkeypatch):
+    monkeypatch.setattr(expenses, "EXPENSES_IMPORT_MAX_ROWS", 3)
+    monkeypatch.setattr(expenses, "EXPENSES_IMPORT_BATCH_SIZE", 2)
+    category = f"Limite {import_env.suffix}"
+    content = CSV_HEADER + "".join(f"{n},2026-09-0{n},fila {n},{category}\r\n" for n in range(1, 6))
+
+    response = _post(import_env, "gastos.csv", content)
+
+    assert response.status_code == 413
+    assert _user_expenses(import_env) == []
+    rollup_rows = select(func.count()).select_from(ExpenseMonthlyRollup).where(
+        ExpenseMonthlyRollup.user_id == import_env.user.id
+    )
+    assert import_env.db.scalar(rollup_rows) == 0
+    assert import_env.db.scalar(select(Category.id).where(Category.name == category)) is None
+
+
+def test_categories_resolve_case_insensitively(import_env):
+    existing = Category(id=uuid.uuid4(), name=f"Transporte {import_env.suffix}")
+    import_env.db.add(existing)
+    import_env.db.commit()
+    new_name = f"Viajes {import_env.suffix}"
+    content = _ndjson(
+        {"amount": "1", "expense_date": "2026-09-01", "description": "a", "category_name": existing.name.upper()},
+        {"amount": "2", "expense_date": "2026-09-02", "description": "b", "category_name": f"  {existing.name}  "},
+        {"amount": "3", "expense_date": "2026-09-03", "description": "c", "category_name": new_name},
+        {"amount": "4", "expense_date": "2026-09-04", "description": "d", "category_name": new_name.lower()},
+    )
+
+    assert _post(import_env, "gastos.ndjson", content).status_code == 200
+
+    rows = _user_expenses(import_env)
+    assert rows[0].category_id == rows[1].category_id == existing.id
+    created = import_env.db.scalars(
+        select(Category).where(func.lower(Category.name) == new_name.lower())
+    ).all()
+    assert [category.name for category in created] == [new_name]
+    assert rows[2].category_id == rows[3].category_id == created[0].id
+
+
+def test_rollup_matches_imported_rows(import_env, monkeypatch):
+    monkeypatch.setattr(expenses, "EXPENSES_IMPORT_BATCH_SIZE", 2)
+    food, rent = f"Comida {import_env.suffix}", f"Alquiler {import_env.suffix}"
+    content = CSV_HEADER + "".join(
+        f"{amount},{day},fila,{category}\r\n"
+        for amount, day, category in (
+            ("10.10", "2026-07-05", food),
+            ("0.01", "2026-07-20", food),
+            ("500", "2026-07-01", rent),
+            ("20.20", "2026-08-05", food),
+            ("500", "2026-08-01", rent),
+        )
+    )
+
+    assert _post(import_env, "gastos.csv", content).json()["data"]["imported"] == 5
+
+    import_env.db.expire_all()
+    assert verify_rollup(import_env.db, import_env.user.id) == []
+    rollup = {
+        (row.year, row.month, row.category_id): (row.total, row.count)
+        for row in import_env.db.scalars(
+            select(ExpenseMonthlyRollup).where(ExpenseMonthlyRollup.user_id == import_env.user.id)
+        )
+    }
+    food_id = import_env.db.scalar(select(Category.id).where(Category.name == food))
+    assert rollup[(2026, 7, food_id)] == (Decimal("10.11"), 2)
+    assert rollup[(2026, 8, food_id)] == (Decimal("20.20"), 1)
+    assert sum(count for _total, count in rollup.values()) == 5
+    assert import_env.db.scalar(select(User.expense_version).where(User.id == import_env.user.id)) == 1
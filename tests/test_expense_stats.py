@@ -0,0 +1,121 @@
+import random
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import create_engine, extract, func
+from sqlalchemy.orm import Session
+
+from app.expense_rollup import record_expense_added
+from app.expense_stats import compute_expense_stats
+from app.models import Category, Expense, User
+
+
+def _legacy_expense_stats(db: Session, user_id, year=None, month=None):
+    # Las cuatro consultas de /expenses/stats antes de compute_expense_stats, sobre expense.
+    def filtered(query):
+        query = query.filter(Expense.user_id == user_id)
+        if year:
+            query = query.filter(extract("year", Expense.expense_date) == year)
+        if month:
+            query = query.filter(extract("month", Expense.expense_date) == month)
+        return query
+
+    month_expr = extract("month", Expense.expense_date)
+    total = filtered(db.query(func.coalesce(func.sum(Expense.amount), 0))).scalar()
+    monthly = (
+        filtered(db.query(month_expr.label("month"), func.sum(Expense.amount).label("total")))
+        .group_by("month")
+        .order_by("month")
+        .all()
+    )
+    by_category = (
+        filtered(
+            db.query(Category.name.label("category"), func.sum(Expense.amount).label("total")).join(
+                Expense, Expense.category_id == Category.id
+            )
+        )
+        .group_by(Category.name)
+        .all()
+    )
+    monthly_by_category = (
+        filtered(
+            db.query(
+                month_expr.label("month"),
+                Category.name.label("category"),
+                func.sum(Expense.amount).label("total"),
+            ).join(Category, Expense.category_id == Category.id)
+        )
+        .group_by("month", Category.name)
+        .all()
+    )
+    return {
+        "total": float(total or 0),
+        "monthly": [{"month": int(row.month), "total": float(row.total)} for row in monthly],
+        "by_category": [{"category": row.category, "total": float(row.total)} for row in by_category],
+        "monthly_by_category": [
+            {"month": int(row.month), "category": row.category, "total": float(row.total)}
+            for row in monthly_by_category
+        ],
+    }
+
+
+def _comparable(stats: dict) -> dict:
+    # El orden de by_category ante empates y el de categorias dentro de un mes no estaba definido.
+    return {
+        "total": stats["total"],
+        "monthly": stats["monthly"],
+        "by_category": sorted(stats["by_category"], key=lambda item: item["category"]),
+        "monthly_by_category": sorted(
+            stats["monthly_by_category"], key=lambda item: (item["month"], item["category"])
+        ),
+    }
+
+
+@pytest.fixture(scope="module")
+def seeded(postgres_url):
+    engine = create_engine(postgres_url)
+    rng = random.Random(6)
+    suffix = uuid.uuid4().hex[:6]
+    with Session(engine) as db:
+        user = User(
+            id=uuid.uuid4(),
+            full_name="Stats",
+            email=f"stats-{suffix}@example.com",
+            password_hash="x",
+        )
+        categories = [Category(id=uuid.uuid4(), name=f"Stats {suffix} {index}") for index in range(6)]
+        db.add_all([user, *categories])
+        db.flush()
+        start = datetime(2024, 11, 1)
+        # Egresos por el camino de los handlers (expense + delta de rollup en la misma transaccion).
+        for _ in range(400):
+            expense = Expense(
+                id=uuid.uuid4(),
+                user_id=user.id,
+                category_id=rng.choice(categories).id,
+                amount=Decimal(rng.randint(1, 99999)) / 100,
+                expense_date=start + timedelta(hours=rng.randint(0, 24 * 540)),
+                description="stats",
+            )
+            db.add(expense)
+            record_expense_added(db, expense)
+        db.commit()
+        yield db, user.id
+    engine.dispose()
+
+
+@pytest.mark.parametrize(
+    ("year", "month"),
+    [(None, None), (2025, None), (2025, 3), (None, 12), (2024, 11), (2031, None)],
+)
+def test_grouped_stats_match_legacy_queries(seeded, year, month):
+    db, user_id = seeded
+
+    current = compute_expense_stats(db, user_id, year=year, month=month)
+    legacy = _legacy_expense_stats(db, user_id, year=year, month=month)
+
+    assert _comparable(current) == _comparable(legacy)
+    totals = [item["total"] for item in current["by_category"]]
+    assert totals == sorted(totals, reverse=True)
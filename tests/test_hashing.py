@@ -0,0 +1,24 @@
+import os
+import signal
+
+import pytest
+
+from app.hashing import PasswordHashingPool
+
+
+@pytest.fixture
+def pool():
+    hashing_pool = PasswordHashingPool(workers=1, max_pending=2)
+    yield hashing_pool
+    hashing_pool.shutdown()
+
+
+@pytest.mark.skipif(not hasattr(signal, "SIGKILL"), reason="requiere SIGKILL")
+def test_broken_pool_is_replaced_and_call_retried(pool):
+    password_hash = pool.hash("Secreta!123")
+    for pid in list(pool._executor._processes):
+        os.kill(pid, signal.SIGKILL)
+
+    assert pool.verify("Secreta!123", password_hash) is True
+    assert pool.stats()["restarts"] == 1
+    assert pool.stats()["in_flight"] == 0
@@ -0,0 +1,58 @@
+import datetime
+import uuid
+from decimal import Decimal
+
+import pytest
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.json_response import FastJSONResponse, dumps_json
+from app.models import UserRole
+
+NOW = datetime.datetime(2026, 1, 5, 10, 11, 12, 123456)
+
+
+def _expense_row(**overrides) -> dict:
+    row = {
+        "id": uuid.UUID("6f1d2c3b-4a5e-4f60-8172-9a8b7c6d5e4f"),
+        "user_id": uuid.uuid4(),
+        "category_id": uuid.uuid4(),
+        "category_name": "Educación",
+        "amount": Decimal("12.50"),
+        "expense_date": NOW.replace(microsecond=0),
+        "description": "pensión \"marzo\"",
+        "created_at": NOW,
+        "updated_at": None,
+    }
+    row.update(overrides)
+    return row
+
+
+PAYLOADS = {
+    "expense_list": {
+        "msg": "",
+        "data": [_expense_row(), _expense_row(amount=Decimal("1000.00"))],
+        "next_cursor": None,
+    },
+    "aware_datetime": {"at": NOW.replace(tzinfo=datetime.timezone.utc)},
+    "date_and_enum": {"day": NOW.date(), "role": UserRole.auditor, "roles": [UserRole.owner]},
+    "nested": {"data": {"items": [{"total": Decimal("0.10"), "ids": [uuid.uuid4()]}], "empty": []}},
+}
+
+
+@pytest.mark.parametrize("payload", PAYLOADS.values(), ids=PAYLOADS.keys())
+def test_fast_response_matches_previous_encoding(payload):
+    # Antes: JSONResponse sobre jsonable_encoder (el camino por defecto de FastAPI).
+    previous = JSONResponse(jsonable_encoder(payload)).body
+
+    assert FastJSONResponse(payload).body == previous
+
+
+def test_decimal_is_emitted_as_number():
+    assert dumps_json({"amount": Decimal("12.50")}) == b'{"amount":12.5}'
+    assert dumps_json({"amount": Decimal("-0.01")}) == b'{"amount":-0.01}'
+
+
+def test_unsupported_type_still_fails():
+    with pytest.raises(TypeError):
+        dumps_json({"value": object()})
@@ -0,0 +1,128 @@
+import uuid
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+from app.log_partitions import (
+    PARTITIONED_LOG_TABLES,
+    create_partition,
+    list_partitions,
+    maintain_log_partitions,
+    maintain_table,
+)
+
+TODAY = date(2026, 10, 17)
+
+
+@pytest.fixture
+def engine(postgres_url):
+    engine = create_engine(postgres_url)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def scratch_log(engine):
+    # Tabla particionada propia con la misma forma que los logs (RANGE por created_at + DEFAULT),
+    # para no tocar las particiones de access_log/admin_audit_log que usan otros tests.
+    table_name = f"scratch_log_{uuid.uuid4().hex[:8]}"
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                f'CREATE TABLE "{table_name}" (id uuid NOT NULL, created_at timestamp NOT NULL) '
+                "PARTITION BY RANGE (created_at)"
+            )
+        )
+        conn.execute(text(f'CREATE TABLE "{table_name}_pdefault" PARTITION OF "{table_name}" DEFAULT'))
+
+    db = Session(engine)
+    yield db, table_name
+    db.close()
+
+    with engine.begin() as conn:
+        conn.execute(text(f'DROP TABLE "{table_name}"'))
+        # Las particiones separadas (detach) quedan como tablas sueltas.
+        leftovers = conn.execute(
+            text("SELECT relname FROM pg_class WHERE relkind = 'r' AND relname LIKE :prefix"),
+            {"prefix": f"{table_name}_p%"},
+        ).scalars()
+        for name in list(leftovers):
+            conn.execute(text(f'DROP TABLE "{name}"'))
+
+
+def _insert_rows(db: Session, table_name: str, *timestamps: datetime):
+    for created_at in timestamps:
+        db.execute(
+            text(f'INSERT INTO "{table_name}" (id, created_at) VALUES (:id, :created_at)'),
+            {"id": uuid.uuid4(), "created_at": created_at},
+        )
+    db.commit()
+
+
+def _count(db: Session, relation: str) -> int:
+    return db.execute(text(f'SELECT count(*) FROM "{relation}"')).scalar_one()
+
+
+def test_creates_months_ahead_and_moves_default_rows(scratch_log):
+    db, table_name = scratch_log
+    _insert_rows(db, table_name, datetime(2026, 10, 1), datetime(2026, 10, 16, 23, 59))
+
+    report = maintain_table(
+        db, table_name, today=TODAY, months_ahead=2, retention_months=0, action="detach"
+    )
+
+    assert report == {
+        "created": [f"{table_name}_p202610", f"{table_name}_p202611", f"{table_name}_p202612"],
+        "removed": [],
+    }
+    assert sorted(list_partitions(db, table_name)) == [date(2026, 10, 1), date(2026, 11, 1), date(2026, 12, 1)]
+    assert _count(db, f"{table_name}_pdefault") == 0
+    assert _count(db, f"{table_name}_p202610") == 2
+
+
+def test_old_default_rows_are_adopted_then_retired(scratch_log):
+    db, table_name = scratch_log
+    _insert_rows(db, table_name, datetime(2024, 1, 5), datetime(2024, 1, 20), datetime(2026, 9, 30))
+
+    report = maintain_table(
+        db, table_name, today=TODAY, months_ahead=0, retention_months=12, action="drop"
+    )
+
+    assert report["created"] == [f"{table_name}_p202401", f"{table_name}_p202609", f"{table_name}_p202610"]
+    assert report["removed"] == [f"{table_name}_p202401"]
+    assert _count(db, f"{table_name}_pdefault") == 0
+    assert _count(db, table_name) == 1
+    assert db.execute(text("SELECT to_regclass(:name)"), {"name": f"{table_name}_p202401"}).scalar() is None
+
+
+def test_create_partition_locks_default_until_commit(scratch_log, engine):
+    db, table_name = scratch_log
+    _insert_rows(db, table_name, datetime(2026, 10, 3))
+
+    assert create_partition(db, table_name, date(2026, 10, 1)) == 1
+    pid = db.execute(text("SELECT pg_backend_pid()")).scalar_one()
+    with engine.connect() as observer:
+        modes = set(
+            observer.execute(
+                text(
+                    "SELECT mode FROM pg_locks "
+                    "WHERE pid = :pid AND relation = to_regclass(:name) AND granted"
+                ),
+                {"pid": pid, "name": f"{table_name}_pdefault"},
+            ).scalars()
+        )
+    db.commit()
+
+    assert "ShareRowExclusiveLock" in modes
+
+
+def test_dry_run_on_migrated_log_tables_changes_nothing(engine):
+    with Session(engine) as db:
+        before = {table_name: list_partitions(db, table_name) for table_name in PARTITIONED_LOG_TABLES}
+        report = maintain_log_partitions(db, today=TODAY, months_ahead=6, dry_run=True)
+        after = {table_name: list_partitions(db, table_name) for table_name in PARTITIONED_LOG_TABLES}
+
+    assert set(report) == set(PARTITIONED_LOG_TABLES)
+    assert after == before
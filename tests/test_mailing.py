@@ -0,0 +1,194 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from app.mailing import RESEND_API_URL, MailDeliveryQueue, MailTransport, OutgoingEmail
+
+
+class FakeSmtpServer:
+    # Servidor SMTP minimo en 127.0.0.1: anuncia AUTH, acepta todo y guarda los DATA recibidos.
+
+    def __init__(self):
+        self.messages: list[bytes] = []
+        self.connections = 0
+        self._writers: list[asyncio.StreamWriter] = []
+        self._server: asyncio.AbstractServer | None = None
+        self.port = 0
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.drop_connections()
+        self._server.close()
+        await self._server.wait_closed()
+
+    def drop_connections(self):
+        # Simula al servidor cerrando conexiones ociosas.
+        for writer in self._writers:
+            writer.close()
+        self._writers.clear()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        self._writers.append(writer)
+        writer.write(b"220 fake ESMTP\r\n")
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line.decode().strip().upper()
+                if command.startswith("EHLO"):
+                    writer.write(b"250-fake\r\n250 AUTH PLAIN LOGIN\r\n")
+                elif command.startswith("AUTH"):
+                    writer.write(b"235 2.7.0 Authentication successful\r\n")
+                elif command == "DATA":
+                    writer.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+                    await writer.drain()
+                    data = b""
+                    while not data.endswith(b"\r\n.\r\n"):
+                        chunk = await reader.readline()
+                        if not chunk:
+                            return
+                        data += chunk
+                    self.messages.append(data)
+                    writer.write(b"250 OK queued\r\n")
+                elif command == "QUIT":
+                    writer.write(b"221 Bye\r\n")
+                    await writer.drain()
+                    break
+                else:
+                    writer.write(b"250 OK\r\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+def _message(recipient: str) -> OutgoingEmail:
+    return OutgoingEmail(subject="Prueba", recipients=(recipient,), html_body="<p>hola</p>")
+
+
+def _queue(transport: MailTransport, **overrides) -> MailDeliveryQueue:
+    options = {
+        "workers": 1,
+        "max_size": 100,
+        "batch_size": 10,
+        "linger_ms": 50,
+        "max_retries": 2,
+        "retry_base_ms": 10,
+    }
+    options.update(overrides)
+    return MailDeliveryQueue(transport, **options)
+
+
+def _resend_transport(handler) -> MailTransport:
+    transport = MailTransport()
+    transport._http_client = httpx.AsyncClient(base_url=RESEND_API_URL, transport=httpx.MockTransport(handler))
+    return transport
+
+
+@pytest.fixture
+def resend_env(monkeypatch):
+    monkeypatch.setenv("RESEND_API_KEY", "re_test")
+    monkeypatch.setenv("MAIL_FROM", "no-reply@example.com")
+
+
+@pytest.fixture
+def smtp_env(monkeypatch):
+    monkeypatch.delenv("RESEND_API_KEY", raising=False)
+    monkeypatch.delenv("MAIL_PROVIDER", raising=False)
+    monkeypatch.setenv("SENDER_EMAIL", "sender@example.com")
+    monkeypatch.setenv("SENDER_PASSWORD", "secret")
+    monkeypatch.setenv("MAIL_SERVER", "127.0.0.1")
+    monkeypatch.setenv("MAIL_STARTTLS", "false")
+    monkeypatch.setenv("MAIL_SSL_TLS", "false")
+    monkeypatch.setenv("MAIL_VALIDATE_CERTS", "false")
+    return monkeypatch
+
+
+def test_rejected_batch_is_resent_one_by_one(resend_env):
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        payload = json.loads(request.content)
+        calls.append((request.url.path, payload))
+        if request.url.path == "/emails/batch":
+            return httpx.Response(422, json={"message": "Invalid `to` field"})
+        if payload["to"] == ["invalido@"]:
+            return httpx.Response(422, json={"message": "Invalid `to` field"})
+        return httpx.Response(200, json={"id": "email-id"})
+
+    async def scenario():
+        transport = _resend_transport(handler)
+        queue = _queue(transport)
+        await queue.start()
+        for recipient in ("a@example.com", "invalido@", "b@example.com"):
+            await queue.enqueue(subject="Prueba", recipients=[recipient], html_body="<p>hola</p>")
+        await queue.stop()
+        await transport.aclose()
+        return queue.stats()
+
+    stats = asyncio.run(scenario())
+
+    assert [path for path, _payload in calls] == ["/emails/batch", "/emails", "/emails", "/emails"]
+    assert len(calls[0][1]) == 3
+    assert stats["split_batches"] == 1
+    assert stats["sent"] == 2
+    assert stats["failed"] == 1
+    assert stats["retries"] == 0
+
+
+def test_rate_limited_send_is_retried(resend_env):
+    responses = [httpx.Response(429, json={"message": "Too many requests"}), httpx.Response(200, json={"id": "x"})]
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url.path)
+        return responses.pop(0)
+
+    async def scenario():
+        transport = _resend_transport(handler)
+        queue = _queue(transport)
+        await queue._deliver([_message("a@example.com")])
+        await transport.aclose()
+        return queue.stats()
+
+    stats = asyncio.run(scenario())
+
+    assert calls == ["/emails", "/emails"]
+    assert stats["retries"] == 1
+    assert stats["sent"] == 1
+    assert stats["failed"] == 0
+
+
+def test_smtp_reuses_connection_and_reconnects_after_drop(smtp_env):
+    async def scenario():
+        server = FakeSmtpServer()
+        await server.start()
+        smtp_env.setenv("MAIL_PORT", str(server.port))
+        transport = MailTransport()
+        try:
+            await transport.send(_message("a@example.com"))
+            await transport.send(_message("b@example.com"))
+            connections_before_drop = server.connections
+
+            server.drop_connections()
+            await asyncio.sleep(0.05)
+            await transport.send(_message("c@example.com"))
+        finally:
+            await transport.aclose()
+            await server.stop()
+        return connections_before_drop, server
+
+    connections_before_drop, server = asyncio.run(scenario())
+
+    assert connections_before_drop == 1
+    assert server.connections == 2
+    assert len(server.messages) == 3
+    assert b"c@example.com" in server.messages[-1]
@@ -0,0 +1,196 @@
+import uuid
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event, select, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import sessionmaker
+
+from app.auth import get_current_user
+from app.database import get_db, get_read_db
+from app.expense_rollup import rebuild_rollup
+from app.models import User, UserRole
+from app.routers import admin, expenses
+
+# Regresion de planes para los indices de la migracion 3c5e8a1f7b24 (y los de las
+# particiones de 9c1e5a7d3f20). Sobre el Postgres de TEST_DATABASE_URL (ver conftest) se
+# siembra un volumen moderado, se llama a los handlers reales y se corre EXPLAIN sobre el SQL
+# que ejecutan: si un handler cambia su consulta, el test mide la nueva.
+SEED_SQL = (
+    """
+    INSERT INTO "user" (id, full_name, email, password_hash, role, email_verified, is_active, last_login_at)
+    SELECT gen_random_uuid(), 'Plan ' || n, 'plan' || n || '@example.com', 'x', 'user', true, true,
+           CASE WHEN n % 5 = 0 THEN NULL
+                ELSE now()::timestamp - make_interval(mins => (random() * 86400)::int) END
+    FROM generate_series(1, 5000) AS n
+    """,
+    """
+    INSERT INTO category (id, name)
+    SELECT gen_random_uuid(), 'Plan categoria ' || n
+    FROM generate_series(1, 20) AS n
+    """,
+    # Egresos y logs solo para 500 usuarios: el resto solo engrosa la tabla user.
+    """
+    CREATE TEMP TABLE plan_users AS
+    SELECT id, email FROM "user" WHERE email LIKE 'plan%' ORDER BY email LIMIT 500
+    """,
+    """
+    INSERT INTO expense (id, user_id, category_id, amount, expense_date, description)
+    SELECT gen_random_uuid(), u.id, c.id, round((random() * 100)::numeric, 2),
+           now()::timestamp - make_interval(hours => (random() * 8000)::int), 'plan'
+    FROM plan_users u CROSS JOIN category c CROSS JOIN generate_series(1, 3) AS n
+    """,
+    """
+    INSERT INTO access_log (id, user_id, event_type, attempt_email, created_at)
+    SELECT gen_random_uuid(), u.id,
+           ((ARRAY['LOGIN_SUCCESS', 'LOGIN_FAIL', 'LOGOUT'])[1 + n % 3])::access_event_type,
+           u.email, now()::timestamp - make_interval(mins => (random() * 86400)::int)
+    FROM plan_users u CROSS JOIN generate_series(1, 40) AS n
+    """,
+    """
+    INSERT INTO admin_audit_log (id, actor_user_id, target_user_id, action, details, created_at)
+    SELECT gen_random_uuid(), u.id, u.id,
+           (ARRAY['USER_CREATE', 'USER_UPDATE', 'USER_DELETE', 'ROLE_CHANGE'])[1 + n % 4],
+           'plan', now()::timestamp - make_interval(mins => (random() * 86400)::int)
+    FROM plan_users u CROSS JOIN generate_series(1, 40) AS n
+    """,
+)
+
+
+@pytest.fixture(scope="module")
+def plans(postgres_url):
+    engine = create_engine(postgres_url)
+    with engine.begin() as conn:
+        for statement in SEED_SQL:
+            conn.execute(text(statement))
+    test_session = sessionmaker(bind=engine)
+    with test_session() as db:
+        rebuild_rollup(db)
+        db.commit()
+        user = db.scalars(select(User).where(User.email == "plan250@example.com")).one()
+        db.expunge(user)
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+
+    statements: list[tuple[str, dict]] = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    def override_db():
+        db = test_session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    owner = User(id=uuid.uuid4(), full_name="Owner", email="owner@example.com", role=UserRole.owner)
+    app = FastAPI()
+    app.include_router(expenses.router)
+    app.include_router(admin.router)
+    app.dependency_overrides[get_db] = override_db
+    app.dependency_overrides[get_read_db] = override_db
+    app.dependency_overrides[get_current_user] = lambda: user
+    app.dependency_overrides[admin.verify_admin_token] = lambda: owner
+
+    with engine.connect() as conn:
+        yield SimpleNamespace(client=TestClient(app), conn=conn, user=user, statements=statements)
+    engine.dispose()
+
+
+def _handler_statement(plans, path: str, params: dict, marker: str) -> tuple[str, dict]:
+    # Llama al handler y devuelve la primera sentencia que ejecuto cuyo SQL contiene `marker`.
+    plans.statements.clear()
+    response = plans.client.get(path, params=params)
+    assert response.status_code == 200, response.text
+    matches = [captured for captured in plans.statements if marker in captured[0]]
+    assert matches, f"{path} no ejecuto ninguna sentencia con {marker!r}"
+    return matches[0]
+
+
+def _index_family(conn: Connection, index_name: str) -> set[str]:
+    # En tablas particionadas el plan nombra el indice de cada particion, no el del padre.
+    rows = conn.execute(
+        text(
+            """
+            WITH RECURSIVE family AS (
+                SELECT oid, relname FROM pg_class WHERE relname = :index_name
+                UNION ALL
+                SELECT child.oid, child.relname
+                FROM pg_inherits
+                JOIN family ON pg_inherits.inhparent = family.oid
+                JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            )
+            SELECT relname FROM family
+            """
+        ),
+        {"index_name": index_name},
+    ).scalars()
+    return set(rows)
+
+
+def _plan_indexes(conn: Connection, statement: str, parameters: dict) -> set[str]:
+    plan = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters).scalar()
+
+    found = set()
+    pending = [plan[0]["Plan"]]
+    while pending:
+        node = pending.pop()
+        if "Index Name" in node:
+            found.add(node["Index Name"])
+        pending.extend(node.get("Plans", []))
+    return found
+
+
+def _assert_uses_index(plans, captured: tuple[str, dict], *index_names: str):
+    expected = set().union(*(_index_family(plans.conn, name) for name in index_names))
+    assert expected, f"No existe ninguno de los indices {index_names}"
+    used = _plan_indexes(plans.conn, *captured)
+    assert used & expected, f"El plan no usa {index_names}; indices usados: {sorted(used) or '-'}"
+
+
+def test_expense_list_uses_user_date_index(plans):
+    captured = _handler_statement(plans, "/expenses/", {"limit": 50}, "FROM expense")
+    _assert_uses_index(plans, captured, "ix_expense_user_id_expense_date_id")
+
+
+def test_expense_stats_reads_rollup_by_user(plans):
+    captured = _handler_statement(plans, "/expenses/stats", {}, "FROM expense_monthly_rollup")
+    _assert_uses_index(plans, captured, "expense_monthly_rollup_pkey")
+
+
+def test_admin_audit_listing_uses_created_at_index(plans):
+    captured = _handler_statement(plans, "/admin/auditoria/admin", {}, "FROM admin_audit_log")
+    _assert_uses_index(plans, captured, "ix_admin_audit_log_created_at")
+
+
+def test_admin_audit_listing_by_action_uses_action_index(plans):
+    captured = _handler_statement(
+        plans, "/admin/auditoria/admin", {"action": "user_update"}, "FROM admin_audit_log"
+    )
+    _assert_uses_index(plans, captured, "ix_admin_audit_log_action_created_at")
+
+
+def test_user_access_log_listing_uses_user_index(plans):
+    captured = _handler_statement(
+        plans, f"/admin/auditoria/usuario/{plans.user.id}", {}, "FROM access_log"
+    )
+    _assert_uses_index(
+        plans,
+        captured,
+        "ix_access_log_user_id_created_at",
+        "ix_access_log_user_id_event_type_created_at",
+    )
+
+
+def test_user_listing_by_last_access_uses_last_login_index(plans):
+    captured = _handler_statement(
+        plans,
+        "/admin/",
+        {"sort": "last_access", "order": "desc", "page": 1, "page_size": 50},
+        "ORDER BY",
+    )
+    _assert_uses_index(plans, captured, "ix_user_last_login_at_id")
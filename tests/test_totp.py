@@ -0,0 +1,74 @@
+import base64
+
+import pytest
+
+from app.totp_utils import TotpVerifier, generate_totp_code, verify_totp_codes
+
+# RFC 6238, apendice B (HMAC-SHA1, periodo 30 s, 8 digitos, clave ASCII "12345678901234567890").
+RFC_SECRET = base64.b32encode(b"12345678901234567890").decode()
+RFC_VECTORS = [
+    (59, "94287082"),
+    (1111111109, "07081804"),
+    (1111111111, "14050471"),
+    (1234567890, "89005924"),
+    (2000000000, "69279037"),
+    (20000000000, "65353130"),
+]
+
+SECRET = "JBSWY3DPEHPK3PXP"
+# Inicio exacto del contador 600 con el periodo por defecto (60 s).
+PERIOD_START = 600 * 60
+
+
+@pytest.mark.parametrize(("timestamp", "expected"), RFC_VECTORS)
+def test_rfc6238_vectors(timestamp, expected):
+    verifier = TotpVerifier.from_secret(RFC_SECRET, period=30, digits=8, valid_window=0)
+
+    assert verifier.generate(timestamp) == expected
+    assert verifier.verify(expected, timestamp=timestamp)
+    assert generate_totp_code(RFC_SECRET, timestamp=timestamp, period=30, digits=8) == expected
+
+
+@pytest.mark.parametrize(
+    ("timestamp", "accepted"),
+    [
+        (PERIOD_START - 61, False),
+        (PERIOD_START - 60, True),
+        (PERIOD_START, True),
+        (PERIOD_START + 119, True),
+        (PERIOD_START + 120, False),
+    ],
+)
+def test_window_edges(timestamp, accepted):
+    verifier = TotpVerifier.from_secret(SECRET, valid_window=1)
+    code = verifier.generate(PERIOD_START)
+
+    assert verifier.verify(code, timestamp=timestamp) is accepted
+
+
+def test_zero_window_only_accepts_current_period():
+    verifier = TotpVerifier.from_secret(SECRET, valid_window=0)
+    code = verifier.generate(PERIOD_START)
+
+    assert verifier.verify(code, timestamp=PERIOD_START + 59)
+    assert not verifier.verify(code, timestamp=PERIOD_START + 60)
+    assert not verifier.verify(code, timestamp=PERIOD_START - 1)
+
+
+def test_verify_rejects_wrong_length_and_ignores_separators():
+    verifier = TotpVerifier.from_secret(SECRET)
+    code = verifier.generate(PERIOD_START)
+
+    assert verifier.verify(f"{code[:3]} {code[3:]}", timestamp=PERIOD_START)
+    assert not verifier.verify(code[:-1], timestamp=PERIOD_START)
+
+
+def test_batch_isolates_invalid_secrets():
+    code = TotpVerifier.from_secret(SECRET).generate(PERIOD_START)
+
+    results = verify_totp_codes(
+        [(SECRET, code), ("no-es-base32!", code), ("", code), (SECRET, "000000")],
+        timestamp=PERIOD_START,
+    )
+
+    assert results == [True, False, False, code == "000000"]